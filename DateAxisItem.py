@@ -5,6 +5,7 @@ Modified a bit.
 """
 import numpy as np
 import time
+from collections import OrderedDict
 from datetime import datetime
 from pyqtgraph import AxisItem
 
@@ -19,18 +20,68 @@ WEEK_SPACING = 7 * DAY_SPACING
 MONTH_SPACING = 30 * DAY_SPACING
 YEAR_SPACING = 365 * DAY_SPACING
 
+# Maximum number of formatted tick labels and computed tick sets kept.
+LABEL_CACHE_SIZE = 4096
+TICK_CACHE_SIZE = 64
+
+
+class LRUCache(OrderedDict):
+    """ A dictionary discarding the least recently used items once it holds
+    more than maxSize items """
+    def __init__(self, maxSize):
+        OrderedDict.__init__(self)
+        self.maxSize = maxSize
+
+    def get(self, key, default=None):
+        try:
+            value = OrderedDict.pop(self, key)
+        except KeyError:
+            return default
+        OrderedDict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self:
+            OrderedDict.__delitem__(self, key)
+        OrderedDict.__setitem__(self, key, value)
+        while len(self) > self.maxSize:
+            self.popitem(last=False)
+
+
+# Formatted labels keyed by (utc timestamp, format). Shared by all axes.
+_labelCache = LRUCache(LABEL_CACHE_SIZE)
+# Tick values keyed by the range, size and zoom levels of an axis. Linked
+# axes showing the same range share a single computation.
+_tickCache = LRUCache(TICK_CACHE_SIZE)
+
 
 def makeMSStepper(stepSize):
     def stepper(val, n):
         val *= 1000
         f = stepSize * 1000
         return (val // (n*f) + 1) * (n*f) / 1000.0
+
+    def ticks(minVal, maxVal, n):
+        # all ticks at once, computed in ms like the stepper
+        f = n * stepSize * 1000
+        first = (minVal * 1000 // f + 1) * f
+        count = max(int((maxVal * 1000 - first) // f) + 1, 0)
+        return (first + np.arange(count) * f) / 1000.0
+    stepper.ticks = ticks
     return stepper
 
 
 def makeSStepper(stepSize):
     def stepper(val, n):
         return (val // (n*stepSize) + 1) * (n*stepSize)
+
+    def ticks(minVal, maxVal, n):
+        # all ticks at once for fixed step sizes
+        f = n * stepSize
+        first = (minVal // f + 1) * f
+        count = max(int((maxVal - first) // f) + 1, 0)
+        return first + np.arange(count) * float(f)
+    stepper.ticks = ticks
     return stepper
 
 
@@ -62,7 +113,8 @@ class TickSpec:
         stepper       a stepper function that takes a utc time stamp and a step
                       steps number n to compute the start of the next unit. You
                       can use the make_X_stepper functions to create common
-                      steppers.
+                      steppers. Steppers with a fixed step size have a ticks
+                      attribute computing all ticks in a range at once.
         format        a strftime compatible format string which will be used to
                       convert tick locations to date/time strings
         autoSkip      list of step size multipliers to be applied when the tick
@@ -78,8 +130,10 @@ class TickSpec:
         self.autoSkip = autoSkip
 
     def makeTicks(self, minVal, maxVal, minSpc):
-        ticks = []
         n = self.skipFactor(minSpc)
+        if hasattr(self.step, 'ticks'):
+            return (self.step.ticks(minVal, maxVal, n), n)
+        ticks = []
         x = self.step(minVal, n)
         while x <= maxVal:
             ticks.append(x)
@@ -111,26 +165,28 @@ class ZoomLevel:
         self.tickSpecs = tickSpecs
         self.utcOffset = 0
 
-    def tickValues(self, minVal, maxVal, minSpc):
+    def tickValues(self, minVal, maxVal, minSpc, utcOffset=None):
         # return tick values for this format in the range minVal, maxVal
         # the return value is a list of tuples (<avg spacing>,
         # [tick positions]) minSpc indicates the minimum spacing (in seconds)
         # between two ticks to fullfill the maxTicksPerPt constraint of the
         # DateAxisItem at the current zoom level. This is used for auto
         # skipping ticks.
-        allTicks = []
+        if utcOffset is None:
+            utcOffset = self.utcOffset
+        allTicks = set()
         valueSpecs = []
         # back-project (minVal maxVal) to UTC, compute ticks then offset to
         # back to local time again
-        utcMin = minVal - self.utcOffset
-        utcMax = maxVal - self.utcOffset
+        utcMin = minVal - utcOffset
+        utcMax = maxVal - utcOffset
         for spec in self.tickSpecs:
             ticks, skipFactor = spec.makeTicks(utcMin, utcMax, minSpc)
             # reposition tick labels to local time coordinates
-            ticks += self.utcOffset
+            ticks += utcOffset
             # remove any ticks that were present in higher levels
             tick_list = [x for x in ticks.tolist() if x not in allTicks]
-            allTicks.extend(tick_list)
+            allTicks.update(tick_list)
             valueSpecs.append((spec.spacing, tick_list))
             # if we're skipping ticks on the current level there's no point in
             # producing lower level ticks
@@ -178,6 +234,9 @@ class DateAxisItem(AxisItem):
     the maximum number of seconds/point which are allowed for each ZoomLevel
     before the axis switches to the next coarser level.
 
+    Tick values are cached per range so linked axes compute them only once
+    and formatted labels are cached across all axes.
+
     """
 
     def __init__(self, orientation, utcOffset=None, **kvargs):
@@ -199,31 +258,55 @@ class DateAxisItem(AxisItem):
             3600*24*30 * self.maxTicksPerPt:  YEAR_MONTH_ZOOM_LEVEL
         }
 
+    @property
+    def zoomLevels(self):
+        return self._zoomLevels
+
+    @zoomLevels.setter
+    def zoomLevels(self, value):
+        self._zoomLevels = value
+        # sorted once instead of on every repaint
+        self._zoomLevelKeys = sorted(value.keys())
+        self._zoomLevelsId = tuple((k, id(value[k]))
+                                   for k in self._zoomLevelKeys)
+
     def tickStrings(self, values, scale, spacing):
         tickSpecs = self.zoomLevel.tickSpecs
         tickSpec = next((s for s in tickSpecs if s.spacing == spacing), None)
-        dates = [datetime.utcfromtimestamp(v - self.utcOffset) for v in values]
+        fmt = tickSpec.format
         formatStrings = []
-        for x in dates:
-            try:
-                if '%f' in tickSpec.format:
-                    # we only support ms precision
-                    formatStrings.append(x.strftime(tickSpec.format)[:-3])
-                else:
-                    formatStrings.append(x.strftime(tickSpec.format))
-            except ValueError:  # Windows can't handle dates before 1970
-                formatStrings.append('')
+        for v in values:
+            key = (v - self.utcOffset, fmt)
+            label = _labelCache.get(key)
+            if label is None:
+                try:
+                    label = datetime.utcfromtimestamp(key[0]).strftime(fmt)
+                    if '%f' in fmt:
+                        # we only support ms precision
+                        label = label[:-3]
+                except ValueError:  # Windows can't handle dates before 1970
+                    label = ''
+                _labelCache[key] = label
+            formatStrings.append(label)
         return formatStrings
 
     def tickValues(self, minVal, maxVal, size):
+        key = (minVal, maxVal, size, self.utcOffset, self.maxTicksPerPt,
+               self._zoomLevelsId)
+        cached = _tickCache.get(key)
+        if cached is not None:
+            self.zoomLevel = cached[0]
+            return cached[1]
         density = (maxVal - minVal) / size
         self.setZoomLevelForDensity(density)
         minSpacing = density / self.maxTicksPerPt
-        values = self.zoomLevel.tickValues(minVal, maxVal, minSpc=minSpacing)
+        values = self.zoomLevel.tickValues(minVal, maxVal, minSpc=minSpacing,
+                                           utcOffset=self.utcOffset)
+        _tickCache[key] = (self.zoomLevel, values)
         return values
 
     def setZoomLevelForDensity(self, density):
-        keys = sorted(self.zoomLevels.keys())
+        keys = self._zoomLevelKeys
         key = next((k for k in keys if density < k), keys[-1])
         self.zoomLevel = self.zoomLevels[key]
         self.zoomLevel.utcOffset = self.utcOffset
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Columnar table of the attributes of all waveforms of an ASDF file.
+
+Querying a file with ``ASDFDataSet.ifilter()`` opens every waveform data set
+and reads its attributes for every query. Here the attributes are read once
+into one array per column and queries are evaluated for all waveforms at
+once: a condition is matched against the few distinct values of a column and
+mapped back to the rows with their integer codes, so a query costs the same
+for a handful of waveforms and for millions of them.
+
+Queries are written like the ones of pyasdf::
+
+    table.select(q.station == ["ANMO", "B*"], q.channel == ["*Z", "*N"],
+                 q.event == event)
+
+The table of a file is stored in the cache directory and rebuilt whenever
+the file changes.
+
+Does not depend on Qt so it can run in background threads.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import fnmatch
+import hashlib
+import os
+
+import numpy as np
+from obspy.core import UTCDateTime
+
+from ui_loader import get_cache_directory
+
+__all__ = ["q", "AttributeTable", "build_table", "get_table",
+           "get_table_filename"]
+
+STRING_COLUMNS = ("network", "station", "location", "channel", "tag",
+                  "event", "origin", "magnitude", "focal_mechanism")
+TIME_COLUMNS = ("starttime", "endtime")
+# Data set attributes with the resource ids of a waveform. A waveform can be
+# associated with several objects of each kind.
+ID_ATTRIBUTES = {"event": "event_id", "origin": "origin_id",
+                 "magnitude": "magnitude_id",
+                 "focal_mechanism": "focal_mechanism_id"}
+# Increase whenever the stored table changes.
+TABLE_VERSION = 1
+
+
+def _to_str(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return str(value)
+
+
+def _to_resource_id(value):
+    """
+    Resource id string of an event, origin, ... or a resource identifier.
+    """
+    if hasattr(value, "resource_id"):
+        value = value.resource_id
+    return _to_str(getattr(value, "id", value))
+
+
+class Condition(object):
+    def __init__(self, column, operator, value):
+        self.column = column
+        self.operator = operator
+        self.value = value
+
+    def evaluate(self, table):
+        """
+        Returns a boolean array of the matching rows of a table.
+        """
+        if self.column in TIME_COLUMNS:
+            values = table.columns[self.column]
+            other = UTCDateTime(self.value).timestamp
+            return {"==": np.equal, "!=": np.not_equal, "<": np.less,
+                    "<=": np.less_equal, ">": np.greater,
+                    ">=": np.greater_equal}[self.operator](values, other)
+
+        if self.operator not in ("==", "!="):
+            raise ValueError("Only '==' and '!=' are supported for %s." %
+                             self.column)
+        values = self.value
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        if self.column in ID_ATTRIBUTES:
+            values = [_to_resource_id(_i) for _i in values]
+        else:
+            values = [_to_str(_i) for _i in values]
+
+        uniques, codes = table.get_codes(self.column)
+        matching = np.zeros(len(uniques), dtype=bool)
+        for value in values:
+            if any(_i in value for _i in "*?["):
+                matching |= np.array([fnmatch.fnmatchcase(_i, value)
+                                      for _i in uniques], dtype=bool)
+            else:
+                matching |= uniques == value
+        mask = matching[codes]
+        return mask if self.operator == "==" else ~mask
+
+
+class Column(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return Condition(self.name, "==", other)
+
+    def __ne__(self, other):
+        return Condition(self.name, "!=", other)
+
+    def __lt__(self, other):
+        return Condition(self.name, "<", other)
+
+    def __le__(self, other):
+        return Condition(self.name, "<=", other)
+
+    def __gt__(self, other):
+        return Condition(self.name, ">", other)
+
+    def __ge__(self, other):
+        return Condition(self.name, ">=", other)
+
+    __hash__ = None
+
+
+class Query(object):
+    """
+    Creates query conditions from attribute access, e.g. ``q.station``.
+    """
+    def __getattr__(self, name):
+        if name not in STRING_COLUMNS + TIME_COLUMNS:
+            raise AttributeError("Unknown query key: %s" % name)
+        return Column(name)
+
+
+q = Query()
+
+
+class AttributeTable(object):
+    """
+    Attributes of all waveforms of a file, one row per waveform and
+    associated event, origin, ... combination.
+
+    :param columns: Dictionary of one array per column in
+        ``STRING_COLUMNS`` and ``TIME_COLUMNS``.
+    :param full_ids: Array of the full ASDF waveform name of each row.
+    """
+    def __init__(self, columns, full_ids):
+        self.columns = columns
+        self.full_ids = full_ids
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.full_ids)
+
+    def get_codes(self, column):
+        """
+        Returns the distinct values of a column and the index into them of
+        every row.
+        """
+        if column not in self._codes:
+            self._codes[column] = np.unique(self.columns[column],
+                                            return_inverse=True)
+        return self._codes[column]
+
+    def select(self, *conditions):
+        """
+        Returns the full ASDF names of all waveforms matching all conditions
+        in the order of the file.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for condition in conditions:
+            mask &= condition.evaluate(self)
+        # Waveforms with several matching events are only returned once.
+        indices = np.flatnonzero(mask)
+        indices = indices[np.concatenate(
+            [[True], self.full_ids[indices[1:]] !=
+             self.full_ids[indices[:-1]]])] if len(indices) else indices
+        return [str(_i) for _i in self.full_ids[indices]]
+
+    def save(self, fh, mtime, size):
+        arrays = dict(("column_" + _k, _v)
+                      for _k, _v in self.columns.items())
+        np.savez(fh, full_ids=self.full_ids, mtime=mtime, size=size,
+                 version=TABLE_VERSION, **arrays)
+
+    @classmethod
+    def load(cls, filename, mtime, size):
+        """
+        Loads a stored table or returns None if it does not belong to a file
+        with the given modification time and size.
+        """
+        with np.load(filename) as f:
+            if int(f["version"]) != TABLE_VERSION or \
+                    float(f["mtime"]) != mtime or int(f["size"]) != size:
+                return None
+            columns = dict((_k[len("column_"):], f[_k]) for _k in f.files
+                           if _k.startswith("column_"))
+            return cls(columns, f["full_ids"])
+
+
+def build_table(ds, progress_callback=None):
+    """
+    Reads the attributes of all waveforms of an ``ASDFDataSet``.
+
+    :param progress_callback: Called with the number of processed and of
+        all stations. Building is canceled if it returns False, in which
+        case None is returned.
+    """
+    rows = dict((_k, []) for _k in STRING_COLUMNS + TIME_COLUMNS)
+    full_ids = []
+    waveform_group = ds._waveform_group
+    stations = sorted(waveform_group.keys())
+    for _i, station in enumerate(stations):
+        if progress_callback is not None and \
+                progress_callback(_i, len(stations)) is False:
+            return None
+        for name, dset in sorted(waveform_group[station].items()):
+            if name == "StationXML":
+                continue
+            seed_id, _, _, tag = name.split("__")
+            network, sta, location, channel = seed_id.split(".")
+            attrs = dset.attrs
+            starttime = attrs["starttime"] / 1.0E9
+            endtime = starttime + \
+                (dset.shape[0] - 1) / float(attrs["sampling_rate"])
+
+            ids = {}
+            for column, attribute in ID_ATTRIBUTES.items():
+                value = attrs.get(attribute)
+                ids[column] = _to_str(value).split(",") if value else [""]
+            # One row per combination of associated ids, usually just one.
+            for event in ids["event"]:
+                for origin in ids["origin"]:
+                    for magnitude in ids["magnitude"]:
+                        for focal_mechanism in ids["focal_mechanism"]:
+                            for column, value in (
+                                    ("network", network), ("station", sta),
+                                    ("location", location),
+                                    ("channel", channel), ("tag", tag),
+                                    ("event", event), ("origin", origin),
+                                    ("magnitude", magnitude),
+                                    ("focal_mechanism", focal_mechanism),
+                                    ("starttime", starttime),
+                                    ("endtime", endtime)):
+                                rows[column].append(value)
+                            full_ids.append(name)
+    if progress_callback is not None:
+        progress_callback(len(stations), len(stations))
+
+    columns = dict((_k, np.array(rows[_k], dtype=np.str_))
+                   for _k in STRING_COLUMNS)
+    for _k in TIME_COLUMNS:
+        columns[_k] = np.array(rows[_k], dtype=np.float64)
+    return AttributeTable(columns, np.array(full_ids, dtype=np.str_))
+
+
+def get_table_filename(asdf_filename):
+    key = hashlib.md5(os.path.abspath(asdf_filename).encode(
+        "utf-8")).hexdigest()
+    return os.path.join(get_cache_directory(), "attributes", key + ".npz")
+
+
+def get_table(ds, asdf_filename, progress_callback=None):
+    """
+    Returns the attribute table of a file, building and storing it if it
+    has not been stored since the file last changed. Returns None if
+    building is canceled.
+    """
+    mtime = os.path.getmtime(asdf_filename)
+    size = os.path.getsize(asdf_filename)
+    table_filename = get_table_filename(asdf_filename)
+    if os.path.exists(table_filename):
+        try:
+            table = AttributeTable.load(table_filename, mtime, size)
+        except Exception:
+            table = None
+        if table is not None:
+            return table
+
+    table = build_table(ds, progress_callback=progress_callback)
+    if table is None:
+        return None
+    try:
+        directory = os.path.dirname(table_filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # Write to a file object so numpy does not append another suffix.
+        with open(table_filename, "wb") as fh:
+            table.save(fh, mtime, size)
+    except (IOError, OSError):
+        pass
+    return table
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On-demand listing of the auxiliary data hierarchy.
+
+Files with many auxiliary data items (e.g. cross correlations or PSDs of
+noise data sets) cannot be walked completely when opening them. These
+functions work directly on the HDF5 groups and only ever list one batch of
+the children of a single group. Numbers of children are taken from the group
+info and thus do not require iterating over the children.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import h5py
+
+__all__ = ["list_data_types", "list_children"]
+
+# Number of children listed at once.
+BATCH_SIZE = 500
+
+
+def _get_group(ds, path):
+    group = ds._auxiliary_data_group
+    if path:
+        group = group["/".join(path)]
+    return group
+
+
+def _describe(group, name):
+    """
+    Returns ``(name, number_of_children)`` with None as the number of children
+    for data sets.
+    """
+    if group.get(name, getclass=True) is h5py.Group:
+        return (name, len(group[name]))
+    return (name, None)
+
+
+def list_data_types(ds):
+    """
+    Lists the top level auxiliary data types.
+
+    Returns a list of ``(name, number_of_children)`` tuples.
+    """
+    group = _get_group(ds, [])
+    return [_describe(group, name) for name in sorted(group.keys())]
+
+
+def list_children(ds, path, start=0, count=BATCH_SIZE):
+    """
+    Lists at most ``count`` children of the auxiliary data group at the given
+    path, starting with the child at index ``start``.
+
+    Uses the HDF5 link iteration so only the requested links are visited.
+
+    :param path: List of group names, e.g. ``["CrossCorrelation", "AU"]``.
+    :returns: Tuple of a list of ``(name, number_of_children)`` tuples with
+        None as the number of children for data items and the total number
+        of children of the group.
+    """
+    group = _get_group(ds, path)
+    total = len(group)
+
+    names = []
+
+    def _collect(name):
+        names.append(name.decode() if isinstance(name, bytes) else name)
+        if len(names) >= count:
+            # Returning anything but None stops the iteration.
+            return True
+
+    if start < total:
+        group.id.links.iterate(_collect, idx=start)
+
+    return [_describe(group, name) for name in names], total
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reduced resolution reads of large auxiliary data arrays.
+
+Auxiliary data arrays can be much larger than the available memory. Only as
+many samples as can be displayed are read: one dimensional arrays are reduced
+to a min/max envelope while reading them in blocks and two dimensional arrays
+are read with a stride matching the size of the viewport.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+
+__all__ = ["read_strided_1d", "read_envelope_1d", "read_strided_2d"]
+
+# Maximum number of samples read from the file at once.
+BLOCK_SIZE = 2 ** 22
+
+
+def _clip_range(start, stop, length):
+    start = int(max(0, min(np.floor(start), length)))
+    stop = int(max(start, min(np.ceil(stop), length)))
+    return start, stop
+
+
+def read_strided_1d(dset, start, stop, n):
+    """
+    Reads at most about ``n`` equally spaced samples of a one dimensional
+    data set between the sample indices ``start`` and ``stop``. A cheap
+    preview, peaks between the samples are missed.
+
+    :returns: The x values (sample indices) and the corresponding values.
+    """
+    start, stop = _clip_range(start, stop, dset.shape[0])
+    step = max(int(np.ceil((stop - start) / max(int(n), 1))), 1)
+    y = dset[start:stop:step]
+    return start + np.arange(len(y), dtype=np.float64) * step, y
+
+
+def read_envelope_1d(dset, start, stop, n_bins):
+    """
+    Reads the part of a one dimensional data set between the sample indices
+    ``start`` and ``stop``.
+
+    If the range has more than ``2 * n_bins`` samples it is reduced to the
+    minimum and maximum of each of ``n_bins`` bins, otherwise it is read
+    completely. The data is read in blocks so memory usage is independent of
+    the size of the range.
+
+    :returns: The x values (sample indices) and the corresponding values.
+    """
+    start, stop = _clip_range(start, stop, dset.shape[0])
+    n_bins = max(int(n_bins), 1)
+    npts = stop - start
+
+    if npts <= 2 * n_bins:
+        return np.arange(start, stop, dtype=np.float64), dset[start:stop]
+
+    bin_size = int(np.ceil(npts / n_bins))
+    n_bins = int(np.ceil(npts / bin_size))
+    # Read full bins per block.
+    bins_per_block = max(BLOCK_SIZE // bin_size, 1)
+
+    mins = np.empty(n_bins, dtype=dset.dtype)
+    maxs = np.empty(n_bins, dtype=dset.dtype)
+    for first_bin in range(0, n_bins, bins_per_block):
+        last_bin = min(first_bin + bins_per_block, n_bins)
+        block = dset[start + first_bin * bin_size:
+                     min(start + last_bin * bin_size, stop)]
+        # Pad the last, possibly incomplete bin with its last value.
+        n = last_bin - first_bin
+        if len(block) != n * bin_size:
+            block = np.concatenate([
+                block, np.repeat(block[-1:], n * bin_size - len(block))])
+        block = block.reshape(n, bin_size)
+        mins[first_bin:last_bin] = block.min(axis=1)
+        maxs[first_bin:last_bin] = block.max(axis=1)
+
+    # Interleave minima and maxima so a line plot draws the envelope.
+    x = start + np.arange(n_bins, dtype=np.float64) * bin_size
+    x = np.repeat(x, 2)
+    x[1::2] += bin_size / 2.0
+    y = np.empty(2 * n_bins, dtype=dset.dtype)
+    y[0::2] = mins
+    y[1::2] = maxs
+    return x, y
+
+
+def read_strided_2d(dset, x_range, y_range, shape):
+    """
+    Reads the part of a two dimensional data set inside the given index
+    ranges with a stride so the result has at most about the given shape.
+
+    The first axis of the data set is x, the second one is y.
+
+    :param x_range: ``(start, stop)`` sample indices along the first axis.
+    :param y_range: ``(start, stop)`` sample indices along the second axis.
+    :param shape: ``(nx, ny)`` maximum number of samples to read per axis,
+        usually the size of the viewport in pixels.
+    :returns: The data and the ``(x, y, width, height)`` rectangle it covers
+        in sample coordinates.
+    """
+    x0, x1 = _clip_range(x_range[0], x_range[1], dset.shape[0])
+    y0, y1 = _clip_range(y_range[0], y_range[1], dset.shape[1])
+    if x1 == x0 or y1 == y0:
+        return None, (x0, y0, 0, 0)
+
+    sx = max(int(np.ceil((x1 - x0) / max(shape[0], 1))), 1)
+    sy = max(int(np.ceil((y1 - y0) / max(shape[1], 1))), 1)
+    data = dset[x0:x1:sx, y0:y1:sy]
+    # Each read sample represents a stride wide cell.
+    return data, (x0, y0, data.shape[0] * sx, data.shape[1] * sy)
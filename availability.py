@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Data availability computed from the start and end times of the waveform
+index.
+
+All operations are vectorized over the whole index: the segments of all
+channels are merged into coverage intervals in a single pass, and the
+coverage image is computed from cumulative covered time so it costs the
+same for a few segments and for years of them.
+
+Does not depend on Qt so it can run in background threads.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+import numpy as np
+
+__all__ = ["merge_intervals", "get_gaps", "get_coverage", "Availability",
+           "get_availability"]
+
+# The waveform index stores whole seconds so consecutive segments can appear
+# to be up to one second apart.
+DEFAULT_TOLERANCE = 1.0
+
+
+def merge_intervals(groups, starts, ends, tolerance=0.0):
+    """
+    Merges overlapping or touching intervals of each group.
+
+    :param groups: Integer group (e.g. channel) of each interval.
+    :param starts: Start of each interval.
+    :param ends: End of each interval.
+    :param tolerance: Intervals less than this apart are merged.
+    :returns: ``(groups, starts, ends)`` of the merged intervals, sorted by
+        group and start.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    if not len(starts):
+        return groups, starts, ends
+
+    # Intervals are sorted by group and start with a single argsort of a
+    # combined key. Offsetting every group by more than the total time span
+    # also makes a single accumulate suffice for the running maximum of the
+    # ends within each group.
+    t0 = min(starts.min(), ends.min())
+    span = max(starts.max(), ends.max()) - t0 + tolerance + 1.0
+    offset = (groups - groups.min()) * span
+    key = starts - t0 + offset
+    # Indices are usually already sorted.
+    if np.any(key[1:] < key[:-1]):
+        order = np.argsort(key)
+        groups, starts, ends = groups[order], starts[order], ends[order]
+        offset = offset[order]
+    running_end = np.maximum.accumulate(ends - t0 + offset) - offset + t0
+
+    new = np.empty(len(starts), dtype=bool)
+    new[0] = True
+    new[1:] = (groups[1:] != groups[:-1]) | \
+        (starts[1:] > running_end[:-1] + tolerance)
+    first = np.flatnonzero(new)
+    last = np.append(first[1:] - 1, len(starts) - 1)
+    return groups[first], starts[first], running_end[last]
+
+
+def get_gaps(groups, starts, ends):
+    """
+    Returns ``(groups, starts, ends)`` of the gaps between merged intervals
+    as returned by :func:`merge_intervals`.
+    """
+    same = groups[1:] == groups[:-1]
+    return groups[1:][same], ends[:-1][same], starts[1:][same]
+
+
+def get_coverage(starts, ends, edges):
+    """
+    Fraction of each bin between consecutive edges covered by disjoint,
+    sorted intervals.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    if not len(starts):
+        return np.zeros(len(edges) - 1)
+    lengths = ends - starts
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    # Index of the last interval starting before each edge.
+    idx = np.searchsorted(starts, edges, side="right") - 1
+    valid = idx >= 0
+    idx = np.maximum(idx, 0)
+    covered = np.where(
+        valid, cumulative[idx] + np.clip(edges - starts[idx], 0.0,
+                                         lengths[idx]), 0.0)
+    return np.diff(covered) / np.diff(edges)
+
+
+class Availability(object):
+    """
+    Merged coverage of a number of channels.
+
+    :param channels: List of ``(NET.STA.LOC.CHA, tag)`` tuples, one per row.
+    :param groups: Index into ``channels`` of each segment.
+    :param starts: Start timestamp of each segment.
+    :param ends: End timestamp of each segment.
+    """
+    def __init__(self, channels, groups, starts, ends,
+                 tolerance=DEFAULT_TOLERANCE):
+        self.channels = list(channels)
+        self.segment_count = len(starts)
+        self.groups, self.starts, self.ends = merge_intervals(
+            groups, starts, ends, tolerance=tolerance)
+        self.gap_count = len(get_gaps(self.groups, self.starts,
+                                      self.ends)[0])
+        # Merged intervals of each row are contiguous.
+        self._bounds = np.searchsorted(self.groups,
+                                       np.arange(len(self.channels) + 1))
+
+    @property
+    def starttime(self):
+        return self.starts.min() if len(self.starts) else None
+
+    @property
+    def endtime(self):
+        return self.ends.max() if len(self.ends) else None
+
+    def save(self, filename):
+        np.savez(filename, channels=np.array(self.channels).reshape(-1, 2),
+                 groups=self.groups, starts=self.starts, ends=self.ends,
+                 segment_count=self.segment_count)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            availability = cls([tuple(str(_j) for _j in _i)
+                                for _i in f["channels"]],
+                               f["groups"], f["starts"], f["ends"])
+            availability.segment_count = int(f["segment_count"])
+        return availability
+
+    def get_intervals(self, row):
+        """
+        Returns the merged ``(starts, ends)`` of a row.
+        """
+        i0, i1 = self._bounds[row], self._bounds[row + 1]
+        return self.starts[i0:i1], self.ends[i0:i1]
+
+    def get_image(self, starttime, endtime, width):
+        """
+        Returns the covered fraction of each of ``width`` bins between the
+        two timestamps as an array of shape ``(rows, width)``.
+        """
+        edges = np.linspace(starttime, endtime, width + 1)
+        image = np.empty((len(self.channels), width))
+        for row in range(len(self.channels)):
+            image[row] = get_coverage(*self.get_intervals(row), edges=edges)
+        return image
+
+    def is_covered(self, row, time):
+        starts, ends = self.get_intervals(row)
+        idx = np.searchsorted(starts, time, side="right") - 1
+        return idx >= 0 and time <= ends[idx]
+
+
+def get_availability(query_fct, source_filename, cache_filename):
+    """
+    Returns the availability of the intervals returned by ``query_fct``.
+
+    Fetching millions of rows from an index takes much longer than merging
+    them so the merged intervals are cached in ``cache_filename`` until the
+    index ``source_filename`` changes.
+    """
+    if os.path.exists(cache_filename) and \
+            os.path.getmtime(cache_filename) >= \
+            os.path.getmtime(source_filename):
+        try:
+            return Availability.load(cache_filename)
+        except Exception:
+            pass
+    availability = Availability(*query_fct())
+    try:
+        # Write to a file object so numpy does not append another suffix.
+        with open(cache_filename, "wb") as fh:
+            availability.save(fh)
+    except (IOError, OSError):
+        pass
+    return availability
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch extraction of time windows from continuous data of an ASDF file.
+
+Does the same as extracting a time interval in the GUI, but for many
+stations and windows at once, in parallel and without a display. The
+waveform indices of the stations are created if they do not exist yet and
+every window of every station is then cut out in a pool of processes and
+written as MiniSEED or NPZ.
+
+Usage:
+
+    $ python batch_extract.py data.h5 --station "AU.*" --channel "BH?" \\
+        --tag raw_recording --windows windows.txt --format MSEED \\
+        --output-dir cutouts
+
+The windows file contains one window per line as two times understood by
+``obspy.UTCDateTime``, e.g. ``2015-01-01T00:00:00 2015-01-01T01:00:00``.
+Single windows can also be given with ``--window START END``.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import fnmatch
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+from obspy.core import UTCDateTime
+
+import waveform_index
+from stream_assembler import assemble_window, parse_full_id
+from waveform_mmap import WaveformMapping
+
+__all__ = ["extract_window", "write_stream", "batch_extract"]
+
+FORMATS = {"MSEED": "mseed", "NPZ": "npz"}
+
+# Data set and memory mapping of the file in each worker process.
+_WORKER_STATE = {}
+
+
+def extract_window(ds, asdf_filename, station, channels, tag, starttime,
+                   endtime, mapping=None):
+    """
+    Extracts a window of all channels of a station matching any of the
+    channel patterns.
+
+    :param station: The station, e.g. ``"AU.ARMA"``.
+    :param channels: List of channel code patterns, e.g. ``["BH?"]``.
+    :param starttime: Start of the window as a UTCDateTime.
+    :param endtime: End of the window as a UTCDateTime.
+    :returns: The Stream, gaps are masked.
+    """
+    query = waveform_index.interval_query(starttime.timestamp,
+                                          endtime.timestamp, tag)
+    full_ids = waveform_index.query_full_ids(
+        waveform_index.get_index_filename(asdf_filename, station), query)
+    waveforms = [
+        (station, full_id) for full_id in full_ids
+        if any(fnmatch.fnmatch(parse_full_id(full_id)[0].split(".")[-1],
+                               pattern) for pattern in channels)]
+    return assemble_window(ds, waveforms, starttime, endtime,
+                           mapping=mapping)
+
+
+def write_stream(st, filename, format):
+    """
+    Writes a stream as MiniSEED, split at gaps, or as NPZ. The NPZ file
+    contains the arrays ``<id>.data``, ``<id>.mask`` (only for traces with
+    gaps), ``<id>.starttime`` in nanoseconds and ``<id>.sampling_rate``.
+    """
+    if format == "MSEED":
+        st = st.split()
+        for tr in st:
+            # MiniSEED is written in native byte order.
+            tr.data = np.require(tr.data, tr.data.dtype.newbyteorder("="))
+        st.write(filename, format="MSEED")
+        return
+
+    arrays = {}
+    for tr in st:
+        arrays[tr.id + ".data"] = np.ma.getdata(tr.data)
+        if np.ma.isMaskedArray(tr.data):
+            arrays[tr.id + ".mask"] = np.ma.getmaskarray(tr.data)
+        arrays[tr.id + ".starttime"] = np.int64(tr.stats.starttime.ns)
+        arrays[tr.id + ".sampling_rate"] = np.float64(
+            tr.stats.sampling_rate)
+    np.savez(filename, **arrays)
+
+
+def _init_worker(asdf_filename):
+    import pyasdf
+    _WORKER_STATE["ds"] = pyasdf.ASDFDataSet(asdf_filename, mode="r")
+    _WORKER_STATE["mapping"] = WaveformMapping(asdf_filename)
+    _WORKER_STATE["filename"] = asdf_filename
+
+
+def _build_index(station):
+    waveform_index.build_index(
+        _WORKER_STATE["ds"], station, waveform_index.get_index_filename(
+            _WORKER_STATE["filename"], station))
+    return station
+
+
+def _extract_task(task):
+    station, channels, tag, starttime, endtime, format, output_dir = task
+    starttime = UTCDateTime(starttime)
+    endtime = UTCDateTime(endtime)
+    st = extract_window(_WORKER_STATE["ds"], _WORKER_STATE["filename"],
+                        station, channels, tag, starttime, endtime,
+                        mapping=_WORKER_STATE["mapping"])
+    if not st:
+        return None, 0
+    filename = os.path.join(output_dir, "%s__%s__%s__%s.%s" % (
+        station, starttime.strftime("%Y-%m-%dT%H-%M-%S"),
+        endtime.strftime("%Y-%m-%dT%H-%M-%S"), tag, FORMATS[format]))
+    write_stream(st, filename, format)
+    return filename, len(st)
+
+
+def batch_extract(asdf_filename, stations, channels, tag, windows,
+                  output_dir, format="MSEED", processes=None):
+    """
+    Extracts all windows of all stations matching the station patterns.
+
+    :param stations: List of ``NET.STA`` patterns.
+    :param channels: List of channel code patterns.
+    :param windows: List of ``(starttime, endtime)`` tuples.
+    :param processes: Number of processes, defaults to the number of CPUs.
+    :returns: List of ``(filename, number of traces)`` tuples of the
+        written files.
+    """
+    import pyasdf
+
+    ds = pyasdf.ASDFDataSet(asdf_filename, mode="r")
+    selected = sorted(
+        sta for sta in ds.waveforms.list()
+        if any(fnmatch.fnmatch(sta, pattern) for pattern in stations))
+    del ds
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    tasks = [(sta, channels, tag, UTCDateTime(start).timestamp,
+              UTCDateTime(end).timestamp, format, output_dir)
+             for sta in selected for start, end in windows]
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(asdf_filename,))
+    try:
+        # Indices that already exist are reused.
+        pool.map(_build_index, [
+            sta for sta in selected if not os.path.exists(
+                waveform_index.get_index_filename(asdf_filename, sta))])
+        chunksize = max(1, len(tasks) // (4 * (processes or
+                                               multiprocessing.cpu_count())))
+        results = [_i for _i in pool.imap_unordered(
+            _extract_task, tasks, chunksize=chunksize) if _i[0]]
+    finally:
+        pool.close()
+        pool.join()
+    return sorted(results)
+
+
+def read_windows(filename):
+    windows = []
+    with open(filename, "r") as fh:
+        for line in fh:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            start, end = line.split()[:2]
+            windows.append((UTCDateTime(start), UTCDateTime(end)))
+    return windows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("filename", type=str, help="The ASDF file.")
+    parser.add_argument("--station", type=str, action="append",
+                        help="NET.STA pattern, can be given multiple times. "
+                             "Defaults to all stations.")
+    parser.add_argument("--channel", type=str, action="append",
+                        help="Channel code pattern, can be given multiple "
+                             "times. Defaults to all channels.")
+    parser.add_argument("--tag", type=str, default="raw_recording",
+                        help="Waveform tag.")
+    parser.add_argument("--window", type=str, nargs=2, action="append",
+                        default=[], metavar=("START", "END"),
+                        help="Time window, can be given multiple times.")
+    parser.add_argument("--windows", type=str, default=None,
+                        help="File with one time window per line.")
+    parser.add_argument("--format", type=str, default="MSEED",
+                        choices=sorted(FORMATS.keys()),
+                        help="Output format.")
+    parser.add_argument("--output-dir", type=str, default=".",
+                        help="Directory of the extracted files.")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of processes. Defaults to the number of "
+                             "CPUs.")
+    args = parser.parse_args(argv)
+
+    windows = [(UTCDateTime(start), UTCDateTime(end))
+               for start, end in args.window]
+    if args.windows:
+        windows.extend(read_windows(args.windows))
+    if not windows:
+        parser.error("No time windows given.")
+
+    a = time.time()
+    results = batch_extract(
+        args.filename, args.station or ["*"], args.channel or ["*"],
+        args.tag, windows, args.output_dir, format=args.format,
+        processes=args.processes)
+    for filename, n_traces in results:
+        print("%s (%i traces)" % (filename, n_traces))
+    print("Extracted %i files in %.2f seconds." % (len(results),
+                                                   time.time() - a))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the data paths of the main window.
+
+Generates a synthetic ASDF file with continuous data of a number of stations,
+events with event waveforms and auxiliary data arrays, loads it into the main
+window and times building the waveform index, querying and extracting
+intervals, plotting waveforms, building the station and event views and
+plotting the waveforms of an event.
+
+Usage:
+
+    $ python benchmarks/data_path_benchmark.py --stations 20 --segments 24 \\
+        --output data_paths.json
+
+The window is never shown. Qt 5 builds run on the offscreen platform, with
+PyQt4 run it with ``xvfb-run`` on headless machines.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIRECTORY)
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np  # NOQA
+from obspy.core import Trace, UTCDateTime  # NOQA
+from obspy.core.event import Catalog, Event, Magnitude, Origin  # NOQA
+from obspy.core.inventory import Channel, Inventory, Network, Station  # NOQA
+from PyQt4 import QtCore, QtGui  # NOQA
+
+STARTTIME = UTCDateTime(2015, 1, 1)
+CHANNELS = ["BHZ", "BHN", "BHE"]
+CONTINUOUS_TAG = "raw_recording"
+EVENT_TAG = "event_recording"
+# Length of the event waveforms in seconds.
+EVENT_WAVEFORM_LENGTH = 600.0
+# Phases of loading a file that must have finished before timing anything.
+OPEN_PHASES = set(["open", "map", "stations", "events", "provenance",
+                   "auxiliary data"])
+
+
+def generate_file(filename, n_stations, n_segments, segment_length,
+                  sampling_rate, n_events, n_auxiliary, auxiliary_size,
+                  compression=None, seed=12345):
+    """
+    Writes a synthetic ASDF file.
+
+    Every station has three channels with ``n_segments`` contiguous segments
+    of continuous data each, as well as a short waveform per event.
+    """
+    import pyasdf
+
+    rng = np.random.RandomState(seed)
+    duration = n_segments * segment_length
+
+    ds = pyasdf.ASDFDataSet(filename, mode="w", compression=compression)
+
+    events = []
+    for _i in range(n_events):
+        origin = Origin(
+            time=STARTTIME + (_i + 0.5) * duration / n_events,
+            latitude=rng.uniform(-40.0, -10.0),
+            longitude=rng.uniform(115.0, 150.0),
+            depth=rng.uniform(5.0, 300.0) * 1000.0)
+        event = Event(origins=[origin],
+                      magnitudes=[Magnitude(mag=rng.uniform(4.0, 7.0))])
+        event.preferred_origin_id = origin.resource_id.id
+        events.append(event)
+    ds.add_quakeml(Catalog(events=events))
+
+    for _i in range(n_stations):
+        code = "S%03i" % _i
+        latitude = rng.uniform(-40.0, -10.0)
+        longitude = rng.uniform(115.0, 150.0)
+        channels = [Channel(code=cha, location_code="", latitude=latitude,
+                            longitude=longitude, elevation=0.0, depth=0.0,
+                            sample_rate=sampling_rate)
+                    for cha in CHANNELS]
+        ds.add_stationxml(Inventory(networks=[Network(
+            code="XX", stations=[Station(
+                code=code, latitude=latitude, longitude=longitude,
+                elevation=0.0, channels=channels)])], source="benchmark"))
+
+        header = {"network": "XX", "station": code,
+                  "sampling_rate": sampling_rate}
+        npts = int(segment_length * sampling_rate)
+        for _j in range(n_segments):
+            for cha in CHANNELS:
+                header.update(channel=cha,
+                              starttime=STARTTIME + _j * segment_length)
+                ds.add_waveforms(
+                    Trace(data=rng.randn(npts).astype(np.float32),
+                          header=header), tag=CONTINUOUS_TAG)
+
+        npts = int(EVENT_WAVEFORM_LENGTH * sampling_rate)
+        for event in events:
+            for cha in CHANNELS:
+                header.update(channel=cha,
+                              starttime=event.origins[0].time)
+                ds.add_waveforms(
+                    Trace(data=rng.randn(npts).astype(np.float32),
+                          header=header), tag=EVENT_TAG, event_id=event)
+
+    for _i in range(n_auxiliary):
+        ds.add_auxiliary_data(
+            data=rng.randn(auxiliary_size).astype(np.float32),
+            data_type="BenchmarkData", path="array_%04i" % _i, parameters={})
+
+    del ds
+
+
+def _time(fct, repeat, setup=None):
+    """
+    Calls ``fct()`` ``repeat`` times, ``setup()`` before each call, and
+    returns statistics of the runtimes in seconds.
+    """
+    runtimes = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        a = time.time()
+        fct()
+        runtimes.append(time.time() - a)
+    return {"min": min(runtimes), "mean": sum(runtimes) / len(runtimes),
+            "max": max(runtimes)}
+
+
+def _wait(app, condition, timeout=600.0):
+    a = time.time()
+    while not condition():
+        if time.time() - a > timeout:
+            raise RuntimeError("Timed out waiting for the window.")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def run(filename, repeat, interval_length):
+    import main
+    import waveform_index
+
+    app = QtGui.QApplication.instance() or QtGui.QApplication(sys.argv)
+    pool = QtCore.QThreadPool.globalInstance()
+    window = main.Window()
+
+    results = {}
+
+    # Open the file and wait until all panels have been filled.
+    a = time.time()
+    window.load_asdf_file(filename)
+    _wait(app, lambda: OPEN_PHASES.issubset(
+        _i[0] for _i in window._state["open_phase_timings"]))
+    results["load_asdf_file"] = {
+        "total": time.time() - a,
+        "phases": dict(window._state["open_phase_timings"])}
+    ds = window.ds
+
+    stations = sorted(ds.waveforms.list())
+    station = stations[0]
+
+    def remove_index():
+        for sta in stations:
+            index = waveform_index.get_index_filename(filename, sta)
+            if os.path.exists(index):
+                os.remove(index)
+
+    results["create_asdf_sql"] = _time(
+        lambda: window.create_asdf_sql(station), repeat, setup=remove_index)
+    remove_index()
+    for sta in stations:
+        window.create_asdf_sql(sta)
+
+    starttime = STARTTIME + 0.5 * interval_length
+    endtime = starttime + interval_length
+    sql_filename = waveform_index.get_index_filename(filename, station)
+    query = waveform_index.interval_query(starttime.timestamp,
+                                          endtime.timestamp, CONTINUOUS_TAG)
+    results["query_sql_db"] = _time(
+        lambda: window.query_sql_db(query, sql_filename, station), repeat)
+
+    st_ids = ["%s..%s" % (station, cha) for cha in CHANNELS]
+    st_tags = [CONTINUOUS_TAG] * len(st_ids)
+
+    def extract():
+        window.new_start_time = starttime
+        window.new_end_time = endtime
+        window.extract_from_continuous(True, st_ids=st_ids, st_tags=st_tags)
+
+    def clear_cache():
+        # Wait for and drop the prefetched intervals of the previous run.
+        pool.waitForDone()
+        app.processEvents()
+        window._prefetcher.clear()
+        window._waveform_cache.clear()
+
+    results["extract_from_continuous"] = _time(extract, repeat,
+                                               setup=clear_cache)
+    results["extract_from_continuous_cached"] = _time(extract, repeat)
+
+    results["update_waveform_plot"] = _time(window.update_waveform_plot,
+                                            repeat)
+
+    station_data = main.get_station_view_data(ds)
+    results["build_station_view_list"] = _time(
+        lambda: window.build_station_view_list(station_data), repeat)
+
+    events = ds.events
+    results["build_event_tree_view"] = _time(
+        lambda: window.build_event_tree_view(events), repeat)
+
+    results["plot_event_waveforms"] = _time(
+        lambda: window.plot_event_waveforms(events[0], stations,
+                                            ["*Z", "*N", "*E"]),
+        repeat, setup=clear_cache)
+
+    clear_cache()
+    window.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stations", type=int, default=10,
+                        help="Number of stations.")
+    parser.add_argument("--segments", type=int, default=24,
+                        help="Number of segments per channel.")
+    parser.add_argument("--segment-length", type=float, default=3600.0,
+                        help="Length of the segments in seconds.")
+    parser.add_argument("--sampling-rate", type=float, default=40.0,
+                        help="Sampling rate of the waveforms in Hz.")
+    parser.add_argument("--events", type=int, default=10,
+                        help="Number of events.")
+    parser.add_argument("--auxiliary", type=int, default=100,
+                        help="Number of auxiliary data arrays.")
+    parser.add_argument("--auxiliary-size", type=int, default=10000,
+                        help="Number of samples of each auxiliary array.")
+    parser.add_argument("--compression", type=str, default=None,
+                        help="Compression of the data sets, e.g. 'gzip-3'.")
+    parser.add_argument("--interval", type=float, default=3600.0,
+                        help="Length of the extracted interval in seconds.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of repetitions of each measurement.")
+    parser.add_argument("--keep", type=str, default=None,
+                        help="Write the ASDF file to this directory and keep "
+                             "it.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    directory = args.keep or tempfile.mkdtemp()
+    filename = os.path.join(directory, "benchmark.h5")
+    parameters = {
+        "n_stations": args.stations, "n_segments": args.segments,
+        "segment_length": args.segment_length,
+        "sampling_rate": args.sampling_rate, "n_events": args.events,
+        "n_auxiliary": args.auxiliary, "auxiliary_size": args.auxiliary_size,
+        "compression": args.compression}
+    try:
+        if os.path.exists(filename):
+            os.remove(filename)
+        a = time.time()
+        generate_file(filename, **parameters)
+        generation_time = time.time() - a
+
+        results = run(filename, args.repeat, args.interval)
+    finally:
+        if args.keep is None:
+            shutil.rmtree(directory)
+
+    results["parameters"] = parameters
+    results["parameters"].update(interval=args.interval, repeat=args.repeat)
+    results["generate_file"] = generation_time
+
+    print(json.dumps(results, indent=4, sort_keys=True))
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
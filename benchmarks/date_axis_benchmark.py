@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the tick generation of linked DateAxisItems.
+
+Simulates panning and zooming a record section with many linked plots: for
+every frame the tick values and labels of all axes are computed for the
+same range, just as pyqtgraph does when repainting linked plots.
+
+Usage:
+
+    $ python benchmarks/date_axis_benchmark.py --axes 50 --frames 200
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import pyqtgraph as pg  # NOQA
+
+from DateAxisItem import DateAxisItem  # NOQA
+
+
+def run(n_axes, n_frames, width=1000):
+    axes = [DateAxisItem(orientation="bottom", utcOffset=0)
+            for _ in range(n_axes)]
+
+    results = {}
+    # One hour window panned by 1 % per frame, one day window zoomed out.
+    for name, step in [
+            ("pan", lambda i: (1.4E9 + 36.0 * i, 1.4E9 + 3600 + 36.0 * i)),
+            ("zoom", lambda i: (1.4E9 - 400.0 * i, 1.4E9 + 86400 + 400.0 * i))]:
+        a = time.time()
+        for i in range(n_frames):
+            min_val, max_val = step(i)
+            for axis in axes:
+                for spacing, values in axis.tickValues(min_val, max_val,
+                                                       width):
+                    axis.tickStrings(values, 1.0, spacing)
+        runtime = time.time() - a
+        results[name] = {"total_seconds": runtime,
+                         "ms_per_frame": runtime / n_frames * 1000.0}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--axes", type=int, default=50,
+                        help="Number of linked axes.")
+    parser.add_argument("--frames", type=int, default=200,
+                        help="Number of simulated redraws.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    pg.mkQApp()
+    results = run(args.axes, args.frames)
+    results["axes"] = args.axes
+    results["frames"] = args.frames
+
+    print(json.dumps(results, indent=4, sort_keys=True))
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark of ASDF Sextant.
+
+Measures the import time of each of the heavy dependencies in a fresh
+interpreter as well as the time from starting to import ``main`` until the
+main window has been painted for the first time, including the import of Qt
+and the other dependencies of ``main``. Exits with a non-zero
+status if the time to first paint exceeds the budget or if any module that
+should be imported lazily has been imported before the first paint.
+
+Usage:
+
+    $ python benchmarks/startup_benchmark.py --budget 2.0 --output startup.json
+
+Requires a display, e.g. run it with ``xvfb-run`` on headless machines.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules whose import time is recorded.
+MODULES = [
+    "PyQt4.QtGui",
+    "PyQt4.QtWebKit",
+    "pyqtgraph",
+    "qdarkstyle",
+    "obspy",
+    "obspy.geodetics",
+    "obspy.taup",
+    "pyasdf",
+    "sqlalchemy",
+    "main"]
+
+# Budgets in seconds for the time to first paint of the main window and for
+# importing ``main``, which includes Qt and the other eager dependencies.
+FIRST_PAINT_BUDGET = 2.0
+MAIN_IMPORT_BUDGET = 1.5
+
+# Modules that must not be imported before the main window has been painted.
+# obspy.geodetics is not part of this as parts of obspy.core import it.
+DEFERRED_MODULES = ["obspy.taup", "sqlalchemy", "pyasdf", "PyQt4.QtWebKit"]
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+a = time.time()
+import %s
+print(json.dumps(time.time() - a))
+"""
+
+_FIRST_PAINT_SCRIPT = """
+import json, sys
+import main
+from PyQt4 import QtGui
+# The modules loaded when the first paint is done, work scheduled after it
+# may load others.
+loaded_modules = []
+_paint_event = main.Window.paintEvent
+def paintEvent(self, event):
+    _paint_event(self, event)
+    if not loaded_modules:
+        loaded_modules.append([_i for _i in %r if _i in sys.modules])
+main.Window.paintEvent = paintEvent
+app = QtGui.QApplication(sys.argv)
+window = main.Window()
+window.show()
+while window.time_to_first_paint is None:
+    app.processEvents()
+print(json.dumps({
+    "time_to_first_paint": window.time_to_first_paint,
+    "loaded_modules": loaded_modules[0]}))
+"""
+
+
+def _run(script):
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     cwd=APP_DIRECTORY)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def measure_import_times(modules=MODULES):
+    """
+    Import time in seconds of each module in its own fresh interpreter.
+    """
+    times = {}
+    for module in modules:
+        try:
+            times[module] = _run(_IMPORT_SCRIPT % module)
+        except subprocess.CalledProcessError:
+            times[module] = None
+    return times
+
+
+def measure_time_to_first_paint():
+    return _run(_FIRST_PAINT_SCRIPT % (DEFERRED_MODULES,))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=float, default=FIRST_PAINT_BUDGET,
+                        help="Maximum allowed time to first paint in seconds.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    results = {"import_times": measure_import_times()}
+    results.update(measure_time_to_first_paint())
+    results["budget"] = args.budget
+
+    print(json.dumps(results, indent=4, sort_keys=True))
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=4, sort_keys=True)
+
+    failures = []
+    if results["time_to_first_paint"] > args.budget:
+        failures.append("Time to first paint of %.3f seconds exceeds the "
+                        "budget of %.3f seconds." % (
+                            results["time_to_first_paint"], args.budget))
+    for module in results["loaded_modules"]:
+        failures.append("Module '%s' has been imported before the first "
+                        "paint." % module)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
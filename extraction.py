@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Extraction of time intervals from continuous data using the waveform index.
+
+Does not depend on any widgets so it can be used from background threads.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from obspy.core import UTCDateTime
+
+import waveform_index
+from stream_assembler import assemble_window
+
+__all__ = ["find_waveforms", "extract_interval", "adjacent_interval"]
+
+
+def find_waveforms(asdf_filename, st_ids, st_tags, starttime, endtime):
+    """
+    Queries the waveform indices for all waveforms overlapping an interval.
+
+    :param asdf_filename: Filename of the ASDF file. The indices are next to
+        it.
+    :param st_ids: List of ``NET.STA.LOC.CHA`` ids.
+    :param st_tags: List of waveform tags, one per id.
+    :param starttime: Start of the interval as a timestamp.
+    :param endtime: End of the interval as a timestamp.
+    :returns: List of ``(station, full_id)`` tuples.
+    """
+    waveforms = []
+    for st_id, tag in zip(st_ids, st_tags):
+        sta = '.'.join(st_id.split('.')[:2])
+        query = waveform_index.interval_query(starttime, endtime, tag,
+                                              station_id=st_id)
+        waveforms.extend(
+            (sta, full_id) for full_id in waveform_index.query_full_ids(
+                waveform_index.get_index_filename(asdf_filename, sta), query))
+    return waveforms
+
+
+def extract_interval(ds, asdf_filename, st_ids, st_tags, starttime, endtime,
+                     mapping=None):
+    """
+    Extracts an interval for the given channels and tags. See
+    :func:`find_waveforms` for the parameters, ``mapping`` is an optional
+    :class:`~waveform_mmap.WaveformMapping` of the file.
+
+    :returns: A Stream with one trace per channel, gaps are masked.
+    """
+    waveforms = find_waveforms(asdf_filename, st_ids, st_tags, starttime,
+                               endtime)
+    return assemble_window(ds, waveforms, UTCDateTime(starttime),
+                           UTCDateTime(endtime), mapping=mapping)
+
+
+def adjacent_interval(starttime, endtime, direction, overlap=0.1):
+    """
+    Returns the previous (``direction=-1``) or next (``direction=1``)
+    interval of the same length, overlapping by the given fraction.
+    """
+    delta_time = endtime - starttime
+    overlap_time = delta_time * overlap
+    if direction < 0:
+        return (starttime - (delta_time - overlap_time),
+                starttime + overlap_time)
+    return (endtime - overlap_time, endtime + (delta_time - overlap_time))
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stateful Butterworth filtering of paged waveform windows.
+
+The second order sections of a filter are designed once per sampling rate
+and filter setting. All traces with the same sampling rate and number of
+samples are filtered together as one two dimensional array.
+
+The filter state at the end of every filtered window is kept. When the next
+interval is shown it overlaps the previous one, so the overlapping samples
+are taken from the previous output and only the new samples are filtered,
+starting from the kept state. The output is thus exactly the same as if the
+continuous data had been filtered at once and there are no transients at
+the boundaries of forward pages. Windows without a matching previous window,
+e.g. the first one or when paging backwards, would start from the steady
+state of their first sample and show a transient. If a function reading the
+preceding data is given, a pre-roll of several periods of the lowest corner
+frequency is filtered first and the window starts from the state after it,
+so the transient has decayed before the window starts. Only the windows of
+the current filter settings are kept, up to a total number of samples.
+
+Does not depend on Qt.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+from collections import OrderedDict
+
+import numpy as np
+from obspy.core import Stream, Trace
+
+__all__ = ["FilterSettings", "get_sos", "get_preroll_length",
+           "StreamingFilter"]
+
+FILTER_TYPES = ("bandpass", "lowpass", "highpass")
+
+# Number of designed filters that are kept.
+MAX_DESIGNS = 64
+# Number of filtered windows per channel whose output and final state are
+# kept for continuing the filter.
+MAX_WINDOWS_PER_CHANNEL = 8
+# Total number of output samples kept over all channels, 128 MB.
+MAX_KEPT_SAMPLES = 2 ** 24
+# Length of the pre-roll in periods of the lowest corner frequency and its
+# maximum number of samples per trace.
+PREROLL_PERIODS = 10
+MAX_PREROLL_SAMPLES = 2 ** 20
+
+FilterSettings = collections.namedtuple(
+    "FilterSettings", ["type", "freqmin", "freqmax", "corners"])
+
+_SOS_CACHE = OrderedDict()
+
+
+def get_sos(settings, sampling_rate):
+    """
+    Returns the second order sections of a Butterworth filter. Designs are
+    cached per sampling rate and settings.
+    """
+    key = (settings, sampling_rate)
+    try:
+        sos = _SOS_CACHE.pop(key)
+    except KeyError:
+        from scipy.signal import iirfilter
+
+        nyquist = 0.5 * sampling_rate
+        if settings.type == "bandpass":
+            if settings.freqmin >= settings.freqmax:
+                raise ValueError("The minimum frequency must be below the "
+                                 "maximum frequency.")
+            # Like obspy, a corner above Nyquist turns it into a highpass.
+            if settings.freqmax >= nyquist:
+                sos = iirfilter(settings.corners, settings.freqmin / nyquist,
+                                btype="highpass", ftype="butter",
+                                output="sos")
+            else:
+                sos = iirfilter(settings.corners,
+                                [settings.freqmin / nyquist,
+                                 settings.freqmax / nyquist],
+                                btype="band", ftype="butter", output="sos")
+        elif settings.type == "lowpass":
+            sos = iirfilter(settings.corners,
+                            min(settings.freqmax / nyquist, 1.0 - 1E-9),
+                            btype="lowpass", ftype="butter", output="sos")
+        elif settings.type == "highpass":
+            sos = iirfilter(settings.corners, settings.freqmin / nyquist,
+                            btype="highpass", ftype="butter", output="sos")
+        else:
+            raise ValueError("Unknown filter type: %s" % settings.type)
+    _SOS_CACHE[key] = sos
+    while len(_SOS_CACHE) > MAX_DESIGNS:
+        _SOS_CACHE.popitem(last=False)
+    return sos
+
+
+def get_preroll_length(settings, sampling_rate):
+    """
+    Returns the length in seconds of the data filtered before a window
+    without a previous window to continue.
+    """
+    if settings.type == "lowpass":
+        freq = settings.freqmax
+    else:
+        freq = settings.freqmin
+    return min(PREROLL_PERIODS / freq, MAX_PREROLL_SAMPLES / sampling_rate)
+
+
+def _fill_gaps(data):
+    """
+    Returns the data as float64 with masked samples replaced by the last
+    valid sample so gaps do not cause steps.
+    """
+    mask = np.ma.getmaskarray(data)
+    values = np.ma.getdata(data).astype(np.float64)
+    if not mask.any():
+        return values
+    if mask.all():
+        return np.zeros_like(values)
+    idx = np.where(mask, 0, np.arange(len(values)))
+    idx = np.maximum.accumulate(idx)
+    # Leading masked samples take the first valid one.
+    idx[:np.argmin(mask)] = np.argmin(mask)
+    return values[idx]
+
+
+class _Window(object):
+    def __init__(self, starttime, sampling_rate, output, zf):
+        self.starttime = starttime
+        self.sampling_rate = sampling_rate
+        self.output = output
+        # Filter state after the last sample.
+        self.zf = zf
+
+    @property
+    def next_time(self):
+        return self.starttime + len(self.output) / self.sampling_rate
+
+
+class StreamingFilter(object):
+    """
+    Filters streams, continuing the filter of previously filtered windows of
+    the same channels.
+    """
+    def __init__(self, max_kept_samples=MAX_KEPT_SAMPLES):
+        self.max_kept_samples = max_kept_samples
+        # Settings the kept windows have been filtered with.
+        self._settings = None
+        self._windows = {}
+        # All kept windows, the oldest first.
+        self._order = collections.deque()
+        self.kept_samples = 0
+        self.filtered_samples = 0
+
+    def clear(self):
+        self._windows.clear()
+        self._order.clear()
+        self.kept_samples = 0
+
+    def _keep(self, key, window):
+        windows = self._windows.setdefault(key, [])
+        windows.append(window)
+        self._order.append((key, window))
+        self.kept_samples += len(window.output)
+        if len(windows) > MAX_WINDOWS_PER_CHANNEL:
+            self._discard(key, windows[0])
+        while self.kept_samples > self.max_kept_samples and \
+                len(self._order) > 1:
+            self._discard(*self._order[0])
+
+    def _discard(self, key, window):
+        windows = self._windows[key]
+        windows.remove(window)
+        if not windows:
+            del self._windows[key]
+        self._order.remove((key, window))
+        self.kept_samples -= len(window.output)
+
+    def _find_window(self, key, starttime, sampling_rate):
+        """
+        Returns the kept window the trace starts in and the offset of the
+        trace in it, preferring the one reaching furthest.
+        """
+        best = None
+        for window in self._windows.get(key, []):
+            if window.sampling_rate != sampling_rate:
+                continue
+            offset = (starttime - window.starttime) * sampling_rate
+            if not 0 <= round(offset) <= len(window.output) or \
+                    abs(offset - round(offset)) > 1E-3:
+                continue
+            if best is None or window.next_time > best[0].next_time:
+                best = (window, int(round(offset)))
+        return best
+
+    def _get_preroll_states(self, jobs, settings, read_preroll):
+        """
+        Returns the filter states after the data preceding the traces of the
+        given jobs, by job index. Traces without preceding data are missing.
+        """
+        from scipy.signal import sosfilt, sosfilt_zi
+
+        # The traces of a page usually all start at the same time.
+        requests = OrderedDict()
+        for _i in jobs:
+            requests.setdefault(jobs[_i][2], []).append(_i)
+
+        states = {}
+        for starttime, indices in requests.items():
+            length = max(get_preroll_length(settings,
+                                             jobs[_i][0].stats.sampling_rate)
+                         for _i in indices)
+            prerolls = {}
+            for tr in read_preroll([jobs[_i][0].id for _i in indices],
+                                   [jobs[_i][1][1] for _i in indices],
+                                   starttime - length, starttime):
+                prerolls[(tr.id, getattr(tr.stats.get("asdf", {}), "tag",
+                                         None))] = tr
+            for _i in indices:
+                tr = jobs[_i][0]
+                preroll = prerolls.get(jobs[_i][1])
+                sampling_rate = tr.stats.sampling_rate
+                if preroll is None or \
+                        preroll.stats.sampling_rate != sampling_rate:
+                    continue
+                # Only the samples before the trace on its sampling grid.
+                n = (starttime - preroll.stats.starttime.timestamp) * \
+                    sampling_rate
+                if round(n) < 1 or abs(n - round(n)) > 1E-3:
+                    continue
+                data = preroll.data[:int(round(n))]
+                if len(data) != int(round(n)) or \
+                        np.ma.getmaskarray(data).all():
+                    continue
+                x = _fill_gaps(data)
+                sos = get_sos(settings, sampling_rate)
+                _, states[_i] = sosfilt(sos, x, zi=sosfilt_zi(sos) * x[0])
+                self.filtered_samples += len(x)
+        return states
+
+    def filter(self, st, settings, read_preroll=None):
+        """
+        Returns a new stream with the filtered traces as float64. Samples
+        masked in the input are masked in the output.
+
+        :param settings: The :class:`FilterSettings`.
+        :param read_preroll: Optional function
+            ``f(st_ids, st_tags, starttime, endtime)`` returning the traces
+            of the given channels and tags in an interval. Used to read the
+            data preceding traces that do not continue a kept window.
+        """
+        from scipy.signal import sosfilt, sosfilt_zi
+
+        # Windows of other settings cannot be continued anymore.
+        if settings != self._settings:
+            self.clear()
+            self._settings = settings
+
+        jobs = []
+        for tr in st:
+            sampling_rate = tr.stats.sampling_rate
+            key = (tr.id, getattr(tr.stats.get("asdf", {}), "tag", None))
+            starttime = tr.stats.starttime.timestamp
+            data = _fill_gaps(tr.data)
+            found = self._find_window(key, starttime, sampling_rate)
+            if found is None:
+                head, zi = np.empty(0), None
+            else:
+                window, offset = found
+                head = window.output[offset:offset + len(data)]
+                zi = window.zf
+            jobs.append((tr, key, starttime, data, head, zi))
+
+        if read_preroll is not None:
+            prerolls = self._get_preroll_states(
+                dict((_i, _job) for _i, _job in enumerate(jobs)
+                     if _job[5] is None and len(_job[3])),
+                settings, read_preroll)
+        else:
+            prerolls = {}
+
+        # Filter the new samples of all traces with the same sampling rate
+        # and length at once.
+        groups = OrderedDict()
+        for _i, (tr, key, starttime, data, head, zi) in enumerate(jobs):
+            n_new = len(data) - len(head)
+            if n_new:
+                groups.setdefault((tr.stats.sampling_rate, n_new),
+                                  []).append(_i)
+
+        tails = {}
+        for (sampling_rate, n_new), indices in groups.items():
+            sos = get_sos(settings, sampling_rate)
+            x = np.array([jobs[_i][3][-n_new:] for _i in indices])
+            zi = np.empty((sos.shape[0], len(indices), 2))
+            for _j, _i in enumerate(indices):
+                if jobs[_i][5] is not None:
+                    zi[:, _j] = jobs[_i][5]
+                elif _i in prerolls:
+                    zi[:, _j] = prerolls[_i]
+                else:
+                    # Steady state for the first sample.
+                    zi[:, _j] = sosfilt_zi(sos) * x[_j, 0]
+            y, zf = sosfilt(sos, x, axis=-1, zi=zi)
+            self.filtered_samples += x.size
+            for _j, _i in enumerate(indices):
+                tails[_i] = (y[_j], zf[:, _j])
+
+        filtered = Stream()
+        for _i, (tr, key, starttime, data, head, zi) in enumerate(jobs):
+            if _i in tails:
+                output = np.concatenate([head, tails[_i][0]])
+                zf = tails[_i][1]
+                self._keep(key, _Window(starttime, tr.stats.sampling_rate,
+                                        output, zf))
+            else:
+                output = head.copy()
+            mask = np.ma.getmaskarray(tr.data)
+            if mask.any():
+                output = np.ma.masked_array(output, mask=mask)
+            filtered.append(Trace(data=output, header=tr.stats.copy()))
+        return filtered
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Deferred imports of heavy modules.
+
+``taup = lazy_import("obspy.taup")`` returns a placeholder that only imports
+the module on first attribute access. This keeps the time until the main
+window appears independent of modules that are only needed for certain
+actions.
+
+The time spent importing each lazily loaded module is recorded in
+``IMPORT_TIMES`` which is used by the startup benchmark.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import importlib
+import sys
+import time
+
+__all__ = ["lazy_import", "IMPORT_TIMES"]
+
+# Maps module names to the time in seconds it took to import them.
+IMPORT_TIMES = {}
+
+
+class LazyModule(object):
+    """
+    Placeholder for a module that is imported on first attribute access.
+    """
+    def __init__(self, name):
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_module", None)
+
+    def _load(self):
+        module = object.__getattribute__(self, "_lazy_module")
+        if module is None:
+            name = object.__getattribute__(self, "_lazy_name")
+            a = time.time()
+            module = importlib.import_module(str(name))
+            IMPORT_TIMES[name] = time.time() - a
+            object.__setattr__(self, "_lazy_module", module)
+        return module
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self._load(), key, value)
+
+    def __repr__(self):
+        name = object.__getattribute__(self, "_lazy_name")
+        if object.__getattribute__(self, "_lazy_module") is None:
+            return "<lazily imported module '%s' (not yet loaded)>" % name
+        return "<lazily imported module '%s'>" % name
+
+
+def lazy_import(name):
+    """
+    Returns the module if it has already been imported, otherwise a
+    placeholder that imports it on first use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def is_loaded(module):
+    """
+    Whether or not a module returned by :func:`lazy_import` has actually been
+    imported.
+    """
+    if not isinstance(module, LazyModule):
+        return True
+    return object.__getattribute__(module, "_lazy_module") is not None
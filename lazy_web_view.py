@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Web view that is only created once it is used.
+
+Importing QtWebKit and creating a QWebView is expensive and not needed to
+show the main window, so the station and event maps start as this
+placeholder.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from PyQt4 import QtGui
+
+
+class LazyWebView(QtGui.QWidget):
+    """
+    Placeholder of a QWebView that only imports QtWebKit and creates the
+    web view once it is used, so QtWebKit is not needed to show the main
+    window.
+    """
+    def __init__(self, *args, **kwargs):
+        QtGui.QWidget.__init__(self, *args, **kwargs)
+        layout = QtGui.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self._view = None
+
+    @property
+    def view(self):
+        if self._view is None:
+            from PyQt4 import QtWebKit
+            self._view = QtWebKit.QWebView(self)
+            self.layout().addWidget(self._view)
+        return self._view
+
+    def load(self, url):
+        self.view.load(url)
+
+    def page(self):
+        return self.view.page()
+
+    def settings(self):
+        return self.view.settings()
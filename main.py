@@ -12,32 +12,58 @@ Graphical user interface for Instaseis.
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-from PyQt4 import QtGui, QtCore, QtWebKit, QtNetwork
+# Records the start time, imported before anything else.
+import startup
+
+from PyQt4 import QtGui, QtCore, QtNetwork
+import numpy as np
 import pyqtgraph as pg
 import qdarkstyle
 
-from glob import iglob
-import imp
-import inspect
+import functools
+import glob
 import itertools
 import os
 import sys
-import tempfile
-from os.path import join, exists
-
-import obspy.core.event
-import pyasdf
-from pyasdf.exceptions import ASDFValueError
+import time
 
 from obspy.core import UTCDateTime, Stream
-from obspy.geodetics import gps2dist_azimuth, kilometer2degrees
-from obspy.taup import TauPyModel
 
 from DateAxisItem import DateAxisItem
-
-from sqlalchemy import create_engine, text, Column, Integer, String, or_, and_
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+from lazy_import import lazy_import
+from map_highlights import HighlightManager
+from prefetch import IntervalPrefetcher
+import profiling
+from profiling_panel import ProfilingPanel
+from provenance_cache import ProvenanceRenderCache, RenderJobs
+from station_selection import (StationFilterProxyModel, StationTreeModel,
+                               get_regions)
+from ui_loader import load_ui_module
+from waveform_cache import WaveformCache, get_trace_key
+from workers import run_in_background
+
+# Heavy modules that are not needed to show the main window are only imported
+# once they are used.
+QtWebKit = lazy_import("PyQt4.QtWebKit")
+pyasdf = lazy_import("pyasdf")
+pyasdf_exceptions = lazy_import("pyasdf.exceptions")
+pyasdf_utils = lazy_import("pyasdf.utils")
+obspy_event = lazy_import("obspy.core.event")
+geodetics = lazy_import("obspy.geodetics")
+taup = lazy_import("obspy.taup")
+waveform_index = lazy_import("waveform_index")
+auxiliary_data_tree = lazy_import("auxiliary_data_tree")
+auxiliary_data_view = lazy_import("auxiliary_data_view")
+provenance_index = lazy_import("provenance_index")
+stream_assembler = lazy_import("stream_assembler")
+extraction = lazy_import("extraction")
+waveform_mmap = lazy_import("waveform_mmap")
+virtual_archive = lazy_import("virtual_archive")
+availability = lazy_import("availability")
+spectral = lazy_import("spectral")
+filtering = lazy_import("filtering")
+response_removal = lazy_import("response_removal")
+attribute_index = lazy_import("attribute_index")
 
 # Enums only exists in Python 3 and we don't really need them here...
 STATION_VIEW_ITEM_TYPES = {
@@ -54,7 +80,17 @@ EVENT_VIEW_ITEM_TYPES = {
 
 AUX_DATA_ITEM_TYPES = {
     "DATA_TYPE": 0,
-    "DATA_ITEM": 1}
+    "DATA_ITEM": 1,
+    "LOAD_MORE": 2,
+    "SPECTROGRAMS": 3,
+    "SPECTROGRAM": 4}
+
+# Number of views remembered for the previous view button.
+MAX_VIEW_HISTORY = 50
+
+# Length in seconds of the window shown when clicking on the availability
+# timeline while no interval is shown.
+AVAILABILITY_WINDOW = 3600.0
 
 
 # Default to antialiased drawing.
@@ -62,47 +98,6 @@ pg.setConfigOptions(antialias=True, foreground=(200, 200, 200),
                     background=None)
 
 
-Base = declarative_base()
-
-# Class for SQLite database for wavefoms belonging to station
-class Waveforms(Base):
-    __tablename__ = 'waveforms'
-    # Here we define columns for the SQL table
-    starttime = Column(Integer)
-    endtime = Column(Integer)
-    station_id = Column(String(250), nullable=False)
-    tag = Column(String(250), nullable=False)
-    full_id = Column(String(250), nullable=False, primary_key=True)
-
-def compile_and_import_ui_files():
-    """
-    Automatically compiles all .ui files found in the same directory as the
-    application py file.
-    They will have the same name as the .ui files just with a .py extension.
-
-    Needs to be defined in the same file as function loading the gui as it
-    modifies the globals to be able to automatically import the created py-ui
-    files. Its just very convenient.
-    """
-    directory = os.path.dirname(os.path.abspath(
-        inspect.getfile(inspect.currentframe())))
-    for filename in iglob(os.path.join(directory, '*.ui')):
-        ui_file = filename
-        py_ui_file = os.path.splitext(ui_file)[0] + os.path.extsep + 'py'
-        if not os.path.exists(py_ui_file) or \
-                (os.path.getmtime(ui_file) >= os.path.getmtime(py_ui_file)):
-            from PyQt4 import uic
-            print("Compiling ui file: %s" % ui_file)
-            with open(py_ui_file, 'w') as open_file:
-                uic.compileUi(ui_file, open_file)
-        # Import the (compiled) file.
-        try:
-            import_name = os.path.splitext(os.path.basename(py_ui_file))[0]
-            globals()[import_name] = imp.load_source(import_name, py_ui_file)
-        except ImportError as e:
-            print("Error importing %s" % py_ui_file)
-            print(e.message)
-
 def sizeof_fmt(num):
     """
     Handy formatting for human readable filesize.
@@ -115,10 +110,31 @@ def sizeof_fmt(num):
         num /= 1024.0
     return "%3.1f %s" % (num, "TB")
 
+def get_station_view_data(ds):
+    """
+    Collects everything needed to fill the station tree. Does not touch any
+    widgets and can thus run in a background thread.
+
+    Returns a list of ``(station_name, has_stationxml, waveform_tags)``
+    tuples.
+    """
+    # Virtual data sets of many files answer this from their index.
+    if hasattr(ds, "get_station_view_data"):
+        return ds.get_station_view_data()
+
+    station_data = []
+    for station in ds.waveforms:
+        station_data.append((station._station_name,
+                             "StationXML" in station.list(),
+                             station.get_waveform_tags()))
+    return station_data
+
+
 class timeDialog(QtGui.QDialog):
     def __init__(self, parent=None):
         QtGui.QDialog.__init__(self, parent)
-        self.timeui = extract_time_dialog.Ui_ExtractTimeDialog()
+        self.timeui = load_ui_module(
+            "extract_time_dialog").Ui_ExtractTimeDialog()
         self.timeui.setupUi(self)
 
     def getValues(self):
@@ -126,67 +142,90 @@ class timeDialog(QtGui.QDialog):
                 UTCDateTime(self.timeui.endtime.dateTime().toPyDateTime()))
 
 class selectionDialog(QtGui.QDialog):
-    '''
-    Select all functionality is modified from Brendan Abel & dbc from their
-    stackoverflow communication Feb 24th 2016:
-    http://stackoverflow.com/questions/35611199/creating-a-toggling-check-all-checkbox-for-a-listview
-    '''
-    def __init__(self, parent=None, sta_list=None):
+    """
+    Selection of stations and components.
+
+    The check states are kept in a single model so checking all stations
+    and updating the select all check box do not depend on the number of
+    stations. The stations are grouped by network or by the region of their
+    coordinates. The list can be filtered by name and network, select all
+    then only applies to the shown stations.
+    """
+    def __init__(self, parent=None, sta_list=None, coordinates=None):
         QtGui.QDialog.__init__(self, parent)
-        self.selui = select_stacomp_dialog.Ui_SelectDialog()
+        self.selui = load_ui_module("select_stacomp_dialog").Ui_SelectDialog()
         self.selui.setupUi(self)
 
-        # Set all check box to checked
-        self.selui.check_all.setChecked(True)
-        self.selui.check_all.clicked.connect(self.selectAllCheckChanged)
-
-        self.model = QtGui.QStandardItemModel(self.selui.StaListView)
-
         self.sta_list = sta_list
-        for sta in self.sta_list:
-            item = QtGui.QStandardItem(sta)
-            item.setCheckable(True)
-
-            self.model.appendRow(item)
+        self.coordinates = coordinates or {}
+        self.model = StationTreeModel(self.sta_list, checked=True,
+                                      parent=self)
+        self.proxy_model = StationFilterProxyModel(self)
+        self.proxy_model.setSourceModel(self.model)
+        self.selui.station_tree_view.setModel(self.proxy_model)
+        self._regions = None
+
+        self.selui.group_combo_box.currentIndexChanged[int].connect(
+            self.groupingChanged)
+
+        self.selui.network_combo_box.addItems(
+            ["All Networks"] + sorted(set(self.model.networks)))
+        self.selui.network_combo_box.currentIndexChanged[int].connect(
+            self.networkChanged)
+        self.selui.filter_line_edit.textChanged.connect(self.filterChanged)
 
-        self.selui.StaListView.setModel(self.model)
-        self.selui.StaListView.clicked.connect(self.listviewCheckChanged)
+        self.selui.check_all.clicked.connect(self.selectAllCheckChanged)
+        self.model.checkedCountChanged.connect(self.listviewCheckChanged)
+        self.listviewCheckChanged()
+
+    def groupingChanged(self, index):
+        # The regions are only looked up when they are shown.
+        if index == 1:
+            if self._regions is None:
+                self._regions = get_regions(self.sta_list, self.coordinates)
+            self.model.set_groups(self._regions)
+        else:
+            self.model.set_groups(self.model.networks)
+
+    def filterChanged(self, text):
+        self.proxy_model.set_text(str(text))
+        # Show the matching stations of all groups.
+        if text:
+            self.selui.station_tree_view.expandAll()
+        self.listviewCheckChanged()
+
+    def networkChanged(self, index):
+        # The first entry shows all networks.
+        self.proxy_model.set_network(
+            str(self.selui.network_combo_box.itemText(index))
+            if index > 0 else None)
+        self.listviewCheckChanged()
 
     def selectAllCheckChanged(self):
-        ''' updates the listview based on select all checkbox '''
-        model = self.selui.StaListView.model()
-        for index in range(model.rowCount()):
-            item = model.item(index)
-            if item.isCheckable():
-                if self.selui.check_all.isChecked():
-                    item.setCheckState(QtCore.Qt.Checked)
-                else:
-                    item.setCheckState(QtCore.Qt.Unchecked)
+        ''' checks or unchecks all shown stations at once '''
+        self.model.set_checked(self.proxy_model.get_source_rows(),
+                               self.selui.check_all.isChecked())
 
-    def listviewCheckChanged(self):
-        ''' updates the select all checkbox based on the listview '''
-        model = self.selui.StaListView.model()
-        items = [model.item(index) for index in range(model.rowCount())]
+    def listviewCheckChanged(self, *args):
+        ''' updates the select all checkbox based on the shown stations '''
+        rows = self.proxy_model.get_source_rows()
+        checked = self.model.count_checked(rows)
 
-        if all(item.checkState() == QtCore.Qt.Checked for item in items):
+        if len(rows) and checked == len(rows):
             self.selui.check_all.setTristate(False)
             self.selui.check_all.setCheckState(QtCore.Qt.Checked)
-        elif any(item.checkState() == QtCore.Qt.Checked for item in items):
+        elif checked:
             self.selui.check_all.setTristate(True)
             self.selui.check_all.setCheckState(QtCore.Qt.PartiallyChecked)
         else:
             self.selui.check_all.setTristate(False)
             self.selui.check_all.setCheckState(QtCore.Qt.Unchecked)
 
-
+        self.selui.selected_label.setText("%i of %i stations selected" % (
+            self.model.checked_count, len(self.sta_list)))
 
     def getSelected(self):
-        select_stations = []
-        i = 0
-        while self.model.item(i):
-            if self.model.item(i).checkState():
-                select_stations.append(str(self.model.item(i).text()))
-            i += 1
+        select_stations = self.model.get_checked()
 
         # Return Selected stations and checked components
         return(select_stations, [self.selui.zcomp.isChecked(),
@@ -196,33 +235,30 @@ class selectionDialog(QtGui.QDialog):
 class Window(QtGui.QMainWindow):
     def __init__(self):
         QtGui.QMainWindow.__init__(self)
-        # Injected by the compile_and_import_ui_files() function.
-        self.ui = asdf_sextant_window.Ui_MainWindow()  # NOQA
+        # Only the main window ui is loaded at startup, the dialogs are
+        # loaded on first use.
+        self.ui = load_ui_module("asdf_sextant_window").Ui_MainWindow()
         self.ui.setupUi(self)
 
         self.provenance_list_model = QtGui.QStandardItemModel(
             self.ui.provenance_list_view)
         self.ui.provenance_list_view.setModel(self.provenance_list_model)
 
-        # Station view.
-        map_file = os.path.abspath(os.path.join(
-            os.path.dirname(__file__), "resources/index.html"))
-        self.ui.web_view.load(QtCore.QUrl.fromLocalFile(map_file))
-        # Enable debugging of the web view.
-        self.ui.web_view.settings().setAttribute(
-            QtWebKit.QWebSettings.DeveloperExtrasEnabled, True)
+        self._state = {}
 
-        # Event view.
-        map_file = os.path.abspath(os.path.join(
-            os.path.dirname(__file__), "resources/index_event.html"))
-        self.ui.events_web_view.load(QtCore.QUrl.fromLocalFile(map_file))
-        # Enable debugging of the web view.
-        self.ui.events_web_view.settings().setAttribute(
-            QtWebKit.QWebSettings.DeveloperExtrasEnabled, True)
+        # Refines the visible part of large auxiliary data arrays once
+        # zooming or panning stopped.
+        self._auxiliary_data_refine_timer = QtCore.QTimer(self)
+        self._auxiliary_data_refine_timer.setSingleShot(True)
+        self._auxiliary_data_refine_timer.setInterval(150)
+        self._auxiliary_data_refine_timer.timeout.connect(
+            self._refine_auxiliary_data_view)
 
-        self._state = {}
+        # Time from the start of the import to the first paint of the window.
+        self.time_to_first_paint = None
 
         self.ui.openASDF.triggered.connect(self.open_asdf_file)
+        self.ui.openASDFDirectory.triggered.connect(self.open_asdf_directory)
 
         # Add right clickability to station view
         self.ui.station_view.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
@@ -232,21 +268,118 @@ class Window(QtGui.QMainWindow):
         self.ui.event_tree_widget.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.ui.event_tree_widget.customContextMenuRequested.connect(self.event_tree_widget_rightClicked)
 
+        # Highlighted stations of the map, updated at most once per frame.
+        self._map_highlights = HighlightManager(
+            lambda js_call: self.evaluate_javascript(self.ui.web_view,
+                                                     js_call), parent=self)
         QtGui.QApplication.instance().focusChanged.connect(self.changed_widget_focus)
 
-        tmp = tempfile.mkstemp("asdf_sextant")
-        os.close(tmp[0])
-        try:
-            os.remove(tmp[1])
-        except:
-            pass
-        self._tempfile = tmp[1] + ".svg"
+        # Rendered provenance graphs. Rendering calls graphviz so it is done
+        # in a separate pool with few threads.
+        self._provenance_cache = ProvenanceRenderCache()
+        self._provenance_pool = QtCore.QThreadPool(self)
+        self._provenance_pool.setMaxThreadCount(2)
+        # Documents queued or being rendered.
+        self._provenance_jobs = RenderJobs()
+
+        # Data sets of previously opened files, closed once no background
+        # thread can still be reading them.
+        self._retired_datasets = []
+        self._close_datasets_timer = QtCore.QTimer(self)
+        self._close_datasets_timer.setSingleShot(True)
+        self._close_datasets_timer.setInterval(500)
+        self._close_datasets_timer.timeout.connect(
+            self._close_retired_datasets)
+
+        # Decoded traces of the recently shown views so going back to them
+        # does not read the file again.
+        self._waveform_cache = WaveformCache()
+        # Memory map of the open file for zero-copy reads.
+        self._waveform_mapping = None
+        self.ui.waveformCache.triggered.connect(self.configure_waveform_cache)
+
+        # Intervals adjacent to the shown one, loaded in the background into
+        # the waveform cache.
+        self._prefetcher = IntervalPrefetcher(
+            lambda key, st: self.cache_interval(st, *key[-2:],
+                                                st_ids=key[0],
+                                                st_tags=key[1]))
+
+        # Timing spans of the hot paths, hidden until enabled in the menu.
+        self.profiling_panel = ProfilingPanel(self)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea,
+                           self.profiling_panel)
+        self.profiling_panel.hide()
+        self.ui.menuTools.addAction(self.profiling_panel.toggleViewAction())
+        self.ui.captureProfile.toggled.connect(self.toggle_cprofile)
+
+        # Redraws the availability timeline at the resolution of the visible
+        # time range once zooming or panning stopped.
+        self._availability_refine_timer = QtCore.QTimer(self)
+        self._availability_refine_timer.setSingleShot(True)
+        self._availability_refine_timer.setInterval(150)
+        self._availability_refine_timer.timeout.connect(
+            self._refine_availability_view)
+        self.ui.availability_graph.scene().sigMouseClicked.connect(
+            self.availability_clicked)
+
+        # Filter bar. The filter of the shown interval is continued when
+        # paging so it is kept across views.
+        self._stream_filter = None
+        self.ui.filter_type_combo_box.currentIndexChanged[int].connect(
+            self.filter_type_changed)
+        for spin_box in (self.ui.filter_freqmin_spin_box,
+                         self.ui.filter_freqmax_spin_box,
+                         self.ui.filter_corners_spin_box):
+            spin_box.editingFinished.connect(self.filter_settings_changed)
+
+        # Evaluated instrument responses, kept until another file is opened.
+        self._response_remover = None
+        self.ui.response_output_combo_box.currentIndexChanged[int].connect(
+            lambda index: self.filter_settings_changed())
+
+    def paintEvent(self, event):
+        if self.time_to_first_paint is None:
+            self.time_to_first_paint = time.time() - startup.STARTUP_TIME
+            # The maps, and with them QtWebKit, are only loaded once the
+            # window has been painted.
+            QtCore.QTimer.singleShot(0, self._load_maps)
+        QtGui.QMainWindow.paintEvent(self, event)
+
+    def evaluate_javascript(self, web_view, js_call):
+        """
+        Evaluates JavaScript in the main frame of a web view, timing the
+        call.
+        """
+        with profiling.span("evaluateJavaScript", "webkit",
+                            call=js_call[:80]):
+            return web_view.page().mainFrame().evaluateJavaScript(js_call)
 
-    def __del__(self):
-        try:
-            os.remove(self._tempfile)
-        except:
-            pass
+    def toggle_cprofile(self, checked):
+        if checked:
+            profiling.profiler.start_cprofile()
+            return
+        filename = str(QtGui.QFileDialog.getSaveFileName(
+            parent=self, caption="Save cProfile Statistics",
+            filter="cProfile statistics (*.prof)"))
+        profiling.profiler.stop_cprofile(filename)
+
+    def _load_maps(self):
+        # Station view.
+        map_file = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "resources/index.html"))
+        self.ui.web_view.load(QtCore.QUrl.fromLocalFile(map_file))
+        # Enable debugging of the web view.
+        self.ui.web_view.settings().setAttribute(
+            QtWebKit.QWebSettings.DeveloperExtrasEnabled, True)
+
+        # Event view.
+        map_file = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "resources/index_event.html"))
+        self.ui.events_web_view.load(QtCore.QUrl.fromLocalFile(map_file))
+        # Enable debugging of the web view.
+        self.ui.events_web_view.settings().setAttribute(
+            QtWebKit.QWebSettings.DeveloperExtrasEnabled, True)
 
     def __connect_signal_and_slots(self):
         """
@@ -260,17 +393,16 @@ class Window(QtGui.QMainWindow):
 
     def changed_widget_focus(self):
         if QtGui.QApplication.focusWidget() == self.ui.graph:
-            # Access the state dictionary and iterate through all stations in graph then highlight statins on web view
-            for station_id in self._state["station_id"]:
-                sta = station_id.split('.')[0] + '.' + station_id.split('.')[1]
-                # Run Java Script to highlight all selected stations in station view
-                js_call = "highlightStation('{station}')".format(station=sta)
-                self.ui.web_view.page().mainFrame().evaluateJavaScript(js_call)
-
-    def build_event_tree_view(self):
+            # Highlight the stations of all plotted traces on the map.
+            self._map_highlights.highlight(
+                self._state.get("plotted_stations", ()))
+
+    def build_event_tree_view(self, events=None):
         if not hasattr(self, "ds") or not self.ds:
             return
-        self.events = self.ds.events
+        if events is None:
+            events = self.ds.events
+        self.events = events
         self.ui.event_tree_widget.clear()
 
         items = []
@@ -284,8 +416,8 @@ class Window(QtGui.QMainWindow):
                     .format(event_id=event.resource_id.id,
                             latitude=org.latitude,
                             longitude=org.longitude)
-                self.ui.events_web_view.page().mainFrame().evaluateJavaScript(
-                    js_call)
+                self.evaluate_javascript(
+                    self.ui.events_web_view, js_call)
 
             event_item = QtGui.QTreeWidgetItem(
                 [event.resource_id.id],
@@ -330,64 +462,61 @@ class Window(QtGui.QMainWindow):
 
         self.ui.event_tree_widget.insertTopLevelItems(0, items)
 
-    def build_station_view_list(self):
+    def build_station_view_list(self, station_data=None):
+        """
+        Fills the station tree. ``station_data`` is the list returned by
+        :func:`get_station_view_data`, if not given the last one is reused.
+        """
         if not hasattr(self, "ds") or not self.ds:
             return
+        if station_data is None:
+            if "station_view_data" not in self._state:
+                self._state["station_view_data"] = \
+                    get_station_view_data(self.ds)
+            station_data = self._state["station_view_data"]
+        self._state["station_view_data"] = station_data
+
         self.ui.station_view.clear()
 
+        def get_children(has_stationxml, waveform_tags):
+            children = []
+            if has_stationxml:
+                children.append(
+                    QtGui.QTreeWidgetItem(
+                        ["StationXML"],
+                        type=STATION_VIEW_ITEM_TYPES["STATIONXML"]))
+            for waveform in waveform_tags:
+                children.append(
+                    QtGui.QTreeWidgetItem(
+                        [waveform],
+                        type=STATION_VIEW_ITEM_TYPES["WAVEFORM"]))
+            return children
+
         items = []
 
         if self.ui.group_by_network_check_box.isChecked():
             for key, group in itertools.groupby(
-                    self.ds.waveforms,
-                    key=lambda x: x._station_name.split(".")[0]):
+                    station_data, key=lambda x: x[0].split(".")[0]):
                 network_item = QtGui.QTreeWidgetItem(
                     [key],
                     type=STATION_VIEW_ITEM_TYPES["NETWORK"])
-                group = sorted(group, key=lambda x: x._station_name)
-                for station in sorted(group, key=lambda x: x._station_name):
+                for station_name, has_stationxml, waveform_tags in \
+                        sorted(group, key=lambda x: x[0]):
                     station_item = QtGui.QTreeWidgetItem([
-                        station._station_name.split(".")[-1]],
+                        station_name.split(".")[-1]],
                         type=STATION_VIEW_ITEM_TYPES["STATION"])
-
-                    # Add children.
-                    children = []
-                    if "StationXML" in station.list():
-                        children.append(
-                            QtGui.QTreeWidgetItem(
-                                ["StationXML"],
-                                type=STATION_VIEW_ITEM_TYPES["STATIONXML"]))
-                    for waveform in station.get_waveform_tags():
-                        children.append(
-                            QtGui.QTreeWidgetItem(
-                                [waveform],
-                                type=STATION_VIEW_ITEM_TYPES["WAVEFORM"]))
-                    station_item.addChildren(children)
-
+                    station_item.addChildren(
+                        get_children(has_stationxml, waveform_tags))
                     network_item.addChild(station_item)
                 items.append(network_item)
 
         else:
             # Add all the waveforms and stations.
-            for station in self.ds.waveforms:
+            for station_name, has_stationxml, waveform_tags in station_data:
                 item = QtGui.QTreeWidgetItem(
-                    [station._station_name],
+                    [station_name],
                     type=STATION_VIEW_ITEM_TYPES["STATION"])
-
-                # Add children.
-                children = []
-                if "StationXML" in station.list():
-                    children.append(
-                        QtGui.QTreeWidgetItem(
-                            ["StationXML"],
-                            type=STATION_VIEW_ITEM_TYPES["STATIONXML"]))
-                for waveform in station.get_waveform_tags():
-                    children.append(
-                        QtGui.QTreeWidgetItem(
-                            [waveform],
-                            type=STATION_VIEW_ITEM_TYPES["WAVEFORM"]))
-                item.addChildren(children)
-
+                item.addChildren(get_children(has_stationxml, waveform_tags))
                 items.append(item)
 
         self.ui.station_view.insertTopLevelItems(0, items)
@@ -396,20 +525,35 @@ class Window(QtGui.QMainWindow):
         self.reset_view()
 
     def show_provenance_for_id(self, prov_id):
+        prov_index = self._state.get("provenance_index")
         try:
-            info = \
-                self.ds.provenance.get_provenance_document_for_id(prov_id)
-        except ASDFValueError as e:
-            msg_box = QtGui.QMessageBox()
-            msg_box.setText(e.args[0])
-            msg_box.exec_()
-            return
+            name, row = prov_index[prov_id]
+            item = self.provenance_list_model.item(row)
+        except (TypeError, KeyError):
+            # Let pyasdf parse the documents if the index is still being
+            # built or if some documents could not be indexed.
+            if prov_index is not None and \
+                    not self._state.get("unindexed_provenance_documents"):
+                msg_box = QtGui.QMessageBox()
+                msg_box.setText("Document containing id '%s' not found in "
+                                "the data set." % prov_id)
+                msg_box.exec_()
+                return
+            try:
+                info = \
+                    self.ds.provenance.get_provenance_document_for_id(prov_id)
+            except pyasdf_exceptions.ASDFValueError as e:
+                msg_box = QtGui.QMessageBox()
+                msg_box.setText(e.args[0])
+                msg_box.exec_()
+                return
+            name = info["name"]
+            # Find the item.
+            item = self.provenance_list_model.findItems(name)[0]
 
-        # Find the item.
-        item = self.provenance_list_model.findItems(info["name"])[0]
         index = self.provenance_list_model.indexFromItem(item)
         self.ui.provenance_list_view.setCurrentIndex(index)
-        self.show_provenance_document(info["name"])
+        self.show_provenance_document(name)
         self.ui.central_tab.setCurrentWidget(self.ui.provenance_tab)
 
     def show_referenced_object(self, object_type, object_id):
@@ -477,122 +621,325 @@ class Window(QtGui.QMainWindow):
                     self.ui.references_push_button.pos()))
 
     def create_asdf_sql(self, sta):
-        # Function to separate the waveform string into seperate fields
-        def waveform_sep(ws):
-            a = ws.split('__')
-            starttime = int(UTCDateTime(a[1].encode('ascii')).timestamp)
-            endtime = int(UTCDateTime(a[2].encode('ascii')).timestamp)
-
-            # Returns: (station_id, starttime, endtime, waveform_tag)
-            return (ws.encode('ascii'), a[0].encode('ascii'), starttime, endtime, a[3].encode('ascii'))
+        # Archives of many files have one index for all stations.
+        if self._is_virtual():
+            return
 
         # Get the SQL file for station
-        SQL_filename = r""+os.path.dirname(self.filename)+ '/' + str(sta.split('.')[1]) + '.db'
-
-        check_SQL = exists(SQL_filename)
-
-        if check_SQL:
+        SQL_filename = waveform_index.get_index_filename(self.filename, sta)
+        if os.path.exists(SQL_filename):
             return
+
         # need to create SQL database
-        elif not check_SQL:
-            # Initialize (open/create) the sqlalchemy sqlite engine
-            engine = create_engine('sqlite:///' + SQL_filename)
-            Session = sessionmaker()
+        progressDialog = QtGui.QProgressDialog(
+            "Building SQL Library for Station {0}".format(str(sta)),
+            "Cancel", 0, 0)
 
-            # Get list of all waveforms for station
-            waveforms_list = self.ds.waveforms[str(sta)].list()
-            #remove the station XML file
-            waveforms_list.remove('StationXML')
+        def progress(current, total):
+            progressDialog.setMaximum(total)
+            progressDialog.setValue(current)
+            return not progressDialog.wasCanceled()
 
-            # Create all tables in the engine
-            Base.metadata.create_all(engine)
+        with profiling.span("create_asdf_sql", "sqlite", station=sta):
+            waveform_index.build_index(self.ds, sta, SQL_filename,
+                                       progress_callback=progress)
+        progressDialog.close()
 
-            # Initiate a session with the SQL database so that we can add data to it
-            Session.configure(bind=engine)
-            session = Session()
+    def open_asdf_file(self):
+        filename = str(QtGui.QFileDialog.getOpenFileName(
+            parent=self, caption="Choose File",
+            directory=os.path.expanduser("~"),
+            filter="ASDF files (*.h5)"))
+        if not filename:
+            return
+        self.load_asdf_file(filename)
 
-            progressDialog = QtGui.QProgressDialog("Building SQL Library for Station {0}".format(str(sta)),
-                                                   "Cancel", 0, len(waveforms_list))
+    def open_asdf_directory(self):
+        directory = str(QtGui.QFileDialog.getExistingDirectory(
+            parent=self, caption="Choose Directory of ASDF Files",
+            directory=os.path.expanduser("~")))
+        if not directory:
+            return
+        self.load_asdf_file(directory)
 
-            # go through the waveforms (ignore stationxml file)
-            for _i, sta_wave in enumerate(waveforms_list):
-                progressDialog.setValue(_i)
+    def load_asdf_file(self, filename):
+        """
+        Loads a new file. The file is opened and the different panels are
+        filled in background threads so the GUI stays responsive.
 
-                # The ASDF formatted waveform name for SQL [full_id, station_id, starttime, endtime, tag]
-                waveform_info = waveform_sep(sta_wave)
+        A directory or glob pattern opens all ASDF files in it as one virtual
+        data set, see :mod:`virtual_archive`.
+        """
+        self.filename = filename
+        virtual = os.path.isdir(filename) or glob.has_magic(filename)
+
+        # Results of previously started open operations are discarded.
+        generation = self._state.get("open_generation", 0) + 1
+        self._state = {"open_generation": generation,
+                       "open_phase_timings": [],
+                       "virtual": virtual}
+        if self.ds is not None:
+            self._retired_datasets.append(self.ds)
+            self._close_datasets_timer.start()
+        self.ds = None
+        self._waveform_mapping = None
+        self._prefetcher.clear()
+        self._waveform_cache.clear()
+        self._stream_filter = None
+        self._response_remover = None
+        self._map_highlights.reset()
+        # Queued renders of the previous file are skipped.
+        self._provenance_jobs.clear()
+        self.ui.previous_view_push_button.setEnabled(False)
 
-                # create new SQL entry
-                new_wave_SQL = Waveforms(full_id=waveform_info[0], station_id=waveform_info[1],
-                                         starttime=waveform_info[2],
-                                         endtime=waveform_info[3], tag=waveform_info[4])
+        self.ui.station_view.clear()
+        self.ui.availability_graph.clear()
+        self.ui.event_tree_widget.clear()
+        self.ui.auxiliary_data_tree_view.clear()
+        self.provenance_list_model.clear()
+        self.update_status_bar("Indexing files..." if virtual else
+                               "Opening file...")
+
+        def callback(fct):
+            # Only call the callback if no other file has been opened since.
+            def _callback(*args):
+                if self._state.get("open_generation") != generation:
+                    return
+                fct(*args)
+            return _callback
+
+        def on_load_error(exception, tb):
+            print(tb, file=sys.stderr)
+            self.update_status_bar("Failed to read %s" % filename)
+
+        def on_opened(ds, runtime):
+            self.ds = ds
+            if not virtual:
+                self._waveform_mapping = waveform_mmap.WaveformMapping(
+                    filename)
+            self.add_open_phase_timing("open", runtime)
+
+            run_in_background(ds.get_all_coordinates,
+                              callback(self._on_coordinates_loaded),
+                              error_callback=callback(on_load_error))
+            run_in_background(get_station_view_data,
+                              callback(self._on_station_data_loaded),
+                              error_callback=callback(on_load_error),
+                              args=(ds,))
+            run_in_background(lambda: ds.events,
+                              callback(self._on_events_loaded),
+                              error_callback=callback(on_load_error))
+            if virtual:
+                # Provenance and auxiliary data are not part of the index.
+                self._on_provenance_loaded([], 0.0)
+                self._on_auxiliary_data_loaded([], 0.0)
+                return
+            run_in_background(ds.provenance.list,
+                              callback(self._on_provenance_loaded),
+                              error_callback=callback(on_load_error))
+            run_in_background(auxiliary_data_tree.list_data_types,
+                              callback(self._on_auxiliary_data_loaded),
+                              error_callback=callback(on_load_error),
+                              args=(ds,))
+
+        def on_error(exception, tb):
+            print(tb, file=sys.stderr)
+            self.update_status_bar("Failed to open file: %s" % filename)
+            msg_box = QtGui.QMessageBox()
+            msg_box.setIcon(QtGui.QMessageBox.Critical)
+            msg_box.setText("Could not open file %s" % filename)
+            msg_box.setDetailedText(tb)
+            msg_box.exec_()
 
-                # Add the waveform info to the session
-                session.add(new_wave_SQL)
-                session.commit()
+        run_in_background(
+            virtual_archive.open_virtual_dataset if virtual else
+            pyasdf.ASDFDataSet, callback(on_opened),
+            error_callback=callback(on_error), args=(filename,))
 
-    def open_asdf_file(self):
+    def _close_retired_datasets(self):
         """
-        Fill the station tree widget upon opening a new file.
+        Closes the data sets of previously opened files once the background
+        threads that might still read them are done.
         """
-        self.filename = str(QtGui.QFileDialog.getOpenFileName(
-            parent=self, caption="Choose File",
-            directory=os.path.expanduser("~"),
-            filter="ASDF files (*.h5)"))
-        if not self.filename:
+        if QtCore.QThreadPool.globalInstance().activeThreadCount() or \
+                self._provenance_pool.activeThreadCount():
+            self._close_datasets_timer.start()
             return
+        while self._retired_datasets:
+            ds = self._retired_datasets.pop()
+            # pyasdf has no public method to close a file.
+            close = getattr(ds, "close", None) or ds._close
+            close()
 
-        self.ds = pyasdf.ASDFDataSet(self.filename)
+    def _is_virtual(self):
+        """
+        True if many files are open as one virtual data set.
+        """
+        return self._state.get("virtual", False)
 
-        for station_id, coordinates in self.ds.get_all_coordinates().items():
+    def _get_interval_extractor(self):
+        """
+        Returns a function ``f(st_ids, st_tags, starttime, endtime)``
+        extracting an interval from the open file or archive. It does not
+        touch any widgets and can be called in background threads.
+        """
+        if self._is_virtual():
+            return self.ds.extract_interval
+        return functools.partial(extraction.extract_interval, self.ds,
+                                 self.filename,
+                                 mapping=self._waveform_mapping)
+
+    def _get_stationxml(self, station):
+        if self._is_virtual():
+            return self.ds.get_stationxml(station)
+        return self.ds.waveforms[station].StationXML
+
+    def _on_coordinates_loaded(self, coordinates, runtime):
+        self._state["station_coordinates"] = coordinates
+        for station_id, coordinates in coordinates.items():
             if not coordinates:
                 continue
+            self._map_highlights.add_known_stations([station_id])
             js_call = "addStation('{station_id}', {latitude}, {longitude})"
-            self.ui.web_view.page().mainFrame().evaluateJavaScript(
+            self.evaluate_javascript(
+                self.ui.web_view,
                 js_call.format(station_id=station_id,
                                latitude=coordinates["latitude"],
                                longitude=coordinates["longitude"]))
+        self.add_open_phase_timing("map", runtime)
 
-        self.build_station_view_list()
-        self.build_event_tree_view()
+    def _on_station_data_loaded(self, station_data, runtime):
+        self.build_station_view_list(station_data)
+        self.add_open_phase_timing("stations", runtime)
 
+    def _on_events_loaded(self, events, runtime):
+        self.build_event_tree_view(events)
+        self.add_open_phase_timing("events", runtime)
+
+    def _on_provenance_loaded(self, provenance_names, runtime):
         # Add all the provenance items
         self.provenance_list_model.clear()
-        for provenance in self.ds.provenance.list():
+        for provenance in provenance_names:
             item = QtGui.QStandardItem(provenance)
             self.provenance_list_model.appendRow(item)
+        self.add_open_phase_timing("provenance", runtime)
+
+        # Index the record ids so references can be followed instantly.
+        generation = self._state["open_generation"]
+
+        def on_indexed(result, runtime):
+            if self._state.get("open_generation") != generation:
+                return
+            prov_index, unparsable = result
+            self._state["unindexed_provenance_documents"] = unparsable
+            self._state["provenance_index"] = prov_index
+            self.add_open_phase_timing("provenance index", runtime)
+
+        run_in_background(provenance_index.build_provenance_index,
+                          on_indexed, args=(self.ds, provenance_names))
+
+        # Prerender all graphs so they can be shown instantly.
+        for provenance in provenance_names:
+            self.render_provenance_document(provenance)
+
+    def _on_auxiliary_data_loaded(self, data_types, runtime):
+        # Only the data types are listed, groups are filled when expanded.
+        self.ui.auxiliary_data_tree_view.insertTopLevelItems(
+            0, [self._create_auxiliary_data_item(*_i) for _i in data_types])
+        # Spectrograms computed in earlier sessions.
+        self._add_spectrogram_items(self._get_spectral_cache().keys())
+        self.add_open_phase_timing("auxiliary data", runtime)
+
+    def _create_auxiliary_data_item(self, name, child_count):
+        if child_count is None:
+            item = QtGui.QTreeWidgetItem(
+                [name],
+                type=AUX_DATA_ITEM_TYPES["DATA_ITEM"])
+        else:
+            item = QtGui.QTreeWidgetItem(
+                ["%s (%i)" % (name, child_count)],
+                type=AUX_DATA_ITEM_TYPES["DATA_TYPE"])
+            item.setChildIndicatorPolicy(QtGui.QTreeWidgetItem.ShowIndicator)
+        item.setData(0, QtCore.Qt.UserRole, name)
+        return item
+
+    def _get_auxiliary_data_name(self, item):
+        data = item.data(0, QtCore.Qt.UserRole)
+        # Compat for different pyqt/sip versions.
+        try:
+            data = data.toString()
+        except AttributeError:
+            pass
+        return str(data)
 
-        # Also add the auxiliary data.
-
-        def recursive_tree(name, item):
-            if isinstance(item, pyasdf.utils.AuxiliaryDataAccessor):
-                data_type_item = QtGui.QTreeWidgetItem(
-                    [name],
-                    type=AUX_DATA_ITEM_TYPES["DATA_TYPE"])
-                children = []
-                for sub_item in item.list():
-                    children.append(recursive_tree(sub_item, item[sub_item]))
-                data_type_item.addChildren(children)
-            elif isinstance(item, pyasdf.utils.AuxiliaryDataContainer):
-                data_type_item = QtGui.QTreeWidgetItem(
-                    [name],
-                    type=AUX_DATA_ITEM_TYPES["DATA_ITEM"])
-            else:
-                raise NotImplementedError
-            return data_type_item
+    def _get_auxiliary_data_path(self, item):
+        """
+        Names of all parents of the item, outermost first.
+        """
+        path = []
+        p = item.parent()
+        while p is not None:
+            path.append(self._get_auxiliary_data_name(p))
+            p = p.parent()
+        path.reverse()
+        return path
 
-        items = []
-        for data_type in self.ds.auxiliary_data.list():
-            items.append(recursive_tree(data_type,
-                                        self.ds.auxiliary_data[data_type]))
-        self.ui.auxiliary_data_tree_view.insertTopLevelItems(0, items)
+    def _load_auxiliary_data_children(self, item):
+        """
+        Adds the next batch of children to an auxiliary data group item.
+        """
+        # Remove a previous "load more" item.
+        start = item.childCount()
+        if start and item.child(start - 1).type() == \
+                AUX_DATA_ITEM_TYPES["LOAD_MORE"]:
+            item.removeChild(item.child(start - 1))
+            start -= 1
+
+        path = self._get_auxiliary_data_path(item)
+        path.append(self._get_auxiliary_data_name(item))
+        children, total = auxiliary_data_tree.list_children(
+            self.ds, path, start=start)
+
+        items = [self._create_auxiliary_data_item(*_i) for _i in children]
+        if start + len(items) < total:
+            items.append(QtGui.QTreeWidgetItem(
+                ["... load more (%i remaining)" % (
+                    total - start - len(items))],
+                type=AUX_DATA_ITEM_TYPES["LOAD_MORE"]))
+        item.addChildren(items)
+        if not total:
+            item.setChildIndicatorPolicy(
+                QtGui.QTreeWidgetItem.DontShowIndicatorWhenChildless)
+
+    def on_auxiliary_data_tree_view_itemExpanded(self, item):
+        if item.type() != AUX_DATA_ITEM_TYPES["DATA_TYPE"] or \
+                item.childCount():
+            return
+        self._load_auxiliary_data_children(item)
+
+    def add_open_phase_timing(self, phase, runtime):
+        self._state["open_phase_timings"].append((phase, runtime))
+        # The phases run in background threads, record them once finished.
+        profiling.record("open_asdf_file: %s" % phase, "open",
+                         time.time() - runtime, runtime,
+                         filename=self.filename)
+        self.update_status_bar()
+
+    def update_status_bar(self, message=None):
+        if message is None:
+            message = "File: %s    (%s)" % (self.ds.filename,
+                                            self.ds.pretty_filesize)
+            timings = self._state.get("open_phase_timings")
+            if timings:
+                message += "    Loaded: " + ", ".join(
+                    "%s %.2fs" % _i for _i in timings)
 
         sb = self.ui.status_bar
         if hasattr(sb, "_widgets"):
             for i in sb._widgets:
                 sb.removeWidget(i)
 
-        w = QtGui.QLabel("File: %s    (%s)" % (self.ds.filename,
-                                               self.ds.pretty_filesize))
+        w = QtGui.QLabel(message)
         sb._widgets = [w]
         sb.addPermanentWidget(w)
         w.show()
@@ -605,13 +952,102 @@ class Window(QtGui.QMainWindow):
     def on_normalize_check_box_stateChanged(self, state):
         self.update_waveform_plot()
 
+    def on_shared_time_axis_check_box_stateChanged(self, state):
+        self.update_waveform_plot()
+
     def on_group_by_network_check_box_stateChanged(self, state):
         self.build_station_view_list()
 
+    def on_remove_response_check_box_stateChanged(self, state):
+        self.ui.response_output_combo_box.setEnabled(
+            self.ui.remove_response_check_box.isChecked())
+        self.filter_settings_changed()
+
+    def filter_type_changed(self, index):
+        filter_type = self._get_filter_type()
+        self.ui.filter_freqmin_spin_box.setEnabled(
+            filter_type in ("bandpass", "highpass"))
+        self.ui.filter_freqmax_spin_box.setEnabled(
+            filter_type in ("bandpass", "lowpass"))
+        self.ui.filter_corners_spin_box.setEnabled(filter_type is not None)
+        self.filter_settings_changed()
+
+    def filter_settings_changed(self):
+        if getattr(self, "st", None):
+            self.update_waveform_plot()
+
+    def _get_filter_type(self):
+        index = self.ui.filter_type_combo_box.currentIndex()
+        # The first entry is no filter.
+        if index <= 0:
+            return None
+        return filtering.FILTER_TYPES[index - 1]
+
+    def _get_filter_settings(self):
+        """
+        Returns the :class:`filtering.FilterSettings` of the filter bar or
+        None if no filter is selected.
+        """
+        filter_type = self._get_filter_type()
+        if filter_type is None:
+            return None
+        return filtering.FilterSettings(
+            filter_type, self.ui.filter_freqmin_spin_box.value(),
+            self.ui.filter_freqmax_spin_box.value(),
+            self.ui.filter_corners_spin_box.value())
+
+    def filter_stream(self, st, settings):
+        """
+        Filters a stream, continuing the filter of previously shown
+        intervals so only new samples are filtered. Intervals of continuous
+        data that do not continue a shown one, e.g. when paging backwards,
+        start after filtering a pre-roll of the preceding data.
+        """
+        if self._stream_filter is None:
+            self._stream_filter = filtering.StreamingFilter()
+        read_preroll = self._get_interval_extractor() \
+            if "interval" in self._state else None
+        with profiling.span("filter_stream", "numpy",
+                            filter=settings.type) as args:
+            samples = self._stream_filter.filtered_samples
+            filtered = self._stream_filter.filter(
+                st, settings, read_preroll=read_preroll)
+            args["filtered_samples"] = \
+                self._stream_filter.filtered_samples - samples
+        return filtered
+
+    def remove_response(self, st, output):
+        """
+        Removes the instrument responses of a stream. The frequency
+        responses are only evaluated once per channel, number of samples,
+        sampling rate and output.
+        """
+        if self._response_remover is None:
+            self._response_remover = response_removal.ResponseRemover(
+                self._get_stationxml)
+        with profiling.span("remove_response", "numpy",
+                            output=output) as args:
+            evaluations = self._response_remover.evaluations
+            corrected, missing = self._response_remover.remove_response(
+                st, output=output)
+            args["evaluated_responses"] = \
+                self._response_remover.evaluations - evaluations
+        if missing:
+            self.update_status_bar("No instrument response for %s" %
+                                   ", ".join(missing))
+        return corrected
+
     def update_waveform_plot(self):
+        with profiling.span("update_waveform_plot", "pyqtgraph") as args:
+            self._update_waveform_plot()
+            args["traces"] = len(self.st)
+            args["points"] = sum(tr.stats.npts for tr in self.st)
+
+    def _update_waveform_plot(self):
         self.ui.central_tab.setCurrentIndex(0)
         self.ui.initial_view_push_button.setEnabled(True)
-        self.ui.previous_view_push_button.setEnabled(True)
+        self.ui.previous_view_push_button.setEnabled(
+            len(self._state.get("view_history", [])) > 1)
         self.ui.previous_interval_push_button.setEnabled(True)
         self.ui.next_interval_push_button.setEnabled(True)
 
@@ -620,12 +1056,48 @@ class Window(QtGui.QMainWindow):
         filter_settings["detrend_and_demean"] = \
             self.ui.detrend_and_demean_check_box.isChecked()
         filter_settings["normalize"] = self.ui.normalize_check_box.isChecked()
-
-        temp_st = self.st.copy()
+        filter_settings["filter"] = self._get_filter_settings()
+        filter_settings["remove_response"] = \
+            self.ui.remove_response_check_box.isChecked()
+
+        temp_st = None
+        if filter_settings["filter"] is not None:
+            # Filtering returns new traces that can be modified in place.
+            try:
+                temp_st = self.filter_stream(self.st,
+                                             filter_settings["filter"])
+            except ValueError as e:
+                self.update_status_bar("Invalid filter: %s" % e)
+
+        if filter_settings["remove_response"]:
+            temp_st = self.remove_response(
+                temp_st if temp_st is not None else self.st,
+                response_removal.OUTPUTS[
+                    self.ui.response_output_combo_box.currentIndex()])
+
+        if temp_st is None:
+            # Only copy the traces if they are modified, otherwise memory
+            # mapped data is plotted directly.
+            if filter_settings["detrend_and_demean"] or \
+                    filter_settings["normalize"]:
+                temp_st = self.st.copy()
+            else:
+                temp_st = self.st
 
         if filter_settings["detrend_and_demean"]:
-            temp_st.detrend("linear")
-            temp_st.detrend("demean")
+            for tr in temp_st:
+                if np.ma.is_masked(tr.data):
+                    # obspy refuses masked data, the trend of the samples
+                    # around the gaps is removed instead.
+                    valid = ~np.ma.getmaskarray(tr.data)
+                    x = np.arange(tr.stats.npts, dtype=np.float64)
+                    data = tr.data.astype(np.float64)
+                    trend = np.polyfit(x[valid], data.compressed(), 1) \
+                        if valid.sum() > 1 else [0.0, data.mean()]
+                    tr.data = data - np.polyval(trend, x)
+                else:
+                    tr.detrend("linear")
+                    tr.detrend("demean")
 
         if filter_settings["normalize"]:
             temp_st.normalize()
@@ -637,14 +1109,23 @@ class Window(QtGui.QMainWindow):
         min_values = []
         max_values = []
 
+        # All plots are linked so it suffices if only the bottom one shows the
+        # time axis.
+        shared_time_axis = self.ui.shared_time_axis_check_box.isChecked()
+
         self._state["waveform_plots"] = []
         self._state["station_id"] = []
         self._state["station_tag"] = []
+        self._state["plotted_stations"] = set()
         for _i, tr in enumerate(temp_st):
-            plot = self.ui.graph.addPlot(
-                _i, 0, title=tr.id,
-                axisItems={'bottom': DateAxisItem(orientation='bottom',
-                                                  utcOffset=0)})
+            if shared_time_axis and _i != len(temp_st) - 1:
+                plot = self.ui.graph.addPlot(_i, 0, title=tr.id)
+                plot.hideAxis('bottom')
+            else:
+                plot = self.ui.graph.addPlot(
+                    _i, 0, title=tr.id,
+                    axisItems={'bottom': DateAxisItem(orientation='bottom',
+                                                      utcOffset=0)})
             plot.show()
             self._state["waveform_plots"].append(plot)
             self._state["station_id"].append(tr.stats.network+'.'+
@@ -652,7 +1133,15 @@ class Window(QtGui.QMainWindow):
                                                tr.stats.location+'.'+
                                                tr.stats.channel)
             self._state["station_tag"].append(str(tr.stats.asdf.tag))
-            plot.plot(tr.times() + tr.stats.starttime.timestamp, tr.data)
+            self._state["plotted_stations"].add(
+                tr.stats.network + '.' + tr.stats.station)
+            if np.ma.isMaskedArray(tr.data):
+                # Do not draw lines across gaps.
+                plot.plot(tr.times() + tr.stats.starttime.timestamp,
+                          tr.data.astype(np.float64).filled(np.nan),
+                          connect="finite")
+            else:
+                plot.plot(tr.times() + tr.stats.starttime.timestamp, tr.data)
             starttimes.append(tr.stats.starttime)
             endtimes.append(tr.stats.endtime)
             min_values.append(tr.data.min())
@@ -670,34 +1159,161 @@ class Window(QtGui.QMainWindow):
 
         self.reset_view()
 
-    def on_previous_interval_push_button_released(self):
-        # Get start and end time of previous interval with 10% overlap
-        starttime = UTCDateTime(self._state["waveform_plots_min_time"])
-        endtime = UTCDateTime(self._state["waveform_plots_max_time"])
+    def _get_current_interval(self):
+        """
+        The currently shown interval as timestamps. This is the requested
+        interval if extracted from continuous data, otherwise the time span
+        of the plotted traces.
+        """
+        if "interval" in self._state:
+            return self._state["interval"]
+        return (self._state["waveform_plots_min_time"].timestamp,
+                self._state["waveform_plots_max_time"].timestamp)
+
+    def show_waveforms(self, st, keys, interval=None):
+        """
+        Plots a stream and appends it to the view history.
+
+        :param keys: The waveform cache keys of the traces, used to show the
+            view again.
+        :param interval: The interval as timestamps if extracted from
+            continuous data.
+        """
+        history = self._state.setdefault("view_history", [])
+        history.append({"keys": keys, "interval": interval})
+        del history[:-MAX_VIEW_HISTORY]
+        self._show_view(st, interval)
+
+    def _show_view(self, st, interval):
+        self.st = st
+        if interval is None:
+            self._state.pop("interval", None)
+        else:
+            self._state["interval"] = interval
+        self.update_waveform_plot()
+        if interval is not None:
+            self.prefetch_adjacent_intervals()
 
-        delta_time = endtime - starttime
-        overlap_time = delta_time * 0.1
+    def on_previous_view_push_button_released(self):
+        history = self._state.get("view_history", [])
+        if len(history) < 2:
+            return
+        history.pop()
+        view = history[-1]
+        # Traces evicted from the cache in the meantime are read again.
+        self._show_view(self.get_waveforms(view["keys"]), view["interval"])
 
-        self.new_start_time = starttime - (delta_time - overlap_time)
-        self.new_end_time = starttime + overlap_time
+    def get_waveforms(self, keys):
+        """
+        Returns a stream with the traces of the given waveform cache keys,
+        only reading the traces not in the cache.
+        """
+        st = Stream()
+        for key in keys:
+            tr = self.get_trace(key)
+            if tr is not None:
+                st.append(tr)
+        return st
+
+    def get_trace(self, key):
+        """
+        Returns the trace of a waveform cache key from the cache or reads it.
+        Returns None if there is no data.
+        """
+        tr = self._waveform_cache.get(key)
+        if tr is not None:
+            return tr
+        name, starttime, endtime = key
+        if starttime is None:
+            # The name is the full ASDF waveform name.
+            station = ".".join(name.split(".")[:2])
+            if self._is_virtual():
+                traces = [self.ds.read_waveform(station, name)]
+            else:
+                traces = [waveform_mmap.read_waveform(
+                    self.ds, station, name, self._waveform_mapping)]
+        else:
+            seed_id, tag = name.split("__")
+            traces = self._get_interval_extractor()(
+                [seed_id], [tag], starttime, endtime)
+        if not traces:
+            return None
+        self._waveform_cache.put(key, traces[0])
+        return traces[0]
+
+    def cache_interval(self, st, starttime, endtime, st_ids=(),
+                       st_tags=()):
+        """
+        Puts the traces of an interval extracted from continuous data into
+        the waveform cache. The requested channels and tags without data
+        are cached as empty.
+        """
+        keys = set()
+        for tr in st:
+            key = get_trace_key(tr.id, tr.stats.asdf.tag, starttime, endtime)
+            self._waveform_cache.put(key, tr)
+            keys.add(key)
+        for st_id, tag in zip(st_ids, st_tags):
+            key = get_trace_key(st_id, tag, starttime, endtime)
+            if key not in keys:
+                self._waveform_cache.put_empty(key)
+
+    def configure_waveform_cache(self):
+        stats = self._waveform_cache.stats()
+        label = ("%i traces, %s of %s used.\n"
+                 "Hits: %i, misses: %i, evictions: %i\n\n"
+                 "Memory budget in MB:" % (
+                     stats["entries"], sizeof_fmt(stats["bytes"]),
+                     sizeof_fmt(stats["max_bytes"]), stats["hits"],
+                     stats["misses"], stats["evictions"]))
+        value, ok = QtGui.QInputDialog.getInt(
+            self, "Waveform Cache", label, stats["max_bytes"] // 1024 ** 2,
+            0, 1024 ** 2)
+        if ok:
+            self._waveform_cache.set_max_bytes(value * 1024 ** 2)
+
+    def on_previous_interval_push_button_released(self):
+        # Get start and end time of previous interval with 10% overlap
+        starttime, endtime = extraction.adjacent_interval(
+            *self._get_current_interval(), direction=-1)
+        self.new_start_time = UTCDateTime(starttime)
+        self.new_end_time = UTCDateTime(endtime)
 
         self.extract_from_continuous(True, st_ids=self._state["station_id"],
                                      st_tags=self._state["station_tag"])
 
     def on_next_interval_push_button_released(self):
         # Get start and end time of next interval with 10% overlap
-        starttime = UTCDateTime(self._state["waveform_plots_min_time"])
-        endtime = UTCDateTime(self._state["waveform_plots_max_time"])
-
-        delta_time = endtime - starttime
-        overlap_time = delta_time * 0.1
-
-        self.new_start_time = endtime - (overlap_time)
-        self.new_end_time = endtime + (delta_time - overlap_time)
+        starttime, endtime = extraction.adjacent_interval(
+            *self._get_current_interval(), direction=1)
+        self.new_start_time = UTCDateTime(starttime)
+        self.new_end_time = UTCDateTime(endtime)
 
         self.extract_from_continuous(True, st_ids = self._state["station_id"],
                                      st_tags = self._state["station_tag"])
 
+    def prefetch_adjacent_intervals(self):
+        """
+        Loads the previous and next intervals of the shown channels in the
+        background so paging can show them instantly.
+        """
+        st_ids = tuple(self._state["station_id"])
+        st_tags = tuple(self._state["station_tag"])
+        for direction in (1, -1):
+            starttime, endtime = extraction.adjacent_interval(
+                *self._state["interval"], direction=direction)
+            # Same rounding as when paging.
+            starttime = UTCDateTime(starttime).timestamp
+            endtime = UTCDateTime(endtime).timestamp
+            if all(get_trace_key(st_id, tag, starttime, endtime) in
+                   self._waveform_cache
+                   for st_id, tag in zip(st_ids, st_tags)):
+                continue
+            self._prefetcher.prefetch(
+                (st_ids, st_tags, starttime, endtime),
+                self._get_interval_extractor(), st_ids, st_tags, starttime,
+                endtime)
+
     def reset_view(self):
         self._state["waveform_plots"][0].setXRange(
             self._state["waveform_plots_min_time"].timestamp,
@@ -711,10 +1327,64 @@ class Window(QtGui.QMainWindow):
         self._state["waveform_plots"][0].setYRange(min_v, max_v)
 
     def show_provenance_document(self, document_name):
-        doc = self.ds.provenance[document_name]
-        doc.plot(filename=self._tempfile, use_labels=True)
-
-        self.ui.provenance_graphics_view.open_file(self._tempfile)
+        """
+        Shows a provenance graph. Graphs that have not been rendered yet are
+        rendered in the background and shown once done.
+        """
+        self._state["current_provenance_document"] = document_name
+        # Keys of documents are only known once they have been read in the
+        # background.
+        key = self._state.setdefault("provenance_keys", {}).get(
+            document_name)
+        with profiling.span("show_provenance_document", "provenance",
+                            document=document_name) as args:
+            filename = self._provenance_cache.get(key) if key else None
+            args["cached"] = filename is not None
+            if filename is not None:
+                self.ui.provenance_graphics_view.open_file(filename)
+                return
+        # Selected documents are rendered before prerendered ones.
+        self.render_provenance_document(document_name, priority=1)
+
+    def render_provenance_document(self, document_name, priority=0):
+        """
+        Renders a provenance graph in the background. It is shown once done
+        if it is still the selected document.
+        """
+        jobs = self._provenance_jobs
+        job = jobs.submit(document_name, priority)
+        if job is None:
+            return
+        generation = self._state.get("open_generation")
+        ds = self.ds
+        cache = self._provenance_cache
+
+        def render():
+            if not jobs.start(document_name, job):
+                return None
+            try:
+                # Reading the document to compute the key is done here so
+                # it never blocks the GUI.
+                with profiling.span("render_provenance_document",
+                                    "provenance", document=document_name):
+                    key = cache.get_key(ds, document_name)
+                    return key, cache.render(ds, document_name, key)
+            finally:
+                jobs.finish(document_name, job)
+
+        def on_rendered(result, runtime):
+            if result is None or \
+                    self._state.get("open_generation") != generation:
+                return
+            key, filename = result
+            self._state.setdefault("provenance_keys", {})[document_name] = \
+                key
+            if self._state.get("current_provenance_document") == \
+                    document_name:
+                self.ui.provenance_graphics_view.open_file(filename)
+
+        run_in_background(render, on_rendered, pool=self._provenance_pool,
+                          priority=priority)
 
     def on_station_view_itemClicked(self, item, column):
         t = item.type()
@@ -731,15 +1401,25 @@ class Window(QtGui.QMainWindow):
             station = get_station(item)
             #Run Method to create ASDF SQL database with SQLite (one db per station within ASDF)
             self.create_asdf_sql(station)
+            self.show_availability(station)
         elif t == STATION_VIEW_ITEM_TYPES["STATIONXML"]:
             station = get_station(item.parent())
-            self.ds.waveforms[station].StationXML.plot()#plot_response(0.001)
+            self._get_stationxml(station).plot()#plot_response(0.001)
         elif t == STATION_VIEW_ITEM_TYPES["WAVEFORM"]:
             station = get_station(item.parent())
-            self._state["current_station_object"] = self.ds.waveforms[station]
+            tag = str(item.text(0))
+            if self._is_virtual():
+                # The waveforms might be spread over many files.
+                self._state.pop("current_station_object", None)
+                names = self.ds.list_waveforms(station, tag)
+            else:
+                self._state["current_station_object"] = \
+                    self.ds.waveforms[station]
+                names = [name for name in self.ds.waveforms[station].list()
+                         if name.endswith("__" + tag)]
             self._state["current_waveform_tag"] = item.text(0)
-            self.st = self.ds.waveforms[station][str(item.text(0))]
-            self.update_waveform_plot()
+            keys = [(name, None, None) for name in names]
+            self.show_waveforms(self.get_waveforms(keys), keys)
         else:
             pass
 
@@ -763,7 +1443,11 @@ class Window(QtGui.QMainWindow):
             pass
         elif t == STATION_VIEW_ITEM_TYPES["STATION"]:
             station = get_station(item)
-            wave_tag_list = self.ds.waveforms[station].get_waveform_tags()
+            if self._is_virtual():
+                wave_tag_list = self.ds.get_waveform_tags(station)
+            else:
+                wave_tag_list = \
+                    self.ds.waveforms[station].get_waveform_tags()
 
             # Run Method to create ASDF SQL database with SQLite (one db per station within ASDF)
             self.create_asdf_sql(station)
@@ -780,6 +1464,15 @@ class Window(QtGui.QMainWindow):
 
             self.sta_item_menu.addMenu(ext_menu)
 
+            spectrogram_menu = QtGui.QMenu('Compute Spectrograms', self)
+            for wave_tag in wave_tag_list:
+                action = QtGui.QAction(wave_tag, self)
+                action.triggered.connect(
+                    lambda checked=False, tag=wave_tag:
+                    self.compute_spectrograms(station, tag))
+                spectrogram_menu.addAction(action)
+            self.sta_item_menu.addMenu(spectrogram_menu)
+
             self.action = self.sta_item_menu.exec_(self.ui.station_view.viewport().mapToGlobal(position))
 
     def on_event_tree_widget_itemClicked(self, item, column):
@@ -789,7 +1482,7 @@ class Window(QtGui.QMainWindow):
 
         text = str(item.text(0))
 
-        res_id = obspy.core.event.ResourceIdentifier(id=text)
+        res_id = obspy_event.ResourceIdentifier(id=text)
 
         obj = res_id.get_referred_object()
         if obj is None:
@@ -807,7 +1500,7 @@ class Window(QtGui.QMainWindow):
             event = str(item.parent().parent().text(0))
 
         js_call = "highlightEvent('{event_id}');".format(event_id=event)
-        self.ui.events_web_view.page().mainFrame().evaluateJavaScript(js_call)
+        self.evaluate_javascript(self.ui.events_web_view, js_call)
 
     def event_tree_widget_rightClicked(self, position):
         item = self.ui.event_tree_widget.selectedItems()[0]
@@ -816,7 +1509,7 @@ class Window(QtGui.QMainWindow):
         if t not in EVENT_VIEW_ITEM_TYPES.values():
             return
         text = str(item.text(0))
-        res_id = obspy.core.event.ResourceIdentifier(id=text)
+        res_id = obspy_event.ResourceIdentifier(id=text)
 
         obj = res_id.get_referred_object()
         if obj is None:
@@ -857,54 +1550,37 @@ class Window(QtGui.QMainWindow):
 
     def on_auxiliary_data_tree_view_itemClicked(self, item, column):
         t = item.type()
-        if t != AUX_DATA_ITEM_TYPES["DATA_ITEM"]:
+        if t == AUX_DATA_ITEM_TYPES["LOAD_MORE"]:
+            self._load_auxiliary_data_children(item.parent())
+            return
+        elif t == AUX_DATA_ITEM_TYPES["SPECTROGRAM"]:
+            self.show_spectrogram(self._get_auxiliary_data_name(item))
+            return
+        elif t != AUX_DATA_ITEM_TYPES["DATA_ITEM"]:
             return
 
-        tag = str(item.text(0))
-
-        def recursive_path(item):
-            p = item.parent()
-            if p is None:
-                return []
-            path = [str(p.text(0))]
-            path.extend(recursive_path(p))
-            return path
+        tag = self._get_auxiliary_data_name(item)
 
         # Find the full path.
-        path = recursive_path(item)
-        path.reverse()
-
-        graph = self.ui.auxiliary_data_graph
-        graph.clear()
+        path = self._get_auxiliary_data_path(item)
 
         group = self.ds.auxiliary_data["/".join(path)]
         aux_data = group[tag]
+        self._show_auxiliary_data_details(aux_data)
 
-        if len(aux_data.data.shape) == 1 and path[0] != "Files":
-            plot = graph.addPlot(title="%s/%s" % ("/".join(path), tag))
-            plot.show()
-            plot.plot(aux_data.data.value)
-            self.ui.auxiliary_data_stacked_widget.setCurrentWidget(
-                self.ui.auxiliary_data_graph_page)
-        # Files are a bit special.
-        elif len(aux_data.data.shape) == 1 and path[0] == "Files":
-            self.ui.auxiliary_file_browser.setPlainText(
-                aux_data.file.read().decode())
-            self.ui.auxiliary_data_stacked_widget.setCurrentWidget(
-                self.ui.auxiliary_data_file_page)
-        # 2D Shapes.
-        elif len(aux_data.data.shape) == 2:
-            img = pg.ImageItem(border="#3D8EC9")
-            img.setImage(aux_data.data.value)
-            vb = graph.addViewBox()
-            vb.setAspectLocked(True)
-            vb.addItem(img)
-            self.ui.auxiliary_data_stacked_widget.setCurrentWidget(
-                self.ui.auxiliary_data_graph_page)
-        # Anything else is currently not supported.
-        else:
-            raise NotImplementedError
+        # The details are painted before any data is read.
+        generation = self._state.get("open_generation")
+
+        def show():
+            if self._state.get("open_generation") == generation:
+                self.show_auxiliary_data(path, tag, aux_data)
 
+        QtCore.QTimer.singleShot(0, show)
+
+    def _show_auxiliary_data_details(self, aux_data):
+        """
+        Fills the parameter and info tables of an auxiliary data item.
+        """
         # Show the parameters.
         tv = self.ui.auxiliary_data_detail_table_view
         tv.clear()
@@ -953,6 +1629,383 @@ class Window(QtGui.QMainWindow):
             tv.setItem(_i, 0, key_item)
             tv.setItem(_i, 1, value_item)
 
+    def show_auxiliary_data(self, path, tag, aux_data):
+        """
+        Plots an auxiliary data item. Only as many samples as can be
+        displayed are read and the visible part is refined when zooming.
+        """
+        graph = self.ui.auxiliary_data_graph
+        graph.clear()
+        self._state["auxiliary_data_view"] = None
+
+        dset = aux_data.data
+
+        if len(dset.shape) == 1 and path[0] != "Files":
+            plot = graph.addPlot(title="%s/%s" % ("/".join(path), tag))
+            plot.show()
+            # A strided preview is shown at once, the envelope of the whole
+            # array is read in the background.
+            width = max(graph.width(), 500)
+            x, y = auxiliary_data_view.read_strided_1d(
+                dset, 0, dset.shape[0], width)
+            curve = plot.plot(x, y)
+            view = {"data": dset, "viewbox": plot.getViewBox(),
+                    "curve": curve, "request": 0}
+            self._state["auxiliary_data_view"] = view
+            self._load_auxiliary_data_envelope(view, 0, dset.shape[0], width)
+            plot.getViewBox().sigRangeChanged.connect(
+                lambda *args: self._auxiliary_data_refine_timer.start())
+            self.ui.auxiliary_data_stacked_widget.setCurrentWidget(
+                self.ui.auxiliary_data_graph_page)
+        # Files are a bit special.
+        elif len(dset.shape) == 1 and path[0] == "Files":
+            self.ui.auxiliary_file_browser.setPlainText(
+                aux_data.file.read().decode())
+            self.ui.auxiliary_data_stacked_widget.setCurrentWidget(
+                self.ui.auxiliary_data_file_page)
+        # 2D Shapes.
+        elif len(dset.shape) == 2:
+            # Low resolution overview of the whole array.
+            data, rect = auxiliary_data_view.read_strided_2d(
+                dset, (0, dset.shape[0]), (0, dset.shape[1]),
+                (max(graph.width(), 1024), max(graph.height(), 1024)))
+            levels = (np.nanmin(data), np.nanmax(data))
+            img = pg.ImageItem(border="#3D8EC9")
+            img.setImage(data, levels=levels)
+            img.setRect(QtCore.QRectF(*rect))
+            # Full resolution tile of the visible area, filled on zoom.
+            detail = pg.ImageItem()
+            detail.setZValue(1)
+            detail.hide()
+            vb = graph.addViewBox()
+            vb.setAspectLocked(True)
+            vb.addItem(img)
+            vb.addItem(detail)
+            self._state["auxiliary_data_view"] = {
+                "data": dset, "viewbox": vb, "overview": img,
+                "overview_stride": max(rect[2] / float(data.shape[0]),
+                                       rect[3] / float(data.shape[1])),
+                "detail": detail, "levels": levels}
+            vb.sigRangeChanged.connect(
+                lambda *args: self._auxiliary_data_refine_timer.start())
+            self.ui.auxiliary_data_stacked_widget.setCurrentWidget(
+                self.ui.auxiliary_data_graph_page)
+        # Anything else is currently not supported.
+        else:
+            raise NotImplementedError
+
+    def _refine_auxiliary_data_view(self):
+        """
+        Rereads the visible part of the current auxiliary data item at the
+        resolution of the viewport.
+        """
+        view = self._state.get("auxiliary_data_view")
+        if not view:
+            return
+        vb = view["viewbox"]
+        x_range, y_range = vb.viewRange()
+        width, height = max(int(vb.width()), 1), max(int(vb.height()), 1)
+
+        if "curve" in view:
+            self._load_auxiliary_data_envelope(view, x_range[0],
+                                               x_range[1] + 1, width)
+            return
+
+        data, rect = auxiliary_data_view.read_strided_2d(
+            view["data"], (x_range[0], x_range[1] + 1),
+            (y_range[0], y_range[1] + 1), (width, height))
+        # Not zoomed in further than the resolution of the overview.
+        if data is None or max(rect[2] / float(data.shape[0]),
+                               rect[3] / float(data.shape[1])) >= \
+                view["overview_stride"]:
+            view["detail"].hide()
+            return
+        view["detail"].setImage(data, levels=view["levels"])
+        view["detail"].setRect(QtCore.QRectF(*rect))
+        view["detail"].show()
+
+    def _load_auxiliary_data_envelope(self, view, start, stop, width):
+        """
+        Reads the envelope of a range of a one dimensional auxiliary data
+        item in the background and shows it unless the view changed since.
+        """
+        view["request"] += 1
+        request = view["request"]
+
+        def on_loaded(result, runtime):
+            if self._state.get("auxiliary_data_view") is not view or \
+                    view["request"] != request:
+                return
+            x, y = result
+            if len(x):
+                view["curve"].setData(x, y)
+
+        run_in_background(auxiliary_data_view.read_envelope_1d, on_loaded,
+                          args=(view["data"], start, stop, width))
+
+    def _get_availability_source(self, station):
+        """
+        Returns the arguments of :func:`availability.get_availability` for a
+        station or None if it has no index.
+        """
+        if self._is_virtual():
+            index_filename = self.ds.index_filename
+            cache_filename = "%s__%s.availability" % (
+                os.path.splitext(index_filename)[0], station)
+            query = functools.partial(self.ds.query_intervals, station)
+        else:
+            index_filename = waveform_index.get_index_filename(
+                self.filename, station)
+            # Building the index has been canceled.
+            if not os.path.exists(index_filename):
+                return None
+            cache_filename = os.path.splitext(index_filename)[0] + \
+                ".availability"
+            query = functools.partial(waveform_index.query_intervals,
+                                      index_filename)
+        return query, index_filename, cache_filename
+
+    def show_availability(self, station):
+        """
+        Computes the data availability of a station from its waveform index
+        in a background thread and shows it in the availability tab.
+        """
+        source = self._get_availability_source(station)
+        if source is None:
+            return
+
+        generation = self._state.get("open_generation")
+        self._state["availability_station"] = station
+
+        def compute():
+            with profiling.span("compute_availability", "numpy",
+                                station=station) as args:
+                result = availability.get_availability(*source)
+                args["segments"] = result.segment_count
+                args["gaps"] = result.gap_count
+            return result
+
+        def on_computed(result, runtime):
+            # Another file or station has been selected in the meantime.
+            if self._state.get("open_generation") != generation or \
+                    self._state.get("availability_station") != station:
+                return
+            self.plot_availability(station, result)
+
+        run_in_background(compute, on_computed)
+
+    def plot_availability(self, station, avail):
+        """
+        Shows the availability of a station as one image with a row per
+        channel and tag.
+        """
+        graph = self.ui.availability_graph
+        graph.clear()
+        self._state["availability_view"] = None
+        self.ui.availability_label.setText(
+            "%s: %i waveforms of %i channels, %i gaps" % (
+                station, avail.segment_count, len(avail.channels),
+                avail.gap_count))
+        if not avail.channels:
+            return
+
+        plot = graph.addPlot(
+            title=station,
+            axisItems={'bottom': DateAxisItem(orientation='bottom',
+                                              utcOffset=0)})
+        plot.invertY(True)
+        plot.setMouseEnabled(y=False)
+        plot.getAxis('left').setTicks([[
+            (_i + 0.5, "%s %s" % channel)
+            for _i, channel in enumerate(avail.channels)]])
+
+        # Gaps in dark red, data in the highlight color, partially covered
+        # pixels in between.
+        lut = np.empty((256, 3), dtype=np.uint8)
+        for _i, (gap, data) in enumerate(zip((120, 30, 30), (61, 142, 201))):
+            lut[:, _i] = np.linspace(gap, data, 256)
+        img = pg.ImageItem()
+        img.setLookupTable(lut)
+        plot.addItem(img)
+
+        span = max(avail.endtime - avail.starttime, 1.0)
+        plot.setLimits(xMin=avail.starttime - 0.05 * span,
+                       xMax=avail.endtime + 0.05 * span,
+                       yMin=0, yMax=len(avail.channels))
+        plot.setRange(xRange=(avail.starttime, avail.endtime),
+                      yRange=(0, len(avail.channels)), padding=0)
+
+        self._state["availability_view"] = {
+            "station": station, "availability": avail, "plot": plot,
+            "image": img}
+        self._refine_availability_view()
+        plot.getViewBox().sigXRangeChanged.connect(
+            lambda *args: self._availability_refine_timer.start())
+
+    def _refine_availability_view(self):
+        """
+        Redraws the availability image for the visible time range with one
+        column per pixel.
+        """
+        view = self._state.get("availability_view")
+        if not view:
+            return
+        avail = view["availability"]
+        vb = view["plot"].getViewBox()
+        x_range = vb.viewRange()[0]
+        starttime = max(x_range[0], avail.starttime)
+        endtime = min(x_range[1], avail.endtime)
+        if endtime <= starttime:
+            return
+        width = max(int(vb.width()), 500)
+        with profiling.span("render_availability", "numpy", width=width):
+            image = avail.get_image(starttime, endtime, width)
+        view["image"].setImage(image.T, levels=(0.0, 1.0))
+        view["image"].setRect(QtCore.QRectF(
+            starttime, 0, endtime - starttime, len(avail.channels)))
+
+    def availability_clicked(self, event):
+        """
+        Extracts the data around the clicked time of the clicked channel and
+        all channels with the same tag.
+        """
+        view = self._state.get("availability_view")
+        if not view or event.button() != QtCore.Qt.LeftButton:
+            return
+        vb = view["plot"].getViewBox()
+        if not vb.sceneBoundingRect().contains(event.scenePos()):
+            return
+        point = vb.mapSceneToView(event.scenePos())
+        avail = view["availability"]
+        row = int(point.y())
+        if not 0 <= row < len(avail.channels):
+            return
+        if not avail.is_covered(row, point.x()):
+            self.ui.availability_label.setText(
+                "No data for %s at %s" % (avail.channels[row][0],
+                                          UTCDateTime(point.x(),
+                                                      precision=0)))
+            return
+
+        # Keep the length of the shown interval.
+        if "interval" in self._state:
+            length = self._state["interval"][1] - self._state["interval"][0]
+        else:
+            length = AVAILABILITY_WINDOW
+        tag = avail.channels[row][1]
+        channels = [_i for _i in avail.channels if _i[1] == tag]
+
+        self.new_start_time = UTCDateTime(point.x() - length / 2.0)
+        self.new_end_time = UTCDateTime(point.x() + length / 2.0)
+        self.extract_from_continuous(
+            True, st_ids=[_i[0] for _i in channels],
+            st_tags=[_i[1] for _i in channels])
+
+    def _get_spectral_cache(self):
+        if self._is_virtual():
+            return spectral.SpectralCache(
+                spectral.get_sidecar_filename(self.filename, virtual=True),
+                self.ds.index_filename)
+        return spectral.SpectralCache(
+            spectral.get_sidecar_filename(self.filename), self.filename)
+
+    def compute_spectrograms(self, station, tag):
+        """
+        Computes the spectrograms of all channels of a station with the
+        given tag in a pool of processes and shows the first one. Cached
+        spectrograms are not computed again.
+        """
+        source = self._get_availability_source(station)
+        if source is None:
+            return
+        path = self.filename
+        virtual = self._is_virtual()
+        cache = self._get_spectral_cache()
+        generation = self._state.get("open_generation")
+        self.update_status_bar("Computing spectrograms of %s (%s)..." % (
+            station, tag))
+
+        def compute():
+            avail = availability.get_availability(*source)
+            channels = [_i for _i in avail.channels if _i[1] == tag]
+            keys = [spectral.get_spectrogram_key(*_i) for _i in channels]
+            cached = set(cache.keys())
+            missing = [channel for channel, key in zip(channels, keys)
+                       if key not in cached]
+            if missing:
+                with profiling.span("compute_spectrograms", "numpy",
+                                    station=station,
+                                    channels=len(missing)):
+                    results = spectral.compute_spectrograms(
+                        path, avail, missing, virtual=virtual)
+                for key, spectrogram in results.items():
+                    cache.put(key, spectrogram)
+                cached.update(results.keys())
+            return [_i for _i in keys if _i in cached]
+
+        def on_computed(keys, runtime):
+            if self._state.get("open_generation") != generation:
+                return
+            self.update_status_bar()
+            self._add_spectrogram_items(keys)
+            if keys:
+                self.show_spectrogram(keys[0])
+
+        def on_error(exception, tb):
+            print(tb, file=sys.stderr)
+            if self._state.get("open_generation") != generation:
+                return
+            self.update_status_bar("Failed to compute spectrograms: %s" %
+                                   exception)
+
+        run_in_background(compute, on_computed, error_callback=on_error)
+
+    def _add_spectrogram_items(self, keys):
+        """
+        Lists spectrograms in the auxiliary data tree below a common item.
+        """
+        tree = self.ui.auxiliary_data_tree_view
+        group = None
+        for _i in range(tree.topLevelItemCount()):
+            if tree.topLevelItem(_i).type() == \
+                    AUX_DATA_ITEM_TYPES["SPECTROGRAMS"]:
+                group = tree.topLevelItem(_i)
+        if group is None:
+            if not keys:
+                return
+            group = QtGui.QTreeWidgetItem(
+                ["Spectrograms"], type=AUX_DATA_ITEM_TYPES["SPECTROGRAMS"])
+            tree.addTopLevelItem(group)
+
+        existing = set(self._get_auxiliary_data_name(group.child(_i))
+                       for _i in range(group.childCount()))
+        for key in keys:
+            if key in existing:
+                continue
+            item = QtGui.QTreeWidgetItem(
+                [key], type=AUX_DATA_ITEM_TYPES["SPECTROGRAM"])
+            item.setData(0, QtCore.Qt.UserRole, key)
+            group.addChild(item)
+
+    def show_spectrogram(self, key):
+        """
+        Shows a cached spectrogram with the auxiliary data view, time along
+        x and logarithmic frequency bins along y.
+        """
+        spectrogram = self._get_spectral_cache().get(key)
+        if spectrogram is None:
+            return
+        # Windows with gaps are shown with the lowest value.
+        data = spectrogram.data
+        if np.isnan(data).all():
+            data = np.zeros_like(data)
+        elif np.isnan(data).any():
+            data = np.where(np.isnan(data), np.nanmin(data), data)
+        spectrogram = spectrogram._replace(data=data)
+        self._show_auxiliary_data_details(spectrogram)
+        self.show_auxiliary_data(["Spectrograms"], key, spectrogram)
+        self.ui.central_tab.setCurrentWidget(self.ui.auxiliary_data_tab)
+
     def on_provenance_list_view_clicked(self, model_index):
         # Compat for different pyqt/sip versions.
         try:
@@ -977,100 +2030,101 @@ class Window(QtGui.QMainWindow):
             return station
 
         if t == STATION_VIEW_ITEM_TYPES["NETWORK"]:
-            network = item.text(0)
-            js_call = "highlightNetwork('{network}')".format(network=network)
-            self.ui.web_view.page().mainFrame().evaluateJavaScript(js_call)
+            network = str(item.text(0))
+            self._map_highlights.highlight(
+                self._map_highlights.get_network_stations(network))
         elif t == STATION_VIEW_ITEM_TYPES["STATION"]:
             station = get_station(item, parent=False)
-            js_call = "highlightStation('{station}')".format(station=station)
-            self.ui.web_view.page().mainFrame().evaluateJavaScript(js_call)
-        elif t == STATION_VIEW_ITEM_TYPES["STATIONXML"]:
-            station = get_station(item)
-            js_call = "highlightStation('{station}')".format(station=station)
-            self.ui.web_view.page().mainFrame().evaluateJavaScript(js_call)
-        elif t == STATION_VIEW_ITEM_TYPES["WAVEFORM"]:
+            self._map_highlights.highlight([str(station)])
+        elif t in (STATION_VIEW_ITEM_TYPES["STATIONXML"],
+                   STATION_VIEW_ITEM_TYPES["WAVEFORM"]):
             station = get_station(item)
-            js_call = "highlightStation('{station}')".format(station=station)
-            self.ui.web_view.page().mainFrame().evaluateJavaScript(js_call)
-        else:
-            pass
+            self._map_highlights.highlight([str(station)])
 
     def on_station_view_itemExited(self, *args):
-        js_call = "setAllInactive()"
-        self.ui.web_view.page().mainFrame().evaluateJavaScript(js_call)
+        self._map_highlights.clear()
 
     def query_sql_db(self, query, sql_filename, sta):
-        # Open a new st object
-        st = Stream()
-
-        # Initialize (open/create) the sqlalchemy sqlite engine
-        engine = create_engine('sqlite:///' + sql_filename)
-        Session = sessionmaker()
-        Session.configure(bind=engine)
-        session = Session()
-
-        for matched_waveform in session.query(Waveforms).filter(query):
-            st += self.ds.waveforms[sta][matched_waveform.full_id]
-
-        return(st)
+        """
+        Returns the ``(station, full_id)`` tuples of all waveforms of the
+        station matching the query.
+        """
+        with profiling.span("query_sql_db", "sqlite", station=sta) as args:
+            waveforms = [(sta, full_id) for full_id in
+                         waveform_index.query_full_ids(sql_filename, query)]
+            args["waveforms"] = len(waveforms)
+        return waveforms
 
     def extract_from_continuous(self, override, **kwargs):
-        # Open a new st object
-        self.st = Stream()
-
         # If override flag then we are calling this
         # method by using prev/next interval buttons
         if override:
             interval_tuple = (self.new_start_time.timestamp, self.new_end_time.timestamp)
-            for _i, st_id in enumerate(kwargs['st_ids']):
-
-                sta = str(st_id.split('.')[0])+'.'+str(st_id.split('.')[1])
-                # Get the SQL file for station
-                SQL_filename = r""+os.path.dirname(self.filename) + '/' + str(st_id.split('.')[1]) + '.db'
-
-                query_stmt = text("Waveforms.tag == :tag AND "
-                                  "Waveforms.station_id == :stid AND ("
-                                  "(Waveforms.starttime >= :start AND :end >= Waveforms.endtime) OR"
-                                  "(Waveforms.starttime <= :end AND :end <= Waveforms.endtime) OR"
-                                  "(Waveforms.starttime <= :start AND :start <= Waveforms.endtime))")
-
-                query_stmt = query_stmt.bindparams(stid=st_id, start=interval_tuple[0], end=interval_tuple[1],
-                                                   tag=kwargs['st_tags'][_i])
-
-                ret_st = self.query_sql_db(query_stmt, SQL_filename, sta)
-
-                self.st += ret_st
-
-
+            st_ids = tuple(kwargs['st_ids'])
+            st_tags = tuple(kwargs['st_tags'])
+
+            with profiling.span("extract_from_continuous", "hdf5") as args:
+                # Use the cached, e.g. prefetched, interval if available.
+                self.st = self._waveform_cache.get_stream(
+                    [get_trace_key(st_id, tag, *interval_tuple)
+                     for st_id, tag in zip(st_ids, st_tags)])
+                args["cached"] = self.st is not None
+                if self.st is None:
+                    self.st = self._get_interval_extractor()(
+                        st_ids, st_tags, interval_tuple[0],
+                        interval_tuple[1])
+                    self.cache_interval(self.st, *interval_tuple,
+                                        st_ids=st_ids, st_tags=st_tags)
+                args["traces"] = len(self.st)
+                args["bytes"] = sum(tr.data.nbytes for tr in self.st)
 
         elif not override:
             # Launch the custom extract time dialog
             dlg = timeDialog(self)
-            if dlg.exec_():
-                values = dlg.getValues()
-                interval_tuple = (values[0].timestamp, values[1].timestamp)
-
+            if not dlg.exec_():
+                return
+
+            values = dlg.getValues()
+            interval_tuple = (values[0].timestamp, values[1].timestamp)
+
+            # The waveforms overlapping the interval.
+            if self._is_virtual():
+                # The interval might span several files of the archive.
+                waveforms = self.ds.find_waveforms(
+                    interval_tuple[0], interval_tuple[1], kwargs['wave_tag'],
+                    station=kwargs['sta'])
+            else:
                 # Get the SQL file for station
-                SQL_filename = r""+os.path.dirname(self.filename) + '/' + str(kwargs['sta'].split('.')[1]) + '.db'
-
-                query_stmt = text("Waveforms.tag == :tag AND ("
-                                  "(Waveforms.starttime >= :start AND :end >= Waveforms.endtime) OR"
-                                  "(Waveforms.starttime <= :end AND :end <= Waveforms.endtime) OR"
-                                  "(Waveforms.starttime <= :start AND :start <= Waveforms.endtime))")
-
-                query_stmt = query_stmt.bindparams(start=interval_tuple[0],end=interval_tuple[1],
-                                                   tag=kwargs['wave_tag'])
-
-                ret_st = self.query_sql_db(query_stmt, SQL_filename, kwargs['sta'])
-
-                self.st += ret_st
-
-
-        if self.st.__nonzero__():
-            # Attempt to merge all traces with matching ID'S in place
-            self.st.merge()
-            self.st.trim(starttime=UTCDateTime(interval_tuple[0]), endtime=UTCDateTime(interval_tuple[1]))
-            self.update_waveform_plot()
+                SQL_filename = waveform_index.get_index_filename(
+                    self.filename, kwargs['sta'])
+
+                query_stmt = waveform_index.interval_query(
+                    interval_tuple[0], interval_tuple[1], kwargs['wave_tag'])
+
+                waveforms = self.query_sql_db(query_stmt, SQL_filename,
+                                              kwargs['sta'])
+
+            # Only the samples inside the interval are read, directly
+            # into one array per channel. Gaps are masked.
+            with profiling.span("extract_from_continuous", "hdf5") as args:
+                if self._is_virtual():
+                    self.st = self.ds.assemble_window(
+                        waveforms, UTCDateTime(interval_tuple[0]),
+                        UTCDateTime(interval_tuple[1]))
+                else:
+                    self.st = stream_assembler.assemble_window(
+                        self.ds, waveforms, UTCDateTime(interval_tuple[0]),
+                        UTCDateTime(interval_tuple[1]),
+                        mapping=self._waveform_mapping)
+                self.cache_interval(self.st, *interval_tuple)
+                args["traces"] = len(self.st)
+                args["bytes"] = sum(tr.data.nbytes for tr in self.st)
+
+        if self.st:
+            self.show_waveforms(
+                self.st, [get_trace_key(tr.id, tr.stats.asdf.tag,
+                                        *interval_tuple) for tr in self.st],
+                interval=interval_tuple)
         else:
             msg = QtGui.QMessageBox()
             msg.setIcon(QtGui.QMessageBox.Critical)
@@ -1089,62 +2143,118 @@ class Window(QtGui.QMainWindow):
 
 
         # Launch the custom station/component selection dialog
-        sel_dlg = selectionDialog(parent=self, sta_list=self.ds.waveforms.list())
+        if self._is_virtual():
+            sta_list = self.ds.list_stations()
+        else:
+            sta_list = self.ds.waveforms.list()
+        sel_dlg = selectionDialog(
+            parent=self, sta_list=sta_list,
+            coordinates=self._state.get("station_coordinates"))
         if sel_dlg.exec_():
             select_sta, bool_comp = sel_dlg.getSelected()
             query_comp = list(itertools.compress(comp_list, bool_comp))
+            with profiling.span("analyse_earthquake", "obspy",
+                                stations=len(select_sta)) as args:
+                self.plot_event_waveforms(event_obj, select_sta, query_comp)
+                args["traces"] = len(self.st)
 
-            # Open up a new stream object
-            self.st = Stream()
-
-            # use the ifilter functionality to extract desired streams to visualize
-            for station in self.ds.ifilter(self.ds.q.station == map(lambda el: el.split('.')[1], select_sta),
-                                           self.ds.q.channel == query_comp,
-                                           self.ds.q.event == event_obj):
-                for filtered_id in station.list():
-                    if filtered_id == 'StationXML':
-                        continue
-                    self.st += station[filtered_id]
-
-            if self.st.__nonzero__():
-                # Get quake origin info
-                origin_info = event_obj.preferred_origin() or event_obj.origins[0]
-
-                # Iterate through traces
-                for tr in self.st:
-                    # Run Java Script to highlight all selected stations in station view
-                    js_call = "highlightStation('{station}')".format(station=tr.stats.network + '.' +tr.stats.station)
-                    self.ui.web_view.page().mainFrame().evaluateJavaScript(js_call)
-
-
-                    # Get inventory for trace
-                    inv = self.ds.waveforms[tr.stats.network + '.' +tr.stats.station].StationXML
-                    sta_coords = inv.get_coordinates(tr.get_id())
-
-                    dist, baz, _ = gps2dist_azimuth(sta_coords['latitude'],
-                                                    sta_coords['longitude'],
-                                                    origin_info.latitude,
-                                                    origin_info.longitude)
-                    dist_deg = kilometer2degrees(dist/1000.0)
-                    tt_model = TauPyModel(model='iasp91')
-                    arrivals = tt_model.get_travel_times(origin_info.depth/1000.0, dist_deg, ('P'))
-
-                    # Write info to trace header
-                    tr.stats.distance = dist
-                    tr.stats.ptt = arrivals[0]
-
-                # Sort the st by distance from quake
-                self.st.sort(keys=['distance'])
+    def _get_attribute_table(self, ds):
+        """
+        Returns the attribute table of a file of the data set, building it
+        if needed. Returns None if building is canceled.
+        """
+        tables = self._state.setdefault("attribute_tables", {})
+        if ds.filename in tables:
+            return tables[ds.filename]
+
+        progressDialog = QtGui.QProgressDialog(
+            "Reading Waveform Attributes of {0}".format(
+                os.path.basename(ds.filename)),
+            "Cancel", 0, 0)
+
+        def progress(current, total):
+            progressDialog.setMaximum(total)
+            progressDialog.setValue(current)
+            return not progressDialog.wasCanceled()
+
+        with profiling.span("attribute_table", "numpy",
+                            filename=ds.filename):
+            table = attribute_index.get_table(ds, ds.filename,
+                                              progress_callback=progress)
+        progressDialog.close()
+        if table is not None:
+            tables[ds.filename] = table
+        return table
+
+    def plot_event_waveforms(self, event_obj, select_sta, query_comp):
+        """
+        Plots the waveforms of an event sorted by epicentral distance.
 
+        :param select_sta: List of ``NET.STA`` station ids.
+        :param query_comp: List of channel patterns, e.g. ``['*Z', '*N']``.
+        """
+        # Waveform cache keys of the desired waveforms.
+        keys = []
 
-                self.update_waveform_plot()
+        # Only the files containing the event are searched in archives.
+        if self._is_virtual():
+            datasets = self.ds.get_event_datasets(event_obj)
+        else:
+            datasets = [self.ds]
+
+        # Query the attribute table of each file for the desired waveforms.
+        q = attribute_index.q
+        station_codes = [_i.split('.')[1] for _i in select_sta]
+        for ds in datasets:
+            table = self._get_attribute_table(ds)
+            if table is None:
+                return
+            for full_id in table.select(q.station == station_codes,
+                                        q.channel == query_comp,
+                                        q.event == event_obj):
+                keys.append((full_id, None, None))
+
+        # Only the waveforms not already in the cache are read.
+        traces = [(key, self.get_trace(key)) for key in keys]
+        traces = [(key, tr) for key, tr in traces if tr is not None]
+        self.st = Stream(traces=[tr for _, tr in traces])
+
+        if self.st:
+            # Get quake origin info
+            origin_info = event_obj.preferred_origin() or event_obj.origins[0]
+
+            # Highlight all plotted stations on the map at once.
+            self._map_highlights.highlight(
+                set(tr.stats.network + '.' + tr.stats.station
+                    for tr in self.st))
+
+            # Iterate through traces
+            for tr in self.st:
+                # Get inventory for trace
+                inv = self._get_stationxml(tr.stats.network + '.' +tr.stats.station)
+                sta_coords = inv.get_coordinates(tr.get_id())
+
+                dist, baz, _ = geodetics.gps2dist_azimuth(
+                    sta_coords['latitude'], sta_coords['longitude'],
+                    origin_info.latitude, origin_info.longitude)
+                dist_deg = geodetics.kilometer2degrees(dist/1000.0)
+                tt_model = taup.TauPyModel(model='iasp91')
+                arrivals = tt_model.get_travel_times(origin_info.depth/1000.0, dist_deg, ('P'))
+
+                # Write info to trace header
+                tr.stats.distance = dist
+                tr.stats.ptt = arrivals[0]
+
+            # Sort the st by distance from quake, keeping the keys with
+            # their traces.
+            traces.sort(key=lambda x: x[1].stats.distance)
+            self.st = Stream(traces=[tr for _, tr in traces])
+
+            self.show_waveforms(self.st, [key for key, _ in traces])
 
 
 
 def launch():
-    # Automatically compile all ui files if they have been changed.
-    compile_and_import_ui_files()
-
     # Launch and open the window.
     app = QtGui.QApplication(sys.argv, QtGui.QApplication.GuiClient)
     app.setStyleSheet(qdarkstyle.load_stylesheet(pyside=False))
@@ -1159,11 +2269,23 @@ def launch():
     app.installEventFilter(window)
     window.raise_()
     ret_val = app.exec_()
-    window.__del__()
     os._exit(ret_val)
 
 
+def batch_extract(argv=None):
+    """
+    Extracts time windows without the GUI, see batch_extract.py. This
+    module imports Qt, run batch_extract.py directly where it is not
+    installed.
+    """
+    import batch_extract
+    return batch_extract.main(argv)
+
+
 if __name__ == "__main__":
+    # python main.py extract ... runs the headless batch extraction.
+    if sys.argv[1:2] == ["extract"]:
+        sys.exit(batch_extract(sys.argv[2:]))
 
     proxy = raw_input("Proxy:")
     port = raw_input("Proxy Port:")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Highlighted stations of the station map.
+
+Every call into the web view is expensive, so the highlighted stations are
+tracked here instead of calling into the map for every station whenever an
+item is hovered or the waveform graph gets the focus. Changes are collected
+and, once per frame, only the stations whose state actually changed are
+sent to the map in a single call.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+
+from PyQt4 import QtCore
+
+__all__ = ["HighlightManager"]
+
+# Changes within this many milliseconds are sent together.
+FLUSH_INTERVAL = 16
+
+
+class HighlightManager(QtCore.QObject):
+    """
+    Keeps the highlighted ``NET.STA`` stations of the map in sync.
+
+    :param evaluate: Function evaluating a JavaScript call in the map.
+    """
+    def __init__(self, evaluate, parent=None):
+        super(HighlightManager, self).__init__(parent)
+        self._evaluate = evaluate
+        # Stations with a marker on the map.
+        self._known = set()
+        # Stations highlighted on the map and the ones that should be.
+        self._shown = set()
+        self._wanted = set()
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FLUSH_INTERVAL)
+        self._timer.timeout.connect(self.flush)
+
+    def add_known_stations(self, stations):
+        self._known.update(stations)
+
+    def get_network_stations(self, network):
+        prefix = network + "."
+        return [_i for _i in self._known if _i.startswith(prefix)]
+
+    def highlight(self, stations):
+        """
+        Highlights the stations in addition to the highlighted ones.
+        """
+        stations = self._known.intersection(stations)
+        if not stations.issubset(self._wanted):
+            self._wanted |= stations
+            self._schedule()
+
+    def clear(self):
+        if self._wanted:
+            self._wanted = set()
+            self._schedule()
+
+    def reset(self):
+        """
+        Unhighlights and forgets all stations, e.g. when another file is
+        opened.
+        """
+        self._timer.stop()
+        if self._shown:
+            self._evaluate("setAllInactive()")
+        self._known.clear()
+        self._shown.clear()
+        self._wanted.clear()
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """
+        Sends the changes since the last call to the map.
+        """
+        self._timer.stop()
+        added = self._wanted - self._shown
+        removed = self._shown - self._wanted
+        if not added and not removed:
+            return
+        self._evaluate("updateHighlights(%s, %s)" % (
+            json.dumps(sorted(added)), json.dumps(sorted(removed))))
+        self._shown = set(self._wanted)
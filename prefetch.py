@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background loading of the intervals adjacent to the shown one.
+
+Once an interval is shown the previous and next intervals are loaded in
+background threads so paging through continuous data does not have to wait
+for the waveform index and the file.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from workers import run_in_background
+
+__all__ = ["IntervalPrefetcher"]
+
+
+class IntervalPrefetcher(object):
+    """
+    Loads intervals in background threads.
+
+    Keys are hashable descriptions of an interval, e.g. the channels, tags
+    and the start and end times. Loaded intervals are passed to
+    ``store(key, value)`` in the GUI thread, e.g. to put them into a
+    :class:`~waveform_cache.WaveformCache`.
+    """
+    def __init__(self, store):
+        self._store = store
+        self._loading = set()
+        # Increased on clear() so results of outdated requests are dropped.
+        self._generation = 0
+
+    def clear(self):
+        self._loading.clear()
+        self._generation += 1
+
+    def is_loading(self, key):
+        return key in self._loading
+
+    def prefetch(self, key, fct, *args):
+        """
+        Calls ``fct(*args)`` in a background thread and stores the result,
+        unless the key is already being loaded.
+        """
+        if key in self._loading:
+            return
+        self._loading.add(key)
+        generation = self._generation
+
+        def on_loaded(value, runtime):
+            if generation != self._generation:
+                return
+            self._loading.discard(key)
+            self._store(key, value)
+
+        def on_error(exception, tb):
+            if generation == self._generation:
+                self._loading.discard(key)
+
+        run_in_background(fct, on_loaded, error_callback=on_error, args=args)
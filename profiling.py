@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lightweight instrumentation of the hot paths.
+
+Timing spans are recorded around expensive operations, together with details
+like the number of bytes read or points plotted. They can be inspected in
+the profiling panel and exported in the Chrome trace event format, which can
+be loaded in ``chrome://tracing`` or https://ui.perfetto.dev. Additionally
+a cProfile capture of the GUI thread can be started and stopped at any time.
+
+Does not depend on Qt so it can be used from background threads.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+__all__ = ["Span", "Profiler", "profiler", "span", "record"]
+
+# Maximum number of kept spans, older ones are discarded.
+MAX_SPANS = 20000
+
+Span = collections.namedtuple(
+    "Span", ["name", "category", "start", "duration", "thread_id",
+             "thread_name", "args"])
+
+
+class Profiler(object):
+    """
+    Thread-safe recorder of timing spans.
+    """
+    def __init__(self, max_spans=MAX_SPANS):
+        self._spans = collections.deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        # Total number of recorded spans, including discarded ones. Used by
+        # consumers to find new spans.
+        self.count = 0
+        self._cprofile = None
+
+    def record(self, name, category, start, duration, **args):
+        """
+        Records a span that has already finished.
+
+        :param start: Start time as returned by :func:`time.time`.
+        :param duration: Duration in seconds.
+        """
+        thread = threading.current_thread()
+        s = Span(name, category, start, duration, thread.ident, thread.name,
+                 args)
+        with self._lock:
+            self._spans.append(s)
+            self.count += 1
+
+    @contextlib.contextmanager
+    def span(self, name, category="", **args):
+        """
+        Times the enclosed block. Yields the arguments of the span so
+        details can be added once they are known::
+
+            with profiler.span("read", "hdf5") as args:
+                data = dset[:]
+                args["bytes"] = data.nbytes
+        """
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.record(name, category, start, time.time() - start, **args)
+
+    def get_spans(self, since=0):
+        """
+        Returns the spans recorded after the first ``since`` spans together
+        with the current count.
+        """
+        with self._lock:
+            new = min(self.count - since, len(self._spans))
+            spans = list(self._spans)[len(self._spans) - new:] \
+                if new > 0 else []
+            return spans, self.count
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def get_chrome_trace(self):
+        """
+        Returns the spans as a Chrome trace event format dictionary.
+        """
+        spans, _ = self.get_spans()
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for s in spans:
+            threads[s.thread_id] = s.thread_name
+            events.append({
+                "name": s.name, "cat": s.category, "ph": "X",
+                "ts": s.start * 1E6, "dur": s.duration * 1E6, "pid": pid,
+                "tid": s.thread_id,
+                "args": dict((k, v if isinstance(v, (int, float)) else
+                              str(v)) for k, v in s.args.items())})
+        for thread_id, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                           "tid": thread_id,
+                           "args": {"name": thread_name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, filename):
+        with open(filename, "w") as fh:
+            json.dump(self.get_chrome_trace(), fh)
+
+    @property
+    def cprofile_running(self):
+        return self._cprofile is not None
+
+    def start_cprofile(self):
+        """
+        Starts capturing a cProfile profile. Only the calling thread is
+        profiled.
+        """
+        if self._cprofile is not None:
+            return
+        self._cprofile = cProfile.Profile()
+        self._cprofile.enable()
+
+    def stop_cprofile(self, filename=None):
+        """
+        Stops the cProfile capture and optionally writes the statistics to a
+        file readable by :mod:`pstats`, e.g. with snakeviz. Returns the
+        profile.
+        """
+        prof, self._cprofile = self._cprofile, None
+        if prof is None:
+            return None
+        prof.disable()
+        if filename:
+            prof.dump_stats(filename)
+        return prof
+
+
+# Profiler used by the application.
+profiler = Profiler()
+span = profiler.span
+record = profiler.record
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Dockable panel showing the timing spans recorded by :mod:`profiling`.
+
+New spans are added periodically instead of for every span so profiling
+does not slow down the operations it measures.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from PyQt4 import QtGui, QtCore
+
+from profiling import profiler
+
+# Maximum number of rows shown, the oldest rows are removed first.
+MAX_ROWS = 2000
+# Interval in milliseconds in which new spans are added to the panel.
+UPDATE_INTERVAL = 500
+
+
+class ProfilingPanel(QtGui.QDockWidget):
+    """
+    Dockable panel listing the recorded timing spans, newest first.
+    """
+    def __init__(self, parent=None):
+        super(ProfilingPanel, self).__init__("Profiling", parent)
+        self.setObjectName("profiling_dock")
+
+        widget = QtGui.QWidget(self)
+        layout = QtGui.QVBoxLayout(widget)
+        layout.setContentsMargins(2, 2, 2, 2)
+
+        self.table = QtGui.QTableWidget(0, 5, widget)
+        self.table.setHorizontalHeaderLabels(
+            ["Name", "Category", "Duration [ms]", "Thread", "Details"])
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        layout.addWidget(self.table)
+
+        buttons = QtGui.QHBoxLayout()
+        clear_button = QtGui.QPushButton("Clear", widget)
+        clear_button.released.connect(self.clear)
+        export_button = QtGui.QPushButton("Export Chrome Trace...", widget)
+        export_button.released.connect(self.export_chrome_trace)
+        buttons.addWidget(clear_button)
+        buttons.addStretch()
+        buttons.addWidget(export_button)
+        layout.addLayout(buttons)
+
+        self.setWidget(widget)
+
+        self._count = 0
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(UPDATE_INTERVAL)
+        self._timer.timeout.connect(self.update_spans)
+        self.visibilityChanged.connect(self._on_visibility_changed)
+
+    def _on_visibility_changed(self, visible):
+        # Only poll for new spans while the panel is shown.
+        if visible:
+            self.update_spans()
+            self._timer.start()
+        else:
+            self._timer.stop()
+
+    def update_spans(self):
+        spans, self._count = profiler.get_spans(since=self._count)
+        if not spans:
+            return
+        spans = spans[-MAX_ROWS:]
+        self.table.setUpdatesEnabled(False)
+        for span in spans:
+            self.table.insertRow(0)
+            details = ", ".join("%s=%s" % (k, v) for k, v in
+                                sorted(span.args.items()))
+            for column, value in enumerate([
+                    span.name, span.category,
+                    "%.2f" % (span.duration * 1000.0), span.thread_name,
+                    details]):
+                item = QtGui.QTableWidgetItem(value)
+                if column == 2:
+                    item.setTextAlignment(QtCore.Qt.AlignRight |
+                                          QtCore.Qt.AlignVCenter)
+                self.table.setItem(0, column, item)
+        self.table.setRowCount(min(self.table.rowCount(), MAX_ROWS))
+        self.table.setUpdatesEnabled(True)
+
+    def clear(self):
+        profiler.clear()
+        self.table.setRowCount(0)
+
+    def export_chrome_trace(self):
+        filename = str(QtGui.QFileDialog.getSaveFileName(
+            parent=self, caption="Export Chrome Trace",
+            filter="Chrome trace (*.json)"))
+        if not filename:
+            return
+        profiler.export_chrome_trace(filename)
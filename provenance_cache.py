@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cache of rendered provenance graphs.
+
+Rendering a provenance document calls graphviz which is slow for large
+documents. Rendered SVG files are stored in the user cache directory, keyed
+by the name of the document and a hash of its serialized content, so every
+document is only rendered once, even across sessions.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from ui_loader import get_cache_directory
+
+__all__ = ["ProvenanceRenderCache", "RenderJobs"]
+
+
+class ProvenanceRenderCache(object):
+    """
+    In-memory and on-disk cache of rendered provenance SVG files.
+
+    All methods except :meth:`render` are cheap and can be called from the
+    GUI thread. :meth:`render` is thread safe as long as the same key is not
+    rendered concurrently.
+    """
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = os.path.join(get_cache_directory(), "provenance")
+        self.cache_dir = cache_dir
+        # Maps keys to the filenames of rendered SVG files.
+        self._memory = {}
+
+    def get_key(self, ds, document_name):
+        """
+        Key of a provenance document of a data set. Only reads the raw
+        serialized document, it is not parsed.
+        """
+        raw = np.asarray(ds._provenance_group[document_name][()])
+        h = hashlib.sha1(document_name.encode("utf-8"))
+        h.update(raw.tobytes())
+        return "%s_%s" % ("".join(
+            _i if _i.isalnum() else "_" for _i in document_name)[:64],
+            h.hexdigest())
+
+    def _get_filename(self, key):
+        return os.path.join(self.cache_dir, key + os.path.extsep + "svg")
+
+    def get(self, key):
+        """
+        Returns the filename of the rendered SVG or None if it has not yet
+        been rendered.
+        """
+        if key in self._memory:
+            return self._memory[key]
+        filename = self._get_filename(key)
+        if os.path.exists(filename):
+            self._memory[key] = filename
+            return filename
+        return None
+
+    def render(self, ds, document_name, key):
+        """
+        Renders the document with graphviz and returns the filename of the
+        SVG file.
+        """
+        filename = self.get(key)
+        if filename is not None:
+            return filename
+
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Might have been created in the meanwhile.
+                if not os.path.isdir(self.cache_dir):
+                    raise
+
+        filename = self._get_filename(key)
+        # Render to a temporary file so other instances never see
+        # incomplete files.
+        tmp_filename = "%s.%i.tmp.svg" % (filename[:-4], os.getpid())
+        doc = ds.provenance[document_name]
+        doc.plot(filename=tmp_filename, use_labels=True)
+        os.rename(tmp_filename, filename)
+
+        self._memory[key] = filename
+        return filename
+
+
+class _Job(object):
+    def __init__(self, priority):
+        self.priority = priority
+        self.started = False
+
+
+class RenderJobs(object):
+    """
+    Book keeping of the queued render jobs, at most one per document.
+
+    A thread pool cannot change the priority of queued jobs so a document
+    requested with a higher priority is queued again and the previous job
+    does nothing once it is started. The same is done for all jobs of a
+    previously opened file with :meth:`clear`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, document_name, priority=0):
+        """
+        Returns a new job for the document or None if it is already queued
+        with at least the same priority or being rendered.
+        """
+        with self._lock:
+            job = self._jobs.get(document_name)
+            if job is not None and (job.started or job.priority >= priority):
+                return None
+            job = _Job(priority)
+            self._jobs[document_name] = job
+            return job
+
+    def start(self, document_name, job):
+        """
+        Called by the job once it runs. Returns False if it has been
+        superseded or canceled.
+        """
+        with self._lock:
+            if self._jobs.get(document_name) is not job:
+                return False
+            job.started = True
+            return True
+
+    def finish(self, document_name, job):
+        with self._lock:
+            if self._jobs.get(document_name) is job:
+                del self._jobs[document_name]
+
+    def clear(self):
+        with self._lock:
+            self._jobs.clear()
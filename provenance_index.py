@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reverse index from provenance record ids to provenance documents.
+
+pyasdf finds the document containing a record by parsing every document
+until it finds it. This index is built once per file by scanning the
+serialized PROV-XML documents for record ids, which is much faster than
+parsing them into PROV documents, and subsequently answers every lookup with
+a single dictionary access.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+__all__ = ["build_provenance_index", "get_id_keys"]
+
+PROV_NAMESPACE = "http://www.w3.org/ns/prov#"
+_PROV_ID = "{%s}id" % PROV_NAMESPACE
+
+
+def get_id_keys(namespace_uri, prefix, local_part):
+    """
+    The different forms a provenance record id can be referenced with.
+    """
+    keys = ["{%s}%s" % (namespace_uri, local_part),
+            namespace_uri + local_part]
+    if prefix:
+        keys.append("%s:%s" % (prefix, local_part))
+    return keys
+
+
+def get_record_ids(raw):
+    """
+    Yields all record ids of a serialized PROV-XML document as
+    ``(namespace_uri, prefix, local_part)`` tuples.
+    """
+    namespaces = {}
+    for event, elem in ET.iterparse(io.BytesIO(raw),
+                                    events=("start-ns", "start")):
+        if event == "start-ns":
+            prefix, uri = elem
+            namespaces[prefix] = uri
+            continue
+        value = elem.get(_PROV_ID)
+        if not value:
+            continue
+        if ":" in value:
+            prefix, local_part = value.split(":", 1)
+        else:
+            prefix, local_part = "", value
+        yield namespaces.get(prefix, ""), prefix, local_part
+
+
+def build_provenance_index(ds, document_names):
+    """
+    Builds the index for all documents of a data set.
+
+    :param ds: The ASDFDataSet.
+    :param document_names: Names of the provenance documents in the order
+        they are shown.
+    :returns: Dictionary mapping all forms of each record id to a
+        ``(document_name, row)`` tuple and the names of the documents that
+        could not be scanned. Ids of the latter are not in the index.
+    """
+    index = {}
+    unparsable = []
+    for row, name in enumerate(document_names):
+        raw = np.asarray(ds._provenance_group[name][()]).tobytes()
+        try:
+            record_ids = list(get_record_ids(raw))
+        except ET.ParseError:
+            unparsable.append(name)
+            continue
+        for record_id in record_ids:
+            for key in get_id_keys(*record_id):
+                # The first document containing an id wins, same as in pyasdf.
+                index.setdefault(key, (name, row))
+    return index, unparsable
@@ -77,3 +77,18 @@ function highlightStation(station_id) {
     var value = stations[station_id];
     setMarkerActive(value)
 }
+
+function updateHighlights(added, removed) {
+    _.forEach(removed, function(station_id) {
+        var value = stations[station_id];
+        if (value) {
+            setMarkerInactive(value);
+        }
+    });
+    _.forEach(added, function(station_id) {
+        var value = stations[station_id];
+        if (value) {
+            setMarkerActive(value);
+        }
+    });
+}
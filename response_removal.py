@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Instrument response removal for the waveform plot.
+
+Evaluating a response from its stages is far more expensive than the
+deconvolution itself. The complex frequency response of every channel is
+thus evaluated once per number of samples, sampling rate and output units
+and cached, so redrawing or paging through intervals of the same length
+only costs the FFTs. All traces with the same number of samples and
+sampling rate are deconvolved together as one two dimensional array.
+
+Does not depend on Qt.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import OrderedDict
+
+import numpy as np
+from obspy.core import Stream, Trace
+
+__all__ = ["OUTPUTS", "ResponseRemover"]
+
+OUTPUTS = ("VEL", "DISP", "ACC")
+
+# Number of cached frequency responses.
+MAX_RESPONSES = 256
+DEFAULT_WATER_LEVEL = 60.0
+# Fraction of the samples tapered at each end before the deconvolution.
+TAPER_FRACTION = 0.05
+
+
+def get_nfft(npts):
+    """
+    Number of samples of the FFT, zero padded to at least twice the length
+    to avoid wrap around.
+    """
+    return int(2 ** np.ceil(np.log2(2 * npts)))
+
+
+def get_taper(npts, fraction=TAPER_FRACTION):
+    """
+    Cosine taper of the given fraction of samples at each end.
+    """
+    taper = np.ones(npts)
+    n = int(npts * fraction)
+    if n > 0:
+        ramp = 0.5 * (1.0 - np.cos(np.pi * np.arange(n) / n))
+        taper[:n] = ramp
+        taper[-n:] = ramp[::-1]
+    return taper
+
+
+def invert_spectrum(response, water_level):
+    """
+    Inverse of a frequency response. Amplitudes lower than the water level
+    in dB below the maximum are raised to it.
+    """
+    amplitude = np.abs(response)
+    floor = amplitude.max() * 10.0 ** (-water_level / 20.0)
+    scaled = response.copy()
+    low = amplitude < floor
+    # Keep the phase of the raised values.
+    nonzero = low & (amplitude > 0)
+    scaled[nonzero] *= floor / amplitude[nonzero]
+    scaled[low & ~nonzero] = floor
+    return 1.0 / scaled
+
+
+class ResponseRemover(object):
+    """
+    Removes instrument responses with cached frequency responses.
+
+    :param get_inventory: Function returning the inventory of a ``NET.STA``
+        station. Inventories are requested once and kept.
+    """
+    def __init__(self, get_inventory, max_responses=MAX_RESPONSES):
+        self._get_inventory = get_inventory
+        self.max_responses = max_responses
+        self._inventories = {}
+        self._responses = OrderedDict()
+        self.evaluations = 0
+
+    def clear(self):
+        self._inventories.clear()
+        self._responses.clear()
+
+    def get_inventory(self, station):
+        if station not in self._inventories:
+            try:
+                self._inventories[station] = self._get_inventory(station)
+            except Exception:
+                self._inventories[station] = None
+        return self._inventories[station]
+
+    def get_inverse_response(self, tr, output, water_level):
+        """
+        Returns the inverse complex frequency response for the trace or None
+        if no response is known.
+        """
+        station = "%s.%s" % (tr.stats.network, tr.stats.station)
+        inventory = self.get_inventory(station)
+        if inventory is None:
+            return None
+        try:
+            response = inventory.get_response(tr.id, tr.stats.starttime)
+        except Exception:
+            return None
+
+        npts = tr.stats.npts
+        sampling_rate = tr.stats.sampling_rate
+        # The response object changes with the channel epoch.
+        key = (tr.id, id(response), npts, sampling_rate, output,
+               water_level)
+        try:
+            inverse = self._responses.pop(key)
+        except KeyError:
+            values, _ = response.get_evalresp_response(
+                t_samp=1.0 / sampling_rate, nfft=get_nfft(npts),
+                output=output)
+            inverse = invert_spectrum(values, water_level)
+            # Never amplify the mean.
+            inverse[0] = 0.0
+            self.evaluations += 1
+        self._responses[key] = inverse
+        while len(self._responses) > self.max_responses:
+            self._responses.popitem(last=False)
+        return inverse
+
+    def remove_response(self, st, output="VEL",
+                        water_level=DEFAULT_WATER_LEVEL):
+        """
+        Returns a new stream with the responses removed and the ids of
+        traces without known response, which are copied unchanged.
+        """
+        groups = OrderedDict()
+        missing = []
+        for _i, tr in enumerate(st):
+            inverse = self.get_inverse_response(tr, output, water_level)
+            if inverse is None:
+                missing.append(tr.id)
+                continue
+            groups.setdefault((tr.stats.npts, tr.stats.sampling_rate),
+                              []).append((_i, inverse))
+
+        corrected = {}
+        for (npts, sampling_rate), items in groups.items():
+            nfft = get_nfft(npts)
+            data = np.empty((len(items), npts))
+            for _j, (_i, _) in enumerate(items):
+                values = np.ma.asarray(st[_i].data).astype(np.float64)
+                # Gaps are filled with the mean, they stay masked.
+                data[_j] = values.filled(values.mean()
+                                         if values.count() else 0.0)
+            data -= data.mean(axis=1)[:, np.newaxis]
+            data *= get_taper(npts)
+            spectra = np.fft.rfft(data, n=nfft, axis=-1)
+            spectra *= np.array([_i[1] for _i in items])
+            data = np.fft.irfft(spectra, n=nfft, axis=-1)[:, :npts]
+            for _j, (_i, _) in enumerate(items):
+                corrected[_i] = data[_j]
+
+        result = Stream()
+        for _i, tr in enumerate(st):
+            if _i not in corrected:
+                # Copied as the result may be modified in place.
+                result.append(tr.copy())
+                continue
+            output_data = corrected[_i]
+            mask = np.ma.getmaskarray(tr.data)
+            if mask.any():
+                output_data = np.ma.masked_array(output_data, mask=mask)
+            result.append(Trace(data=output_data, header=tr.stats.copy()))
+        return result, missing
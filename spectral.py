@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Welch power spectral densities and spectrograms of continuous data.
+
+The continuous data of a channel is cut into windows (one hour by default)
+and the Welch PSD of every window is one column of the spectrogram. Windows
+are cut out in chunks using the waveform index, the Welch segments of all
+windows of a chunk are stacked into one array so a single FFT call handles
+them, and the chunks are spread over a pool of processes. Only windows fully
+covered by data are computed, all others are NaN.
+
+The pool is started from a background thread of the GUI while other threads
+use HDF5 and Qt. Forked processes could inherit locks held by these threads
+so the worker processes are spawned. Without spawning (Python 2) the chunks
+are computed in the calling thread.
+
+The PSDs are averaged in logarithmically spaced frequency bins so
+spectrograms of years of data stay small. They are cached in an HDF5
+sidecar file next to the ASDF file, which is only opened for reading, and
+shown with the two dimensional auxiliary data view.
+
+Does not depend on Qt so it can run in background threads.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import multiprocessing
+import os
+
+import numpy as np
+from obspy.core import UTCDateTime
+
+import availability
+
+__all__ = ["welch", "bin_psd", "get_log_bins", "SpectralData",
+           "SpectralCache", "get_sidecar_filename", "get_spectrogram_key",
+           "compute_spectrograms"]
+
+# Length of a window, i.e. one column of the spectrogram, in seconds.
+DEFAULT_WINDOW_LENGTH = 3600.0
+# Length of the Welch segments as a fraction of the window and their
+# overlap. Yields 13 segments per window.
+SEGMENT_FRACTION = 0.25
+SEGMENT_OVERLAP = 0.75
+BINS_PER_OCTAVE = 8
+# Number of windows cut out and processed at once by a worker.
+CHUNK_WINDOWS = 24
+# Maximum number of samples of the stacked segments transformed at once.
+MAX_BATCH_SAMPLES = 2 ** 23
+# Windows with less coverage in the index are not computed. The index only
+# stores whole seconds.
+MIN_COVERAGE = 0.999
+# Increase whenever the computed spectrograms change, older cached ones are
+# then computed again.
+FORMAT_VERSION = 2
+
+# Spectrogram as stored in the sidecar. Mimics the auxiliary data containers
+# of pyasdf so it can be shown like auxiliary data.
+SpectralData = collections.namedtuple(
+    "SpectralData", ["data", "parameters", "provenance_id"])
+
+# Data set of the file in each worker process.
+_WORKER_STATE = {}
+
+
+def welch(windows, sampling_rate, nperseg, overlap=SEGMENT_OVERLAP):
+    """
+    Welch PSDs of many windows at once.
+
+    :param windows: Array of shape ``(n_windows, npts)``.
+    :param nperseg: Number of samples per segment.
+    :returns: The frequencies and the one sided PSDs of shape
+        ``(n_windows, n_frequencies)``.
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    step = max(int(nperseg * (1.0 - overlap)), 1)
+    n_seg = (windows.shape[1] - nperseg) // step + 1
+    # View of all segments of all windows, nothing is copied.
+    segments = np.lib.stride_tricks.as_strided(
+        windows, shape=(windows.shape[0], n_seg, nperseg),
+        strides=(windows.strides[0], step * windows.strides[1],
+                 windows.strides[1]))
+
+    taper = np.hanning(nperseg)
+    scale = 1.0 / (sampling_rate * (taper ** 2).sum())
+    freqs = np.fft.rfftfreq(nperseg, 1.0 / sampling_rate)
+    psd = np.empty((windows.shape[0], len(freqs)))
+
+    batch = max(MAX_BATCH_SAMPLES // (n_seg * nperseg), 1)
+    for i in range(0, windows.shape[0], batch):
+        seg = segments[i:i + batch]
+        seg = (seg - seg.mean(axis=-1)[..., np.newaxis]) * taper
+        spec = np.fft.rfft(seg, axis=-1)
+        psd[i:i + batch] = (spec.real ** 2 + spec.imag ** 2).mean(axis=1)
+    psd *= scale
+    # One sided, DC and Nyquist are not doubled.
+    psd[:, 1:-1 if nperseg % 2 == 0 else None] *= 2.0
+    return freqs, psd
+
+
+def get_log_bins(fmin, fmax, bins_per_octave=BINS_PER_OCTAVE):
+    """
+    Returns the center frequencies and the edges of logarithmically spaced
+    bins between the two frequencies.
+    """
+    n = int(np.floor(np.log2(fmax / fmin) * bins_per_octave)) + 1
+    centers = fmin * 2.0 ** (np.arange(n) / bins_per_octave)
+    edges = np.concatenate([centers / 2 ** (0.5 / bins_per_octave),
+                            centers[-1:] * 2 ** (0.5 / bins_per_octave)])
+    return centers, edges
+
+
+def bin_psd(freqs, psd, edges):
+    """
+    Averages PSDs of shape ``(n_windows, n_frequencies)`` in the bins
+    between the edges. Bins without any frequency are NaN.
+    """
+    start = np.searchsorted(freqs, edges[:-1])
+    stop = np.searchsorted(freqs, edges[1:])
+    cumulative = np.zeros((psd.shape[0], psd.shape[1] + 1))
+    np.cumsum(psd, axis=1, out=cumulative[:, 1:])
+    count = (stop - start).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (cumulative[:, stop] - cumulative[:, start]) / count
+
+
+def get_min_frequency(resolution, bins_per_octave=BINS_PER_OCTAVE):
+    """
+    Lowest bin center for which every logarithmic bin is at least as wide as
+    the frequency resolution and thus contains at least one frequency.
+    """
+    relative_width = 2 ** (0.5 / bins_per_octave) - \
+        2 ** (-0.5 / bins_per_octave)
+    return max(2.0 * resolution, resolution / relative_width)
+
+
+def _get_parameters(sampling_rate, window_length):
+    nperseg = int(2 ** np.floor(np.log2(
+        window_length * SEGMENT_FRACTION * sampling_rate)))
+    centers, edges = get_log_bins(
+        get_min_frequency(sampling_rate / nperseg), sampling_rate / 2.0)
+    return nperseg, centers, edges
+
+
+def spectrogram_chunk(tr, starttime, n_windows, window_length):
+    """
+    Computes the binned PSDs in dB of consecutive windows of a trace. Windows
+    with gaps are NaN.
+
+    :returns: The PSDs of shape ``(n_windows, n_bins)`` and the center
+        frequencies of the bins.
+    """
+    sampling_rate = tr.stats.sampling_rate
+    npts = int(round(window_length * sampling_rate))
+    nperseg, centers, edges = _get_parameters(sampling_rate, window_length)
+
+    data = np.full(n_windows * npts, np.nan)
+    offset = int(round((tr.stats.starttime - starttime) * sampling_rate))
+    values = np.ma.filled(np.ma.asarray(tr.data).astype(np.float64), np.nan)
+    i0, i1 = max(offset, 0), min(offset + len(values), len(data))
+    if i1 > i0:
+        data[i0:i1] = values[i0 - offset:i1 - offset]
+    windows = data.reshape(n_windows, npts)
+
+    result = np.full((n_windows, len(centers)), np.nan)
+    valid = ~np.isnan(windows).any(axis=1)
+    if valid.any():
+        freqs, psd = welch(windows[valid], sampling_rate, nperseg)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[valid] = 10.0 * np.log10(bin_psd(freqs, psd, edges))
+    return result, centers
+
+
+def _get_extract_function(path, virtual):
+    if virtual:
+        import virtual_archive
+        return virtual_archive.VirtualDataSet(path).extract_interval
+
+    import functools
+    import pyasdf
+
+    import extraction
+    from waveform_mmap import WaveformMapping
+    return functools.partial(
+        extraction.extract_interval,
+        pyasdf.ASDFDataSet(path, mode="r"), path,
+        mapping=WaveformMapping(path))
+
+
+def _init_worker(path, virtual):
+    _WORKER_STATE["extract"] = _get_extract_function(path, virtual)
+
+
+def _compute_task(extract, task):
+    st_id, tag, index, starttime, n_windows, window_length = task
+    st = extract(
+        [st_id], [tag], starttime, starttime + n_windows * window_length)
+    if not st:
+        return st_id, tag, index, None, None
+    psd, centers = spectrogram_chunk(st[0], UTCDateTime(starttime),
+                                     n_windows, window_length)
+    return st_id, tag, index, psd, centers
+
+
+def _spectrogram_task(task):
+    return _compute_task(_WORKER_STATE["extract"], task)
+
+
+def _get_spawn_context():
+    """
+    Returns the multiprocessing context spawning fresh processes or None if
+    not available.
+    """
+    try:
+        return multiprocessing.get_context("spawn")
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_windows(avail, row, window_length):
+    """
+    Returns the start of the first window of a row of an
+    :class:`~availability.Availability` and a boolean array of the windows
+    fully covered by data.
+    """
+    starts, ends = avail.get_intervals(row)
+    first = np.floor(starts[0] / window_length) * window_length
+    n_windows = int(np.ceil((ends[-1] - first) / window_length))
+    edges = first + np.arange(n_windows + 1) * window_length
+    covered = availability.get_coverage(starts, ends, edges) >= MIN_COVERAGE
+    return first, covered
+
+
+def get_spectrogram_key(st_id, tag, window_length=DEFAULT_WINDOW_LENGTH):
+    return "%s__%s__%is" % (st_id, tag, int(window_length))
+
+
+def compute_spectrograms(path, avail, channels, virtual=False,
+                         window_length=DEFAULT_WINDOW_LENGTH,
+                         processes=None):
+    """
+    Computes the spectrograms of channels in a pool of processes.
+
+    :param path: The ASDF file or the path of a virtual data set.
+    :param avail: The :class:`~availability.Availability` of the station.
+    :param channels: List of ``(NET.STA.LOC.CHA, tag)`` tuples.
+    :returns: Dictionary of the :class:`SpectralData` per
+        :func:`get_spectrogram_key`.
+    """
+    tasks = []
+    layouts = {}
+    for st_id, tag in channels:
+        row = avail.channels.index((st_id, tag))
+        first, covered = get_windows(avail, row, window_length)
+        layouts[(st_id, tag)] = (first, len(covered))
+        for index in range(0, len(covered), CHUNK_WINDOWS):
+            if not covered[index:index + CHUNK_WINDOWS].any():
+                continue
+            tasks.append((st_id, tag, index, first + index * window_length,
+                          min(CHUNK_WINDOWS, len(covered) - index),
+                          window_length))
+
+    results = {}
+    context = _get_spawn_context()
+    if context is None:
+        pool = None
+        extract = _get_extract_function(path, virtual)
+        chunks = (_compute_task(extract, _i) for _i in tasks)
+    else:
+        pool = context.Pool(processes, initializer=_init_worker,
+                            initargs=(path, virtual))
+        chunks = pool.imap_unordered(_spectrogram_task, tasks)
+    try:
+        for st_id, tag, index, psd, centers in chunks:
+            if psd is None:
+                continue
+            if (st_id, tag) not in results:
+                first, n_windows = layouts[(st_id, tag)]
+                results[(st_id, tag)] = (
+                    np.full((n_windows, len(centers)), np.nan,
+                            dtype=np.float32), centers)
+            data, first_centers = results[(st_id, tag)]
+            # A changed sampling rate yields other bins, such windows are
+            # left out.
+            if np.array_equal(centers, first_centers):
+                data[index:index + len(psd)] = psd
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    spectrograms = {}
+    for (st_id, tag), (data, centers) in results.items():
+        first, n_windows = layouts[(st_id, tag)]
+        spectrograms[get_spectrogram_key(st_id, tag, window_length)] = \
+            SpectralData(data=data, provenance_id=None, parameters={
+                "seed_id": st_id, "tag": tag,
+                "starttime": str(UTCDateTime(first)),
+                "window_length": window_length,
+                "min_frequency": centers[0], "max_frequency": centers[-1],
+                "bins_per_octave": BINS_PER_OCTAVE,
+                "units": "dB rel. 1 counts^2/Hz"})
+    return spectrograms
+
+
+def get_sidecar_filename(path, virtual=False):
+    """
+    Returns the sidecar file of an ASDF file or a virtual data set.
+    """
+    if virtual:
+        import virtual_archive
+        return os.path.splitext(virtual_archive.get_index_filename(
+            path))[0] + ".spectra.h5"
+    return os.path.splitext(path)[0] + ".spectra.h5"
+
+
+class SpectralCache(object):
+    """
+    HDF5 sidecar file with the computed spectrograms.
+
+    The file is only opened while reading or writing so it never blocks
+    other threads or processes for long.
+
+    :param source_filename: Cached spectrograms older than this file are
+        outdated.
+    """
+    def __init__(self, filename, source_filename):
+        self.filename = filename
+        self.source_filename = source_filename
+
+    def _open(self, mode):
+        import h5py
+        return h5py.File(self.filename, mode)
+
+    def _source_mtime(self):
+        return os.path.getmtime(self.source_filename)
+
+    def keys(self):
+        if not os.path.exists(self.filename):
+            return []
+        with self._open("r") as f:
+            return sorted(
+                str(_i) for _i in f.keys()
+                if f[_i].attrs.get("source_mtime") == self._source_mtime() and
+                f[_i].attrs.get("format_version") == FORMAT_VERSION)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key):
+        """
+        Returns the cached :class:`SpectralData` or None.
+        """
+        if key not in self:
+            return None
+        with self._open("r") as f:
+            dset = f[key]
+            parameters = dict(
+                (str(k), v) for k, v in dset.attrs.items()
+                if k not in ("source_mtime", "format_version"))
+            return SpectralData(data=dset[()], parameters=parameters,
+                                provenance_id=None)
+
+    def put(self, key, spectral_data):
+        with self._open("a") as f:
+            if key in f:
+                del f[key]
+            dset = f.create_dataset(key, data=spectral_data.data,
+                                    compression="gzip")
+            for k, v in spectral_data.parameters.items():
+                dset.attrs[k] = v
+            dset.attrs["source_mtime"] = self._source_mtime()
+            dset.attrs["format_version"] = FORMAT_VERSION
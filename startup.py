@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Records when the application started.
+
+Imported first by ``main`` so the time to the first paint of the main window
+includes importing Qt and all other dependencies.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import time
+
+STARTUP_TIME = time.time()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Models of the station selection dialog.
+
+The check states of all stations are kept in one array so checking or
+unchecking any number of stations is a single model update and the number
+of checked stations is always known without iterating over the items.
+Stations are grouped by network or by the geographic region of their
+coordinates and filtering by name and network is evaluated for all stations
+at once.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+from PyQt4 import QtCore, QtGui
+
+# Group of the stations without coordinates.
+UNKNOWN_REGION = "Unknown Region"
+
+
+def _to_int(value):
+    # Compat for the different QVariant APIs.
+    try:
+        value = value.toInt()[0]
+    except AttributeError:
+        pass
+    return int(value)
+
+
+def get_regions(stations, coordinates):
+    """
+    Flinn-Engdahl region of each ``NET.STA`` station.
+
+    :param coordinates: Dictionary of the coordinates of the stations as
+        returned by ``ASDFDataSet.get_all_coordinates()``.
+    """
+    from obspy.geodetics import FlinnEngdahl
+    fe = FlinnEngdahl()
+    regions = []
+    for station in stations:
+        coords = coordinates.get(station)
+        if not coords:
+            regions.append(UNKNOWN_REGION)
+            continue
+        regions.append(fe.get_region(coords["longitude"],
+                                     coords["latitude"]).title())
+    return regions
+
+
+class _Group(object):
+    """
+    Parent of the indices of the stations of a group.
+    """
+    def __init__(self, row):
+        self.row = row
+
+
+class StationTreeModel(QtCore.QAbstractItemModel):
+    """
+    Checkable ``NET.STA`` stations, grouped by network by default.
+
+    The top level rows are the groups, checking one checks all of its
+    stations. Rows passed to and returned by the methods are indices into
+    ``stations``.
+    """
+    # Emits the total number of checked stations.
+    checkedCountChanged = QtCore.pyqtSignal(int)
+
+    def __init__(self, stations, checked=True, parent=None):
+        super(StationTreeModel, self).__init__(parent)
+        self.stations = list(stations)
+        self.networks = [_i.split(".")[0] for _i in self.stations]
+        self._checked = np.empty(len(self.stations), dtype=bool)
+        self._checked[:] = checked
+        self.checked_count = int(self._checked.sum())
+        self._set_groups(self.networks)
+
+    def _set_groups(self, groups):
+        self.group_names, codes = np.unique(
+            np.array(groups, dtype=np.str_), return_inverse=True)
+        self._codes = codes.ravel()
+        # The stations of each group in the order of ``stations``.
+        order = np.argsort(self._codes, kind="mergesort")
+        bounds = np.searchsorted(self._codes[order],
+                                 np.arange(len(self.group_names) + 1))
+        self._group_rows = [order[bounds[_i]:bounds[_i + 1]]
+                            for _i in range(len(self.group_names))]
+        self._groups = [_Group(_i) for _i in range(len(self.group_names))]
+
+    def set_groups(self, groups):
+        """
+        Groups the stations by the given group name of each station.
+        """
+        self.beginResetModel()
+        self._set_groups(groups)
+        self.endResetModel()
+
+    def get_group_rows(self, group):
+        return self._group_rows[group]
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column)
+        return self.createIndex(row, column, self._groups[parent.row()])
+
+    def parent(self, index):
+        if not index.isValid() or index.internalPointer() is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(index.internalPointer().row, 0)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return len(self.group_names)
+        if parent.internalPointer() is None:
+            return len(self._group_rows[parent.row()])
+        return 0
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def station_row(self, index):
+        """
+        Row in ``stations`` of the index of a station, None for groups.
+        """
+        group = index.internalPointer()
+        if group is None:
+            return None
+        return int(self._group_rows[group.row][index.row()])
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.station_row(index)
+        if row is None:
+            rows = self._group_rows[index.row()]
+            if role == QtCore.Qt.DisplayRole:
+                return "%s (%i)" % (self.group_names[index.row()], len(rows))
+            elif role == QtCore.Qt.CheckStateRole:
+                checked = self.count_checked(rows)
+                if checked == len(rows):
+                    return QtCore.Qt.Checked
+                return QtCore.Qt.PartiallyChecked if checked else \
+                    QtCore.Qt.Unchecked
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self.stations[row]
+        elif role == QtCore.Qt.CheckStateRole:
+            return QtCore.Qt.Checked if self._checked[row] else \
+                QtCore.Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | \
+            QtCore.Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or role != QtCore.Qt.CheckStateRole:
+            return False
+        row = self.station_row(index)
+        rows = self._group_rows[index.row()] if row is None else [row]
+        # Partially checked groups are checked with the next click.
+        self.set_checked(rows, _to_int(value) != QtCore.Qt.Unchecked)
+        return True
+
+    def set_checked(self, rows, checked):
+        """
+        Sets the check state of many rows with a single change signal per
+        affected group.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        self._checked[rows] = checked
+        self.checked_count = int(self._checked.sum())
+        for group in np.unique(self._codes[rows]):
+            group_index = self.index(int(group), 0)
+            self.dataChanged.emit(group_index, group_index)
+            self.dataChanged.emit(
+                self.index(0, 0, group_index),
+                self.index(len(self._group_rows[group]) - 1, 0, group_index))
+        self.checkedCountChanged.emit(self.checked_count)
+
+    def count_checked(self, rows):
+        return int(self._checked[np.asarray(rows, dtype=np.int64)].sum())
+
+    def get_checked(self):
+        return [self.stations[_i] for _i in np.flatnonzero(self._checked)]
+
+
+class StationFilterProxyModel(QtGui.QSortFilterProxyModel):
+    """
+    Shows the stations of a network containing a text, case insensitive,
+    and the groups with any shown station.
+    """
+    def __init__(self, parent=None):
+        super(StationFilterProxyModel, self).__init__(parent)
+        self._text = ""
+        self._network = None
+        self._accepted = np.ones(0, dtype=bool)
+
+    def setSourceModel(self, model):
+        self._names = np.char.lower(np.array(model.stations, dtype=np.str_))
+        self._networks = np.array(model.networks, dtype=np.str_)
+        super(StationFilterProxyModel, self).setSourceModel(model)
+        self._update()
+
+    def set_text(self, text):
+        self._text = text.strip().lower()
+        self._update()
+
+    def set_network(self, network):
+        self._network = network
+        self._update()
+
+    def _update(self):
+        if self.sourceModel() is None:
+            return
+        accepted = np.ones(len(self._names), dtype=bool)
+        if self._text and len(self._names):
+            accepted &= np.char.find(self._names, self._text) >= 0
+        if self._network is not None:
+            accepted &= self._networks == self._network
+        self._accepted = accepted
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        # Rows are filtered while the source model is set, before the
+        # filter has been evaluated for it.
+        if len(self._accepted) != len(self._names):
+            return True
+        model = self.sourceModel()
+        if not source_parent.isValid():
+            return bool(self._accepted[
+                model.get_group_rows(source_row)].any())
+        return bool(self._accepted[
+            model.get_group_rows(source_parent.row())[source_row]])
+
+    def get_source_rows(self):
+        """
+        Rows of the source model of all shown stations.
+        """
+        return np.flatnonzero(self._accepted)
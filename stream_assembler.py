@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Assembling time windows from segmented continuous waveforms.
+
+Instead of reading all overlapping segments completely, merging and then
+trimming them, one output array per channel is allocated for the requested
+window and only the overlapping samples of each segment are read directly
+into it. Samples not covered by any segment are masked and, like with
+merging and trimming, the window is cut to the first and last sample with
+data of each channel. Memory usage is
+thus proportional to the length of the window and not to the length of the
+segments.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+
+from obspy.core import AttribDict, Stream, Trace, UTCDateTime
+
+__all__ = ["WindowAssembler", "assemble_window"]
+
+
+def parse_full_id(full_id):
+    """
+    Splits an ASDF waveform name ``NET.STA.LOC.CHA__START__END__TAG`` into
+    the SEED id and the tag.
+    """
+    parts = full_id.split("__")
+    return parts[0], parts[-1]
+
+
+class _Channel(object):
+    def __init__(self, seed_id, tag, sampling_rate, starttime, npts, dtype):
+        self.seed_id = seed_id
+        self.tag = tag
+        self.sampling_rate = sampling_rate
+        self.starttime = starttime
+        self.data = np.zeros(npts, dtype=dtype)
+        # True for samples not (yet) covered by any segment.
+        self.mask = np.ones(npts, dtype=bool)
+
+
+class WindowAssembler(object):
+    """
+    Assembles a time window from segments, one channel per SEED id, tag and
+    sampling rate.
+
+    The output samples of a channel are aligned to the samples of the first
+    segment added for it, starting with the sample nearest to the start of
+    the window.
+    """
+    def __init__(self, starttime, endtime):
+        self.starttime = UTCDateTime(starttime)
+        self.endtime = UTCDateTime(endtime)
+        self._channels = {}
+
+    def _get_channel(self, seed_id, tag, sampling_rate, seg_starttime, dtype):
+        key = (seed_id, tag, sampling_rate)
+        if key not in self._channels:
+            offset = int(round((self.starttime - seg_starttime) *
+                               sampling_rate))
+            starttime = seg_starttime + offset / sampling_rate
+            npts = int(round((self.endtime - starttime) *
+                             sampling_rate)) + 1
+            if npts <= 0:
+                return None
+            self._channels[key] = _Channel(seed_id, tag, sampling_rate,
+                                           starttime, npts, dtype)
+        return self._channels[key]
+
+    def add_segment(self, seed_id, tag, starttime, sampling_rate, npts,
+                    read, dtype):
+        """
+        Adds the overlapping part of a segment.
+
+        :param starttime: Time of the first sample of the segment.
+        :param npts: Number of samples of the segment.
+        :param read: Function returning the samples ``[i0:i1]`` of the
+            segment. Only called with the overlapping range.
+        """
+        channel = self._get_channel(seed_id, tag, sampling_rate, starttime,
+                                    dtype)
+        if channel is None:
+            return
+        # Index of the first sample of the segment in the output array.
+        o0 = int(round((starttime - channel.starttime) * sampling_rate))
+        i0 = max(0, -o0)
+        i1 = min(npts, len(channel.data) - o0)
+        if i1 <= i0:
+            return
+        channel.data[o0 + i0:o0 + i1] = read(i0, i1)
+        channel.mask[o0 + i0:o0 + i1] = False
+
+    def add_dataset(self, full_id, dset, mapping=None):
+        """
+        Adds a waveform data set of an ASDF file, only reading the samples
+        inside the window.
+
+        :param mapping: Optional :class:`~waveform_mmap.WaveformMapping` of
+            the file to read the samples from without going through h5py.
+        """
+        seed_id, tag = parse_full_id(full_id)
+        starttime = UTCDateTime(ns=int(dset.attrs["starttime"]))
+        sampling_rate = float(dset.attrs["sampling_rate"])
+        data = dset if mapping is None else mapping.get_data(dset)
+        self.add_segment(seed_id, tag, starttime, sampling_rate,
+                         dset.shape[0], lambda i0, i1: data[i0:i1],
+                         dset.dtype)
+
+    def add_trace(self, tr, tag):
+        """
+        Adds an already read trace.
+        """
+        self.add_segment(tr.id, tag, tr.stats.starttime,
+                         tr.stats.sampling_rate, tr.stats.npts,
+                         lambda i0, i1: tr.data[i0:i1], tr.data.dtype)
+
+    def get_stream(self):
+        """
+        Returns the assembled stream. Each channel starts and ends with its
+        first and last sample with data, gaps in between are masked.
+        Channels without any data are skipped.
+        """
+        st = Stream()
+        for key in sorted(self._channels.keys()):
+            channel = self._channels[key]
+            valid = np.flatnonzero(~channel.mask)
+            if not len(valid):
+                continue
+            i0, i1 = valid[0], valid[-1] + 1
+            mask = channel.mask[i0:i1]
+            if mask.any():
+                data = np.ma.masked_array(channel.data[i0:i1], mask=mask)
+            else:
+                data = channel.data[i0:i1]
+            network, station, location, cha = channel.seed_id.split(".")
+            tr = Trace(data=data, header={
+                "network": network, "station": station,
+                "location": location, "channel": cha,
+                "starttime": channel.starttime +
+                i0 / channel.sampling_rate,
+                "sampling_rate": channel.sampling_rate})
+            tr.stats.asdf = AttribDict({"tag": channel.tag})
+            st.append(tr)
+        return st
+
+
+def assemble_window(ds, waveforms, starttime, endtime, mapping=None):
+    """
+    Assembles a time window from waveforms of an ASDF data set.
+
+    :param ds: The ASDFDataSet.
+    :param waveforms: Iterable of ``(station, full_id)`` tuples, e.g.
+        ``("AU.ARMA", "AU.ARMA..BHZ__2015-...__2015-...__raw_recording")``.
+    :param mapping: Optional :class:`~waveform_mmap.WaveformMapping` of the
+        file.
+    :returns: The assembled Stream.
+    """
+    assembler = WindowAssembler(starttime, endtime)
+    for station, full_id in waveforms:
+        assembler.add_dataset(full_id, ds._waveform_group[station][full_id],
+                              mapping=mapping)
+    return assembler.get_stream()
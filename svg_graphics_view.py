@@ -1,3 +1,6 @@
+import math
+from collections import OrderedDict
+
 import sip
 try:
     sip.setapi('QString', 2)
@@ -7,6 +10,230 @@ except:
 from PyQt4 import QtGui, QtSvg, QtCore  # NOQA
 
 
+from workers import run_in_background  # NOQA
+
+
+# Size of a single tile in pixels.
+TILE_SIZE = 256
+# Zoom levels are powers of two of the scale, this is the supported range.
+MIN_LEVEL = -8
+MAX_LEVEL = 6
+# Maximum number of cached tiles - about 256 MB.
+MAX_TILES = 1024
+# Missing tiles within blocks of this many tiles per side are rendered
+# together with a single render of the document.
+BLOCK_TILES = 16
+# Idle time after an interaction until tiles are refined in milliseconds.
+REFINE_DELAY = 150
+
+_RENDER_POOL = []
+
+
+def _get_render_pool():
+    """
+    Pool with a single thread so a renderer is never used concurrently.
+    """
+    if not _RENDER_POOL:
+        pool = QtCore.QThreadPool()
+        pool.setMaxThreadCount(1)
+        _RENDER_POOL.append(pool)
+    return _RENDER_POOL[0]
+
+
+def get_tile_rect(key):
+    level, tx, ty = key
+    size = TILE_SIZE / 2.0 ** level
+    return QtCore.QRectF(tx * size, ty * size, size, size)
+
+
+def render_tiles(renderer, bounds, keys, alive=None):
+    """
+    Renders tiles of the same level into QImages with a single render of
+    the area covering all of them. Safe to call outside of the GUI thread.
+
+    :param alive: Optional list whose first item turns False once the
+        tiles are no longer needed.
+    :returns: List of ``(key, image)`` tuples.
+    """
+    if alive is not None and not alive[0]:
+        return []
+    level = keys[0][0]
+    scale = 2.0 ** level
+    area = get_tile_rect(keys[0])
+    for key in keys[1:]:
+        area = area.united(get_tile_rect(key))
+    image = QtGui.QImage(int(round(area.width() * scale)),
+                         int(round(area.height() * scale)),
+                         QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(QtCore.Qt.transparent)
+    painter = QtGui.QPainter(image)
+    painter.setRenderHint(QtGui.QPainter.Antialiasing)
+    painter.scale(scale, scale)
+    painter.translate(-area.topLeft())
+    painter.setClipRect(area)
+    renderer.render(painter, bounds)
+    painter.end()
+
+    tiles = []
+    for key in keys:
+        rect = get_tile_rect(key)
+        tiles.append((key, image.copy(
+            int(round((rect.left() - area.left()) * scale)),
+            int(round((rect.top() - area.top()) * scale)),
+            TILE_SIZE, TILE_SIZE)))
+    return tiles
+
+
+class TiledSvgItem(QtGui.QGraphicsObject):
+    """
+    Draws a SVG from a pyramid of cached raster tiles.
+
+    The scene is split into tiles at discrete zoom levels. While zooming and
+    panning only cached tiles are drawn, upscaled from coarser levels if
+    necessary, and missing tiles are rendered once the interaction stopped.
+    Tiles are rendered in a background thread, all missing tiles of a block
+    with a single render of the document, so rendering never blocks the
+    GUI. This keeps very large graphs interactive.
+    """
+    def __init__(self, filename, parent=None):
+        super(TiledSvgItem, self).__init__(parent)
+        # Only used by the render thread once the size is known.
+        self.renderer = QtSvg.QSvgRenderer(filename)
+        self._rect = QtCore.QRectF(QtCore.QPointF(0, 0),
+                                   QtCore.QSizeF(self.renderer.defaultSize()))
+        self._tiles = OrderedDict()
+        # Tiles to render in the next refinement pass.
+        self._missing = OrderedDict()
+        # Tiles being rendered.
+        self._pending = set()
+        # Pending renders are skipped once the item has been deleted.
+        alive = self._alive = [True]
+        self.destroyed.connect(lambda *args: alive.__setitem__(0, False))
+
+        self._refine_timer = QtCore.QTimer(self)
+        self._refine_timer.setSingleShot(True)
+        self._refine_timer.timeout.connect(self._refine)
+
+        # Coarsest level which always covers the whole graph.
+        longest = max(self._rect.width(), self._rect.height(), 1.0)
+        self._base_level = max(MIN_LEVEL, min(0, int(math.floor(
+            math.log(2048.0 / longest, 2)))))
+        self._render(self._get_tile_keys(self._base_level, self._rect))
+
+    def boundingRect(self):
+        return self._rect
+
+    def _get_tile_rect(self, key):
+        return get_tile_rect(key)
+
+    def _get_tile_keys(self, level, rect):
+        size = TILE_SIZE / 2.0 ** level
+        rect = rect.intersected(self._rect)
+        if rect.isEmpty():
+            return []
+        return [(level, tx, ty)
+                for ty in range(int(rect.top() // size),
+                                int(math.ceil(rect.bottom() / size)))
+                for tx in range(int(rect.left() // size),
+                                int(math.ceil(rect.right() / size)))]
+
+    def _render(self, keys):
+        """
+        Renders tiles in the background, one render per level and block.
+        """
+        blocks = OrderedDict()
+        for key in keys:
+            if key in self._pending or key in self._tiles:
+                continue
+            self._pending.add(key)
+            level, tx, ty = key
+            blocks.setdefault((level, tx // BLOCK_TILES, ty // BLOCK_TILES),
+                              []).append(key)
+
+        alive = self._alive
+
+        def on_rendered(tiles, runtime):
+            if not alive[0]:
+                return
+            for key, image in tiles:
+                self._pending.discard(key)
+                self._add_tile(key, QtGui.QPixmap.fromImage(image))
+            self.update()
+
+        for block_keys in blocks.values():
+            run_in_background(render_tiles, on_rendered,
+                              pool=_get_render_pool(),
+                              args=(self.renderer, self._rect, block_keys,
+                                    alive))
+
+    def _add_tile(self, key, pixmap):
+        self._tiles[key] = pixmap
+        # Evict the least recently used tiles but never the base level.
+        while len(self._tiles) > MAX_TILES:
+            for old_key in self._tiles:
+                if old_key[0] != self._base_level:
+                    del self._tiles[old_key]
+                    break
+            else:
+                break
+
+    def _get_tile(self, key):
+        pixmap = self._tiles.pop(key, None)
+        if pixmap is not None:
+            self._tiles[key] = pixmap
+        return pixmap
+
+    def _draw_from_coarser_levels(self, painter, key):
+        """
+        Draws the area of a missing tile from the finest available coarser
+        tile.
+        """
+        rect = self._get_tile_rect(key)
+        for level in range(key[0] - 1, self._base_level - 1, -1):
+            tiles = self._get_tile_keys(level, rect)
+            if not tiles:
+                return
+            pixmaps = [self._get_tile(_i) for _i in tiles]
+            if any(_i is None for _i in pixmaps):
+                continue
+            scale = 2.0 ** level
+            for tile, pixmap in zip(tiles, pixmaps):
+                tile_rect = self._get_tile_rect(tile)
+                target = tile_rect.intersected(rect)
+                source = QtCore.QRectF(
+                    (target.left() - tile_rect.left()) * scale,
+                    (target.top() - tile_rect.top()) * scale,
+                    target.width() * scale, target.height() * scale)
+                painter.drawPixmap(target, pixmap, source)
+            return
+
+    def paint(self, painter, option, widget=None):
+        scale = QtGui.QStyleOptionGraphicsItem.levelOfDetailFromTransform(
+            painter.worldTransform())
+        level = int(math.ceil(math.log(max(scale, 1E-6), 2)))
+        level = max(self._base_level, min(MAX_LEVEL, level))
+
+        # Only the tiles of the current view are of interest.
+        self._missing.clear()
+        for key in self._get_tile_keys(level, option.exposedRect):
+            pixmap = self._get_tile(key)
+            if pixmap is None:
+                if key not in self._pending:
+                    self._missing[key] = None
+                self._draw_from_coarser_levels(painter, key)
+                continue
+            painter.drawPixmap(self._get_tile_rect(key), pixmap,
+                               QtCore.QRectF(pixmap.rect()))
+        # Refine once the interaction stopped.
+        if self._missing:
+            self._refine_timer.start(REFINE_DELAY)
+
+    def _refine(self):
+        keys = list(self._missing.keys())
+        self._missing.clear()
+        self._render(keys)
+
+
 class SvgGraphicsView(QtGui.QGraphicsView):
     def __init__(self, parent=None):
         super(SvgGraphicsView, self).__init__(parent)
@@ -15,6 +242,9 @@ class SvgGraphicsView(QtGui.QGraphicsView):
         self.renderer = 0
         self.setViewport(QtGui.QWidget())
         self.svgItem = None
+        # Render the graphs from cached tiles. If False, the native
+        # QGraphicsSvgItem rendering the whole SVG on every change is used.
+        self.tiled_rendering = True
 
         self.setScene(QtGui.QGraphicsScene(self))
         self.setTransformationAnchor(QtGui.QGraphicsView.AnchorUnderMouse)
@@ -32,9 +262,16 @@ class SvgGraphicsView(QtGui.QGraphicsView):
         s.clear()
         self.resetTransform()
 
-        self.svgItem = QtSvg.QGraphicsSvgItem(svg_file.fileName())
-        self.svgItem.setFlags(QtGui.QGraphicsItem.ItemClipsToShape)
-        self.svgItem.setCacheMode(QtGui.QGraphicsItem.NoCache)
+        if self.tiled_rendering:
+            self.svgItem = TiledSvgItem(svg_file.fileName())
+            # Required to only draw the exposed tiles.
+            self.svgItem.setFlags(
+                QtGui.QGraphicsItem.ItemClipsToShape |
+                QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
+        else:
+            self.svgItem = QtSvg.QGraphicsSvgItem(svg_file.fileName())
+            self.svgItem.setFlags(QtGui.QGraphicsItem.ItemClipsToShape)
+            self.svgItem.setCacheMode(QtGui.QGraphicsItem.NoCache)
         self.svgItem.setZValue(0)
 
         s.addItem(self.svgItem)
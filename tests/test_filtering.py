@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the stateful filtering of paged windows.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+import numpy as np
+from obspy.core import Stream, Trace, UTCDateTime
+from scipy.signal import sosfilt, sosfilt_zi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from filtering import (FilterSettings, StreamingFilter,  # NOQA
+                       get_preroll_length, get_sos)
+
+T0 = UTCDateTime(2015, 1, 1)
+SETTINGS = FilterSettings("bandpass", 0.5, 2.0, 4)
+SAMPLING_RATE = 20.0
+
+
+def _continuous_data():
+    return np.random.RandomState(42).randn(20000) + 100.0
+
+
+def _read(data, starttime, endtime):
+    first = int(np.ceil((starttime - T0.timestamp) * SAMPLING_RATE))
+    last = int(np.floor((endtime - T0.timestamp) * SAMPLING_RATE))
+    first = max(first, 0)
+    return Trace(data=data[first:last + 1], header={
+        "network": "XX", "station": "A", "channel": "BHZ",
+        "starttime": T0 + first / SAMPLING_RATE,
+        "sampling_rate": SAMPLING_RATE})
+
+
+def test_forward_pages_continue_the_filter():
+    data = _continuous_data()
+    f = StreamingFilter()
+    first = f.filter(Stream([_read(data, T0.timestamp,
+                                   T0.timestamp + 99.95)]), SETTINGS)
+    second = f.filter(Stream([_read(data, T0.timestamp + 90,
+                                    T0.timestamp + 189.95)]), SETTINGS)
+
+    sos = get_sos(SETTINGS, SAMPLING_RATE)
+    expected = sosfilt(sos, data[:3800], zi=sosfilt_zi(sos) * data[0])[0]
+    np.testing.assert_allclose(first[0].data, expected[:2000])
+    np.testing.assert_allclose(second[0].data, expected[1800:3800])
+
+
+def test_backward_page_starts_after_preroll():
+    data = _continuous_data()
+
+    def read_preroll(st_ids, st_tags, starttime, endtime):
+        return [_read(data, starttime, endtime)]
+
+    f = StreamingFilter()
+    starttime = T0.timestamp + 500
+    page = f.filter(Stream([_read(data, starttime, starttime + 99.95)]),
+                    SETTINGS, read_preroll=read_preroll)
+
+    sos = get_sos(SETTINGS, SAMPLING_RATE)
+    n = int(round(get_preroll_length(SETTINGS, SAMPLING_RATE) *
+                  SAMPLING_RATE))
+    x = data[10000 - n:12000]
+    expected = sosfilt(sos, x, zi=sosfilt_zi(sos) * x[0])[0][n:]
+    np.testing.assert_allclose(page[0].data, expected)
+
+    # The filter has settled: same as filtering all data from the start.
+    full = sosfilt(sos, data[:12000], zi=sosfilt_zi(sos) * data[0])[0]
+    np.testing.assert_allclose(page[0].data, full[10000:], atol=1E-6)
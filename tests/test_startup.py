@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the startup time against the budgets of the startup benchmark.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "benchmarks"))
+
+import startup_benchmark  # NOQA
+
+pytest.importorskip("PyQt4.QtGui")
+if not os.environ.get("DISPLAY") and \
+        os.environ.get("QT_QPA_PLATFORM") != "offscreen":
+    pytest.skip("Requires a display.", allow_module_level=True)
+
+
+def test_main_import_time():
+    import_time = startup_benchmark.measure_import_times(["main"])["main"]
+    assert import_time is not None
+    assert import_time < startup_benchmark.MAIN_IMPORT_BUDGET
+
+
+def test_time_to_first_paint():
+    results = startup_benchmark.measure_time_to_first_paint()
+    assert results["time_to_first_paint"] < \
+        startup_benchmark.FIRST_PAINT_BUDGET
+    assert results["loaded_modules"] == []
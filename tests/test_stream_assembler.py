@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the window assembly of segmented waveforms.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+import numpy as np
+from obspy.core import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from stream_assembler import WindowAssembler  # NOQA
+
+T0 = UTCDateTime(2015, 1, 1)
+
+
+def _trace(starttime, npts):
+    return Trace(data=np.arange(npts, dtype=np.float64), header={
+        "network": "XX", "station": "A", "channel": "BHZ",
+        "starttime": starttime, "sampling_rate": 1.0})
+
+
+def _assemble(traces, starttime, endtime):
+    assembler = WindowAssembler(starttime, endtime)
+    for tr in traces:
+        assembler.add_trace(tr, "raw_recording")
+    return assembler.get_stream()
+
+
+def test_window_extending_past_data():
+    # Data from t0 to t0 + 99, window from t0 - 10 to t0 + 50.
+    tr = _trace(T0, 100)
+    st = _assemble([tr], T0 - 10, T0 + 50)
+    expected = Stream([tr.copy()]).trim(T0 - 10, T0 + 50)
+
+    assert len(st) == 1
+    assert st[0].stats.starttime == expected[0].stats.starttime == T0
+    assert st[0].stats.npts == expected[0].stats.npts == 51
+    assert not np.ma.is_masked(st[0].data)
+    np.testing.assert_array_equal(st[0].data, expected[0].data)
+    # Must not raise for masked values.
+    st.detrend("linear")
+
+
+def test_window_extending_past_both_ends():
+    st = _assemble([_trace(T0, 20)], T0 - 10, T0 + 50)
+    assert st[0].stats.starttime == T0
+    assert st[0].stats.endtime == T0 + 19
+    assert not np.ma.is_masked(st[0].data)
+
+
+def test_gap_is_masked():
+    st = _assemble([_trace(T0, 10), _trace(T0 + 20, 10)], T0 - 5, T0 + 40)
+    assert st[0].stats.starttime == T0
+    assert st[0].stats.npts == 30
+    mask = np.ma.getmaskarray(st[0].data)
+    assert not mask[:10].any() and mask[10:20].all() and \
+        not mask[20:].any()
+
+
+def test_window_without_data():
+    assert not _assemble([_trace(T0, 10)], T0 + 20, T0 + 30)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the waveform cache.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+import numpy as np
+from obspy.core import Trace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from waveform_cache import WaveformCache, get_trace_key  # NOQA
+
+
+def test_empty_keys_are_hits():
+    cache = WaveformCache()
+    key_a = get_trace_key("XX.A..BHZ", "raw_recording", 0.0, 10.0)
+    key_b = get_trace_key("XX.B..BHZ", "raw_recording", 0.0, 10.0)
+    cache.put(key_a, Trace(data=np.zeros(11)))
+    cache.put_empty(key_b)
+
+    assert key_b in cache
+    assert cache.get(key_b) is None
+    st = cache.get_stream([key_a, key_b])
+    assert st is not None and len(st) == 1
+
+
+def test_missing_key_is_a_miss():
+    cache = WaveformCache()
+    cache.put_empty(get_trace_key("XX.B..BHZ", "raw_recording", 0.0, 10.0))
+    assert cache.get_stream([get_trace_key(
+        "XX.A..BHZ", "raw_recording", 0.0, 10.0)]) is None
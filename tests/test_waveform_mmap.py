@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the memory mapped waveform reads.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+
+import h5py
+import numpy as np
+import pyasdf
+from obspy.core import Trace, UTCDateTime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from waveform_mmap import WaveformMapping, read_waveform  # NOQA
+
+
+def test_same_stats_as_pyasdf(tmpdir):
+    filename = os.path.join(tmpdir.strpath, "test.h5")
+    tr = Trace(data=np.arange(100, dtype=np.float64), header={
+        "network": "XX", "station": "A", "channel": "BHZ",
+        "starttime": UTCDateTime(2015, 1, 1), "sampling_rate": 10.0})
+    ds = pyasdf.ASDFDataSet(filename, compression=None)
+    ds.add_waveforms(tr, tag="raw_recording",
+                     event_id="smi:local/event/1",
+                     origin_id="smi:local/origin/1",
+                     provenance_id="{http://example.org}prov",
+                     labels=["first", "second"])
+    full_id = ds.waveforms["XX.A"].list()[0]
+    del ds
+
+    # pyasdf writes chunked data sets with checksums, other writers store
+    # them contiguously.
+    with h5py.File(filename, "r+") as f:
+        group = f["Waveforms"]["XX.A"]
+        data = group[full_id][()]
+        attrs = dict(group[full_id].attrs)
+        del group[full_id]
+        group.create_dataset(full_id, data=data)
+        group[full_id].attrs.update(attrs)
+
+    ds = pyasdf.ASDFDataSet(filename, mode="r")
+    mapped = read_waveform(ds, "XX.A", full_id, WaveformMapping(filename))
+    expected = ds.waveforms["XX.A"][full_id][0]
+    # The data is memory mapped, not read by pyasdf.
+    assert isinstance(mapped.data, np.memmap)
+    np.testing.assert_array_equal(mapped.data, expected.data)
+    assert mapped.stats._format == expected.stats._format
+    assert dict(mapped.stats.asdf) == dict(expected.stats.asdf)
+    del ds
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Loading of the Qt Designer generated user interfaces.
+
+The .ui files are compiled with pyuic4 at most once per revision of a .ui
+file. A prebuilt module next to the .ui file (e.g. created by running this
+module as a script after checking out a new version) is used if it is not
+older than the .ui file. Otherwise the compiled module is cached in a user
+cache directory so the application directory does not have to be writable and
+no compilation happens on subsequent launches.
+
+Every ui module is only loaded when it is requested for the first time.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import imp
+import os
+import sys
+
+UI_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Already loaded ui modules.
+_UI_MODULES = {}
+
+
+def get_cache_directory():
+    """
+    Directory used to store compiled ui files and other cached artifacts.
+
+    Can be overwritten with the ASDF_SEXTANT_CACHE_DIR environment variable
+    which is useful if the home directory lives on a slow network file system.
+    """
+    if "ASDF_SEXTANT_CACHE_DIR" in os.environ:
+        return os.environ["ASDF_SEXTANT_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "asdf_sextant")
+
+
+def _compile_ui_file(ui_file, py_ui_file):
+    from PyQt4 import uic
+    print("Compiling ui file: %s" % ui_file)
+    # Write to a temporary file first so concurrently starting instances
+    # never import a half written module.
+    tmp_file = "%s.%i.tmp" % (py_ui_file, os.getpid())
+    with open(tmp_file, "w") as open_file:
+        uic.compileUi(ui_file, open_file)
+    os.rename(tmp_file, py_ui_file)
+
+
+def _get_py_ui_file(name):
+    """
+    Returns the path to an up-to-date compiled version of the given ui file,
+    compiling it if necessary.
+    """
+    ui_file = os.path.join(UI_DIRECTORY, name + os.path.extsep + "ui")
+    ui_stat = os.stat(ui_file)
+
+    # A prebuilt module shipped alongside the .ui file.
+    prebuilt = os.path.join(UI_DIRECTORY, name + os.path.extsep + "py")
+    try:
+        if os.path.getmtime(prebuilt) >= ui_stat.st_mtime:
+            return prebuilt
+    except OSError:
+        pass
+
+    # Otherwise use the user cache. The key changes whenever the .ui file
+    # changes so no mtime comparison is necessary.
+    key = hashlib.md5(("%s-%i-%s" % (
+        ui_file, ui_stat.st_size,
+        repr(ui_stat.st_mtime))).encode("utf-8")).hexdigest()[:12]
+    cache_dir = os.path.join(get_cache_directory(), "ui")
+    py_ui_file = os.path.join(cache_dir, "%s_%s.py" % (name, key))
+    if not os.path.exists(py_ui_file):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        _compile_ui_file(ui_file, py_ui_file)
+    return py_ui_file
+
+
+def load_ui_module(name):
+    """
+    Returns the compiled ui module for the .ui file with the given name,
+    e.g. ``load_ui_module("asdf_sextant_window").Ui_MainWindow``.
+    """
+    if name in _UI_MODULES:
+        return _UI_MODULES[name]
+    py_ui_file = _get_py_ui_file(name)
+    # The generated modules import the custom widgets by their module name.
+    if UI_DIRECTORY not in sys.path:
+        sys.path.insert(0, UI_DIRECTORY)
+    _UI_MODULES[name] = imp.load_source(str(name), py_ui_file)
+    return _UI_MODULES[name]
+
+
+def compile_ui_files():
+    """
+    Prebuilds all .ui files in the application directory. Useful as an
+    installation step so no compilation ever happens at startup.
+    """
+    from glob import iglob
+    for ui_file in iglob(os.path.join(UI_DIRECTORY, "*.ui")):
+        py_ui_file = os.path.splitext(ui_file)[0] + os.path.extsep + "py"
+        _compile_ui_file(ui_file, py_ui_file)
+
+
+if __name__ == "__main__":
+    compile_ui_files()
@@ -0,0 +1,450 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Virtual data set spanning many ASDF files.
+
+Archives are often split into daily or monthly ASDF files. A virtual data
+set takes a directory or a glob pattern and builds one SQLite index of the
+waveforms, stations and events of all files. Only the index is needed to
+fill the station and event views and to find the waveforms of an interval,
+the files themselves are opened lazily and only a bounded number of them is
+kept open. Intervals crossing file boundaries are assembled from the
+waveforms of all files.
+
+The index is stored in the cache directory and only files that changed
+since the last time are indexed again.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from obspy.core import UTCDateTime
+from obspy.core.event import Catalog
+from sqlalchemy import (create_engine, Column, Float, Index, Integer,
+                        String)
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+
+from stream_assembler import WindowAssembler
+from ui_loader import get_cache_directory
+from waveform_index import intervals_from_rows, split_waveform_name
+from waveform_mmap import WaveformMapping, read_waveform
+
+__all__ = ["VirtualDataSet", "find_files", "open_virtual_dataset"]
+
+# Maximum number of simultaneously open files.
+MAX_OPEN_FILES = 8
+
+Base = declarative_base()
+
+
+class ArchiveFiles(Base):
+    __tablename__ = 'files'
+    filename = Column(String(1024), primary_key=True)
+    mtime = Column(Float, nullable=False)
+    size = Column(Integer, nullable=False)
+
+
+class ArchiveWaveforms(Base):
+    __tablename__ = 'waveforms'
+    filename = Column(String(1024), primary_key=True)
+    full_id = Column(String(250), primary_key=True)
+    station = Column(String(250), nullable=False)
+    station_id = Column(String(250), nullable=False)
+    tag = Column(String(250), nullable=False)
+    starttime = Column(Integer)
+    endtime = Column(Integer)
+    __table_args__ = (
+        Index("ix_waveforms_interval", "station_id", "tag", "starttime"),
+        Index("ix_waveforms_station", "station", "tag"))
+
+
+class ArchiveStations(Base):
+    __tablename__ = 'stations'
+    filename = Column(String(1024), primary_key=True)
+    station = Column(String(250), primary_key=True)
+    latitude = Column(Float)
+    longitude = Column(Float)
+
+
+class ArchiveEvents(Base):
+    __tablename__ = 'events'
+    filename = Column(String(1024), primary_key=True)
+    resource_id = Column(String(1024), primary_key=True)
+
+
+def find_files(path):
+    """
+    Returns the sorted ASDF files of a directory or glob pattern.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.h5")
+    return sorted(os.path.abspath(_i) for _i in glob.glob(path)
+                  if os.path.isfile(_i))
+
+
+def get_index_filename(path):
+    key = hashlib.md5(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_directory(), "archives", key + ".db")
+
+
+class VirtualDataSet(object):
+    """
+    Many ASDF files accessed as one data set through a common index.
+
+    :param path: Directory or glob pattern of the files.
+    :param index_filename: The SQLite index. Defaults to a file in the cache
+        directory.
+    """
+    def __init__(self, path, index_filename=None,
+                 max_open_files=MAX_OPEN_FILES):
+        self.path = path
+        self.filename = path
+        self.index_filename = index_filename or get_index_filename(path)
+        self.max_open_files = max_open_files
+
+        directory = os.path.dirname(self.index_filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # The index is queried from background threads as well.
+        self._engine = create_engine(
+            'sqlite:///' + self.index_filename,
+            connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self._engine)
+        self._session_factory = sessionmaker(bind=self._engine)
+
+        self.filenames = []
+        # The data set and the memory map of the most recently used files,
+        # both keep the file open.
+        self._open_files = OrderedDict()
+        self._events = None
+        self._lock = threading.Lock()
+
+    def _session(self):
+        return self._session_factory()
+
+    @property
+    def pretty_filesize(self):
+        size = sum(os.path.getsize(_i) for _i in self.filenames)
+        for x in ["bytes", "KB", "MB", "GB"]:
+            if size < 1024.0:
+                return "%3.1f %s in %i files" % (size, x, len(self.filenames))
+            size /= 1024.0
+        return "%3.1f %s in %i files" % (size, "TB", len(self.filenames))
+
+    def build_index(self, progress_callback=None):
+        """
+        Indexes all new or modified files and removes files that no longer
+        exist from the index.
+
+        :param progress_callback: Optional function called with the index of
+            the current and the total number of files to index.
+        """
+        self.filenames = find_files(self.path)
+        session = self._session()
+        try:
+            indexed = dict((_i.filename, (_i.mtime, _i.size))
+                           for _i in session.query(ArchiveFiles))
+            stale = set(indexed.keys())
+            todo = []
+            for filename in self.filenames:
+                stale.discard(filename)
+                stat = os.stat(filename)
+                if indexed.get(filename) != (stat.st_mtime, stat.st_size):
+                    todo.append((filename, stat))
+            for filename in list(stale) + [_i[0] for _i in todo]:
+                self._remove_file(session, filename)
+
+            for _i, (filename, stat) in enumerate(todo):
+                if progress_callback is not None:
+                    progress_callback(_i, len(todo))
+                self._index_file(session, filename)
+                session.add(ArchiveFiles(filename=filename,
+                                         mtime=stat.st_mtime,
+                                         size=stat.st_size))
+                # Commit per file so an interrupted indexing is resumed.
+                session.commit()
+            session.commit()
+        finally:
+            session.close()
+
+    def _remove_file(self, session, filename):
+        for table in (ArchiveFiles, ArchiveWaveforms, ArchiveStations,
+                      ArchiveEvents):
+            session.query(table).filter(
+                table.filename == filename).delete(synchronize_session=False)
+
+    def _index_file(self, session, filename):
+        import pyasdf
+
+        ds = pyasdf.ASDFDataSet(filename, mode="r")
+        waveforms = []
+        for station in ds._waveform_group.keys():
+            for name in ds._waveform_group[station].keys():
+                if name == "StationXML":
+                    continue
+                full_id, station_id, starttime, endtime, tag = \
+                    split_waveform_name(name)
+                waveforms.append({
+                    "filename": filename, "full_id": full_id,
+                    "station": station, "station_id": station_id,
+                    "tag": tag, "starttime": starttime, "endtime": endtime})
+        if waveforms:
+            session.execute(ArchiveWaveforms.__table__.insert(), waveforms)
+
+        stations = [{"filename": filename, "station": station,
+                     "latitude": coordinates["latitude"],
+                     "longitude": coordinates["longitude"]}
+                    for station, coordinates in
+                    ds.get_all_coordinates().items() if coordinates]
+        if stations:
+            session.execute(ArchiveStations.__table__.insert(), stations)
+
+        events = [{"filename": filename, "resource_id": event.resource_id.id}
+                  for event in ds.events]
+        if events:
+            session.execute(ArchiveEvents.__table__.insert(), events)
+        del ds
+
+    def _get_open_file(self, filename):
+        # Must be called with the lock held.
+        entry = self._open_files.pop(filename, None)
+        if entry is None:
+            entry = {}
+        self._open_files[filename] = entry
+        while len(self._open_files) > self.max_open_files:
+            self._open_files.popitem(last=False)
+        return entry
+
+    def get_handle(self, filename):
+        """
+        Returns the ASDFDataSet of a file. Only the most recently used files
+        are kept open, handles still in use elsewhere are closed once they
+        are no longer referenced.
+        """
+        import pyasdf
+
+        with self._lock:
+            entry = self._get_open_file(filename)
+            if "ds" not in entry:
+                entry["ds"] = pyasdf.ASDFDataSet(filename, mode="r")
+            return entry["ds"]
+
+    def close(self):
+        """
+        Closes all open files and the connections to the index.
+        """
+        with self._lock:
+            for entry in self._open_files.values():
+                if "ds" in entry:
+                    entry["ds"]._close()
+            self._open_files.clear()
+        self._engine.dispose()
+
+    def get_mapping(self, filename):
+        """
+        Returns the memory map of a file, evicted together with the handles
+        of the least recently used files.
+        """
+        with self._lock:
+            entry = self._get_open_file(filename)
+            if "mapping" not in entry:
+                entry["mapping"] = WaveformMapping(filename)
+            return entry["mapping"]
+
+    def list_stations(self):
+        session = self._session()
+        try:
+            return sorted(_i[0] for _i in session.query(
+                ArchiveWaveforms.station).distinct())
+        finally:
+            session.close()
+
+    def get_all_coordinates(self):
+        session = self._session()
+        try:
+            coordinates = {}
+            for _i in session.query(ArchiveStations):
+                coordinates.setdefault(_i.station, {
+                    "latitude": _i.latitude, "longitude": _i.longitude})
+            return coordinates
+        finally:
+            session.close()
+
+    def get_station_view_data(self):
+        """
+        Same as ``get_station_view_data()`` of the main window for a single
+        file.
+        """
+        session = self._session()
+        try:
+            tags = {}
+            for station, tag in session.query(
+                    ArchiveWaveforms.station, ArchiveWaveforms.tag).distinct():
+                tags.setdefault(station, []).append(tag)
+            with_stationxml = set(_i[0] for _i in session.query(
+                ArchiveStations.station).distinct())
+        finally:
+            session.close()
+        return [(station, station in with_stationxml, sorted(tags[station]))
+                for station in sorted(tags.keys())]
+
+    def get_waveform_tags(self, station):
+        for name, _, tags in self.get_station_view_data():
+            if name == station:
+                return tags
+        return []
+
+    def list_waveforms(self, station, tag):
+        """
+        Returns the names of all waveforms of a station with the given tag.
+        """
+        session = self._session()
+        try:
+            return [_i[0] for _i in session.query(
+                ArchiveWaveforms.full_id).filter(
+                    ArchiveWaveforms.station == station,
+                    ArchiveWaveforms.tag == tag).order_by(
+                        ArchiveWaveforms.starttime)]
+        finally:
+            session.close()
+
+    def get_stationxml(self, station):
+        session = self._session()
+        try:
+            row = session.query(ArchiveStations.filename).filter(
+                ArchiveStations.station == station).first()
+        finally:
+            session.close()
+        if row is None:
+            return None
+        return self.get_handle(row[0]).waveforms[station].StationXML
+
+    @property
+    def events(self):
+        """
+        The events of all files, read once on first access.
+        """
+        if self._events is None:
+            session = self._session()
+            try:
+                filenames = sorted(_i[0] for _i in session.query(
+                    ArchiveEvents.filename).distinct())
+            finally:
+                session.close()
+            catalog = Catalog()
+            resource_ids = set()
+            for filename in filenames:
+                for event in self.get_handle(filename).events:
+                    if event.resource_id.id in resource_ids:
+                        continue
+                    resource_ids.add(event.resource_id.id)
+                    catalog.append(event)
+            self._events = catalog
+        return self._events
+
+    def get_event_datasets(self, event):
+        """
+        Returns the data sets of all files containing an event.
+        """
+        session = self._session()
+        try:
+            filenames = sorted(_i[0] for _i in session.query(
+                ArchiveEvents.filename).filter(
+                    ArchiveEvents.resource_id == event.resource_id.id))
+        finally:
+            session.close()
+        return [self.get_handle(_i) for _i in filenames]
+
+    def find_waveforms(self, starttime, endtime, tag, station=None,
+                       station_id=None):
+        """
+        Returns the ``(filename, station, full_id)`` tuples of all waveforms
+        with the given tag overlapping the interval between the timestamps,
+        optionally restricted to a station or a ``NET.STA.LOC.CHA`` id.
+        """
+        session = self._session()
+        try:
+            query = session.query(
+                ArchiveWaveforms.filename, ArchiveWaveforms.station,
+                ArchiveWaveforms.full_id).filter(
+                    ArchiveWaveforms.tag == tag,
+                    ArchiveWaveforms.starttime <= endtime,
+                    ArchiveWaveforms.endtime >= int(starttime))
+            if station is not None:
+                query = query.filter(ArchiveWaveforms.station == station)
+            if station_id is not None:
+                query = query.filter(
+                    ArchiveWaveforms.station_id == station_id)
+            return [tuple(_i) for _i in query]
+        finally:
+            session.close()
+
+    def query_intervals(self, station):
+        """
+        Returns the start and end times of all waveforms of a station across
+        all files, see :func:`waveform_index.query_intervals`.
+        """
+        conn = self._engine.raw_connection()
+        try:
+            rows = conn.cursor().execute(
+                "SELECT station_id, tag, starttime, endtime FROM waveforms "
+                "WHERE station = ?",
+                (station,)).fetchall()
+        finally:
+            conn.close()
+        return intervals_from_rows(rows)
+
+    def read_waveform(self, station, full_id):
+        """
+        Reads a complete waveform as a Trace.
+        """
+        session = self._session()
+        try:
+            row = session.query(ArchiveWaveforms.filename).filter(
+                ArchiveWaveforms.station == station,
+                ArchiveWaveforms.full_id == full_id).first()
+        finally:
+            session.close()
+        if row is None:
+            raise KeyError(full_id)
+        return read_waveform(self.get_handle(row[0]), station, full_id,
+                             self.get_mapping(row[0]))
+
+    def assemble_window(self, waveforms, starttime, endtime):
+        """
+        Assembles a window from ``(filename, station, full_id)`` tuples of
+        any number of files.
+        """
+        assembler = WindowAssembler(starttime, endtime)
+        for filename, station, full_id in waveforms:
+            ds = self.get_handle(filename)
+            assembler.add_dataset(full_id, ds._waveform_group[station][full_id],
+                                  mapping=self.get_mapping(filename))
+        return assembler.get_stream()
+
+    def extract_interval(self, st_ids, st_tags, starttime, endtime):
+        """
+        Extracts an interval for the given channels and tags across all
+        files. Same as :func:`extraction.extract_interval` for single files.
+        """
+        waveforms = []
+        for st_id, tag in zip(st_ids, st_tags):
+            waveforms.extend(self.find_waveforms(starttime, endtime, tag,
+                                                 station_id=st_id))
+        return self.assemble_window(waveforms, UTCDateTime(starttime),
+                                    UTCDateTime(endtime))
+
+
+def open_virtual_dataset(path, progress_callback=None):
+    """
+    Creates a virtual data set and brings its index up to date.
+    """
+    vds = VirtualDataSet(path)
+    vds.build_index(progress_callback=progress_callback)
+    return vds
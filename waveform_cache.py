@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+In-memory cache of decoded waveform windows with a memory budget.
+
+Traces are keyed by ``(id, starttime, endtime)`` where id is the SEED id
+plus waveform tag (or the full ASDF waveform name) and the times are the
+requested window, or None for complete waveforms. The least recently used
+traces are evicted once the total size of the cached data exceeds the
+budget. Channels known to have no data in a window are cached as empty so
+they do not cause the window to be read again.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+from obspy.core import Stream
+
+__all__ = ["WaveformCache", "get_trace_key"]
+
+# Default budget in MB, can be overwritten with an environment variable.
+DEFAULT_MAX_MB = int(os.environ.get("ASDF_SEXTANT_WAVEFORM_CACHE_MB", 512))
+
+# Marks keys without data.
+_EMPTY = object()
+
+
+def get_trace_key(seed_id, tag, starttime=None, endtime=None):
+    """
+    Cache key of the trace of a channel and tag, optionally for a window
+    given as timestamps.
+    """
+    return ("%s__%s" % (seed_id, tag), starttime, endtime)
+
+
+def _get_size(tr):
+    # Memory mapped data lives in the page cache and is not counted.
+    if isinstance(tr.data, np.memmap):
+        return 0
+    size = tr.data.nbytes
+    if np.ma.isMaskedArray(tr.data):
+        size += np.ma.getmaskarray(tr.data).nbytes
+    return size
+
+
+class WaveformCache(object):
+    """
+    LRU cache of traces limited by the number of bytes of their data.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self._traces = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._traces)
+
+    def __contains__(self, key):
+        return key in self._traces
+
+    def clear(self):
+        self._traces.clear()
+        self.bytes = 0
+
+    def _get(self, key):
+        try:
+            tr, size = self._traces.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._traces[key] = (tr, size)
+        self.hits += 1
+        return tr
+
+    def get(self, key):
+        """
+        Returns the cached trace or None.
+        """
+        tr = self._get(key)
+        return None if tr is _EMPTY else tr
+
+    def get_stream(self, keys):
+        """
+        Returns a Stream with the traces of all keys or None if any of them
+        is not cached. Keys cached as empty are left out.
+        """
+        traces = []
+        for key in keys:
+            tr = self._get(key)
+            if tr is None:
+                return None
+            if tr is not _EMPTY:
+                traces.append(tr)
+        return Stream(traces=traces)
+
+    def put_empty(self, key):
+        """
+        Marks a key as having no data.
+        """
+        if key in self._traces:
+            self.bytes -= self._traces.pop(key)[1]
+        self._traces[key] = (_EMPTY, 0)
+
+    def put(self, key, tr):
+        """
+        Adds a trace. Traces larger than the budget are not cached.
+        """
+        if key in self._traces:
+            self.bytes -= self._traces.pop(key)[1]
+        size = _get_size(tr)
+        if size > self.max_bytes:
+            return
+        self._traces[key] = (tr, size)
+        self.bytes += size
+        self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._traces:
+            _, (_, size) = self._traces.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self._traces), "bytes": self.bytes,
+                "max_bytes": self.max_bytes, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
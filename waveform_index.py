@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SQLite index of the waveforms of a station in an ASDF file.
+
+One database is created per station next to the ASDF file. It holds the
+start and end times of every waveform so time intervals can be extracted from
+continuous data without iterating over all waveforms of a station.
+
+This module is imported lazily as SQLAlchemy is slow to import and only
+needed once a station is selected.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+from obspy.core import UTCDateTime
+
+from sqlalchemy import create_engine, text, Column, Integer, String
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+# Class for SQLite database for wavefoms belonging to station
+class Waveforms(Base):
+    __tablename__ = 'waveforms'
+    # Here we define columns for the SQL table
+    starttime = Column(Integer)
+    endtime = Column(Integer)
+    station_id = Column(String(250), nullable=False)
+    tag = Column(String(250), nullable=False)
+    full_id = Column(String(250), nullable=False, primary_key=True)
+
+
+def get_index_filename(asdf_filename, station):
+    """
+    Returns the filename of the SQLite index for the given station
+    (``NET.STA``) of an ASDF file. Named by network and station code so
+    stations of different networks never share an index. Indices named by
+    the station code only, as created by earlier versions, are renamed.
+    """
+    directory = os.path.dirname(asdf_filename)
+    filename = os.path.join(directory, str(station) + '.db')
+    if not os.path.exists(filename):
+        old_filename = os.path.join(directory,
+                                    str(station.split('.')[1]) + '.db')
+        if _is_index_of(old_filename, station):
+            try:
+                os.rename(old_filename, filename)
+            except OSError:
+                # E.g. a read-only directory, the old index is still valid.
+                return old_filename
+    return filename
+
+
+def _is_index_of(sql_filename, station):
+    """
+    True if the file is an index containing waveforms of the station.
+    """
+    if not os.path.exists(sql_filename):
+        return False
+    import sqlite3
+
+    try:
+        conn = sqlite3.connect(sql_filename)
+        try:
+            return conn.execute(
+                "SELECT 1 FROM waveforms WHERE station_id LIKE ? LIMIT 1",
+                (str(station) + '.%',)).fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def get_session(sql_filename):
+    """
+    Returns a new session bound to the SQLite file.
+    """
+    engine = create_engine('sqlite:///' + sql_filename)
+    Session = sessionmaker()
+    Session.configure(bind=engine)
+    return Session()
+
+
+def split_waveform_name(ws):
+    """
+    Separates an ASDF waveform name into its fields.
+
+    Returns: (full_id, station_id, starttime, endtime, waveform_tag)
+    """
+    a = ws.split('__')
+    starttime = int(UTCDateTime(str(a[1])).timestamp)
+    endtime = int(UTCDateTime(str(a[2])).timestamp)
+    return (str(ws), str(a[0]), starttime, endtime, str(a[3]))
+
+
+def build_index(ds, sta, sql_filename, progress_callback=None):
+    """
+    Creates the SQLite index for a station if it does not yet exist.
+
+    :param ds: The ASDFDataSet.
+    :param sta: The station, e.g. ``"AU.ARMA"``.
+    :param sql_filename: The SQLite file to create.
+    :param progress_callback: Optional function called with the index of
+        the current and the total number of waveforms. Returning ``False``
+        cancels the operation.
+    """
+    if os.path.exists(sql_filename):
+        return
+
+    # Initialize (open/create) the sqlalchemy sqlite engine
+    engine = create_engine('sqlite:///' + sql_filename)
+    Session = sessionmaker()
+
+    # Get list of all waveforms for station
+    waveforms_list = ds.waveforms[str(sta)].list()
+    # remove the station XML file
+    if 'StationXML' in waveforms_list:
+        waveforms_list.remove('StationXML')
+
+    # Create all tables in the engine
+    Base.metadata.create_all(engine)
+
+    # Initiate a session with the SQL database so that we can add data to it
+    Session.configure(bind=engine)
+    session = Session()
+
+    for _i, sta_wave in enumerate(waveforms_list):
+        if progress_callback is not None and \
+                progress_callback(_i, len(waveforms_list)) is False:
+            # Never leave an incomplete index behind.
+            session.close()
+            os.remove(sql_filename)
+            return
+
+        # The ASDF formatted waveform name for SQL
+        # [full_id, station_id, starttime, endtime, tag]
+        waveform_info = split_waveform_name(sta_wave)
+
+        # create new SQL entry
+        session.add(Waveforms(full_id=waveform_info[0],
+                              station_id=waveform_info[1],
+                              starttime=waveform_info[2],
+                              endtime=waveform_info[3],
+                              tag=waveform_info[4]))
+    session.commit()
+
+
+def interval_query(starttime, endtime, tag, station_id=None):
+    """
+    Returns the query statement selecting all waveforms with the given tag
+    overlapping the interval between the two timestamps, optionally
+    restricted to a single ``NET.STA.LOC.CHA`` id.
+    """
+    if station_id is None:
+        query_stmt = text(
+            "Waveforms.tag == :tag AND ("
+            "(Waveforms.starttime >= :start AND :end >= Waveforms.endtime) OR"
+            "(Waveforms.starttime <= :end AND :end <= Waveforms.endtime) OR"
+            "(Waveforms.starttime <= :start AND :start <= Waveforms.endtime))")
+        return query_stmt.bindparams(start=starttime, end=endtime, tag=tag)
+
+    query_stmt = text(
+        "Waveforms.tag == :tag AND "
+        "Waveforms.station_id == :stid AND ("
+        "(Waveforms.starttime >= :start AND :end >= Waveforms.endtime) OR"
+        "(Waveforms.starttime <= :end AND :end <= Waveforms.endtime) OR"
+        "(Waveforms.starttime <= :start AND :start <= Waveforms.endtime))")
+    return query_stmt.bindparams(stid=station_id, start=starttime,
+                                 end=endtime, tag=tag)
+
+
+def query_full_ids(sql_filename, query):
+    """
+    Returns the full ids of all waveforms matching the query.
+    """
+    session = get_session(sql_filename)
+    try:
+        return [_i.full_id for _i in session.query(Waveforms).filter(query)]
+    finally:
+        session.close()
+
+
+
+def intervals_from_rows(rows):
+    """
+    Converts ``(station_id, tag, starttime, endtime)`` rows to the arrays
+    used for computing the data availability.
+
+    Returns: (channels, groups, starttimes, endtimes) with ``channels`` the
+    list of ``(station_id, tag)`` tuples and ``groups`` the index into it of
+    every row.
+    """
+    import numpy as np
+
+    codes = {}
+    groups = np.fromiter((codes.setdefault(tuple(_i[:2]), len(codes))
+                          for _i in rows), dtype=np.int64, count=len(rows))
+    times = np.array([_i[2:] for _i in rows],
+                     dtype=np.float64).reshape(len(rows), 2)
+    channels = sorted(codes, key=codes.get)
+    return channels, groups, times[:, 0], times[:, 1]
+
+
+def query_intervals(sql_filename):
+    """
+    Returns the start and end times of all waveforms of the index as
+    returned by :func:`intervals_from_rows`.
+    """
+    import sqlite3
+
+    # Plain sqlite3 as going through the ORM is far too slow for the
+    # potentially millions of rows.
+    conn = sqlite3.connect(sql_filename)
+    try:
+        rows = conn.execute(
+            "SELECT station_id, tag, starttime, endtime "
+            "FROM waveforms").fetchall()
+    finally:
+        conn.close()
+    return intervals_from_rows(rows)
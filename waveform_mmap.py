@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Zero-copy access to uncompressed waveform data sets.
+
+Waveforms stored contiguously and without any filters (e.g. compression) are
+plain arrays at a fixed offset in the HDF5 file. These are exposed as views
+into a read-only memory map of the file, so reading them does not allocate
+new arrays and the data is served from the page cache. All other data sets
+are read with h5py.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+import numpy as np
+from obspy.core import AttribDict, Trace, UTCDateTime
+from obspy.core.event import ResourceIdentifier
+
+from stream_assembler import parse_full_id
+
+__all__ = ["WaveformMapping", "get_asdf_stats", "read_waveform"]
+
+# HDF5 file drivers storing the file as is on disc.
+MAPPABLE_DRIVERS = ("sec2", "stdio")
+# Data set attributes with comma separated resource ids, stored in the stats
+# with a plural name like pyasdf does.
+ID_ATTRIBUTES = ("event_id", "origin_id", "magnitude_id",
+                 "focal_mechanism_id")
+
+
+class WaveformMapping(object):
+    """
+    Read-only memory map of an ASDF file. The file is only mapped once the
+    first data set is requested.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._mmap = None
+        self._lock = threading.Lock()
+
+    def _get_mmap(self):
+        with self._lock:
+            if self._mmap is None:
+                self._mmap = np.memmap(self.filename, dtype=np.uint8,
+                                       mode="r")
+            return self._mmap
+
+    def get_array(self, dset):
+        """
+        Returns the data set as a memory mapped array or None if it is not
+        stored contiguously and unfiltered.
+        """
+        if dset.chunks is not None or dset.dtype.hasobject or \
+                dset.file.driver not in MAPPABLE_DRIVERS:
+            return None
+        if dset.id.get_create_plist().get_nfilters():
+            return None
+        # None for data sets without allocated storage.
+        offset = dset.id.get_offset()
+        if offset is None:
+            return None
+        nbytes = dset.size * dset.dtype.itemsize
+        try:
+            mm = self._get_mmap()
+        except (IOError, OSError, ValueError):
+            return None
+        if offset + nbytes > len(mm):
+            return None
+        return mm[offset:offset + nbytes].view(dset.dtype).reshape(
+            dset.shape)
+
+    def get_data(self, dset):
+        """
+        Returns the memory mapped array if possible, otherwise the data set
+        itself. Both can be sliced the same way.
+        """
+        data = self.get_array(dset)
+        return dset if data is None else data
+
+
+def _attribute_to_str(value):
+    # Strings are stored as byte arrays by pyasdf.
+    if isinstance(value, np.ndarray):
+        value = value.tobytes()
+    if isinstance(value, bytes):
+        value = value.decode()
+    return value
+
+
+def get_asdf_stats(ds, attrs, tag):
+    """
+    Returns the ``stats.asdf`` dictionary pyasdf sets for a waveform with
+    the given data set attributes.
+    """
+    details = AttribDict()
+    details.format_version = ds.asdf_format_version
+    for name in ID_ATTRIBUTES:
+        if name in attrs:
+            details[name + "s"] = [
+                ResourceIdentifier(_i)
+                for _i in _attribute_to_str(attrs[name]).split(",")]
+    if "provenance_id" in attrs:
+        details.provenance_id = _attribute_to_str(attrs["provenance_id"])
+    if "labels" in attrs:
+        details.labels = [
+            _i.strip() for _i in _attribute_to_str(attrs["labels"]).split(",")]
+    details.tag = tag
+    return details
+
+
+def read_waveform(ds, station, full_id, mapping=None):
+    """
+    Reads a complete waveform of an ASDF data set as a Trace.
+
+    If the data set can be memory mapped the data of the trace is a view into
+    the mapping, otherwise it is read by pyasdf.
+
+    :param station: The station, e.g. ``"AU.ARMA"``.
+    :param full_id: The ASDF waveform name.
+    """
+    dset = ds._waveform_group[station][full_id]
+    data = mapping.get_array(dset) if mapping is not None else None
+    if data is None:
+        return ds.waveforms[station][full_id][0]
+
+    seed_id, tag = parse_full_id(full_id)
+    network, sta, location, channel = seed_id.split(".")
+    tr = Trace(data=data, header={
+        "network": network, "station": sta, "location": location,
+        "channel": channel,
+        "starttime": UTCDateTime(ns=int(dset.attrs["starttime"])),
+        "sampling_rate": float(dset.attrs["sampling_rate"])})
+    tr.stats._format = "ASDF"
+    tr.stats.asdf = get_asdf_stats(ds, dset.attrs, tag)
+    return tr
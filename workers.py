@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Running functions in the background without blocking the GUI.
+
+The results are passed back to the GUI thread with Qt signals so the
+callbacks can safely modify widgets.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import sys
+import time
+import traceback
+
+from PyQt4 import QtCore
+
+__all__ = ["Worker", "run_in_background"]
+
+# Workers that are currently running. Python has to hold a reference to them
+# until they are done.
+_RUNNING_WORKERS = set()
+
+
+class WorkerSignals(QtCore.QObject):
+    # Emits the result and the runtime of the function in seconds.
+    finished = QtCore.pyqtSignal(object, float)
+    # Emits the exception and the formatted traceback.
+    error = QtCore.pyqtSignal(object, str)
+
+
+class Worker(QtCore.QRunnable):
+    """
+    Runs a function in a thread of a QThreadPool.
+    """
+    def __init__(self, fct, *args, **kwargs):
+        QtCore.QRunnable.__init__(self)
+        self.fct = fct
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self):
+        a = time.time()
+        try:
+            result = self.fct(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.error.emit(
+                e, "".join(traceback.format_exception(*sys.exc_info())))
+        else:
+            self.signals.finished.emit(result, time.time() - a)
+
+
+def _print_error(exception, tb):
+    print(tb, file=sys.stderr)
+
+
+def run_in_background(fct, callback=None, error_callback=None, pool=None,
+                      priority=0, args=(), kwargs=None):
+    """
+    Runs ``fct(*args, **kwargs)`` in a background thread.
+
+    :param callback: Called in the GUI thread with the return value of the
+        function and its runtime in seconds.
+    :param error_callback: Called in the GUI thread with the exception and
+        its formatted traceback. Defaults to printing the traceback.
+    :param pool: The QThreadPool to use. Defaults to the global instance.
+    :param priority: Workers with a higher priority are started first.
+    """
+    worker = Worker(fct, *args, **(kwargs or {}))
+
+    # Release the worker in the GUI thread once it is done.
+    def _release(*args):
+        _RUNNING_WORKERS.discard(worker)
+
+    if callback is not None:
+        worker.signals.finished.connect(callback)
+    worker.signals.error.connect(error_callback or _print_error)
+    worker.signals.finished.connect(_release)
+    worker.signals.error.connect(_release)
+    _RUNNING_WORKERS.add(worker)
+    (pool or QtCore.QThreadPool.globalInstance()).start(worker, priority)
+    return worker